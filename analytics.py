@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import log
+import metrics
+from bus import INLINE
+from sinks.base import Sink
+
+# Fill sizes, in the base asset, for instruments config.analytics doesn't list
+DEFAULT_SIZES = (1, 10, 100)
+
+logger = log.get_logger('analytics')
+
+# One book's analytics. Prices are NaN when a side is empty; a size's VWAP and slippage are NaN when
+# the tracked depth can't fill it. Slippage is against the mid, in basis points, positive when it costs.
+BookAnalytics = namedtuple('BookAnalytics', 'best_bid best_ask mid spread spread_bps microprice '
+                                            'sizes buy_vwap buy_slippage_bps sell_vwap sell_slippage_bps')
+
+
+def fill_prices(prices, quantities, counts, sizes):
+    """VWAP of filling each size against each book's levels, as (books, sizes); NaN past the book's depth.
+
+    prices and quantities are (books, depth), best level first and zero-padded past counts; sizes is
+    (books, sizes). Each book's cumulative quantity and notional are computed once and shared by every size.
+    """
+    books, depth = prices.shape
+    cumulative_quantity = np.zeros((books, depth + 1))
+    cumulative_notional = np.zeros((books, depth + 1))
+    np.cumsum(quantities, axis=1, out=cumulative_quantity[:, 1:])
+    np.cumsum(prices * quantities, axis=1, out=cumulative_notional[:, 1:])
+
+    # Levels each size uses up completely; the size's last part is filled at the next level
+    full = (cumulative_quantity[:, None, 1:] < sizes[:, :, None]).sum(axis=2)
+    filled = np.take_along_axis(cumulative_quantity, full, axis=1)
+    notional = np.take_along_axis(cumulative_notional, full, axis=1)
+    last_price = np.take_along_axis(prices, np.minimum(full, depth - 1), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = (notional + (sizes - filled) * last_price) / sizes
+    vwap[full >= counts[:, None]] = np.nan
+    return vwap
+
+
+def compute(bid_prices, bid_quantities, bid_counts, ask_prices, ask_quantities, ask_counts, sizes):
+    """Every analytic for a batch of books at once; returns a dict of arrays, one row per book."""
+    best_bid = np.where(bid_counts > 0, bid_prices[:, 0], np.nan)
+    best_ask = np.where(ask_counts > 0, ask_prices[:, 0], np.nan)
+    bid_size = bid_quantities[:, 0]
+    ask_size = ask_quantities[:, 0]
+    mid = (best_bid + best_ask) / 2
+    spread = best_ask - best_bid
+    buy_vwap = fill_prices(ask_prices, ask_quantities, ask_counts, sizes)
+    sell_vwap = fill_prices(bid_prices, bid_quantities, bid_counts, sizes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'best_bid': best_bid,
+            'best_ask': best_ask,
+            'mid': mid,
+            'spread': spread,
+            'spread_bps': spread / mid * 1e4,
+            # Weighted towards the side with less size at the touch, where the price is more likely to go
+            'microprice': (best_bid * ask_size + best_ask * bid_size) / (bid_size + ask_size),
+            'buy_vwap': buy_vwap,
+            'buy_slippage_bps': (buy_vwap - mid[:, None]) / mid[:, None] * 1e4,
+            'sell_vwap': sell_vwap,
+            'sell_slippage_bps': (mid[:, None] - sell_vwap) / mid[:, None] * 1e4,
+        }
+
+
+class AnalyticsSink(Sink):
+    """Keeps the top `depth` levels of every book in fixed-size NumPy arrays, one row per book, and
+    recomputes analytics every `interval` seconds for the books that changed since the last tick.
+
+    Updates only copy levels into the book's row; the tick runs on its own thread and hands each
+    changed book's BookAnalytics to publish(key, analytics). Books holding levels restored from a
+    checkpoint are skipped until they resync, so analytics only ever describe live data.
+    """
+    delivery = INLINE
+
+    def __init__(self, publish, sizes=None, depth=50, interval=1.0):
+        self.publish = publish
+        self.sizes = sizes or {}  # Book ID -> fill sizes; DEFAULT_SIZES for books not listed
+        self.depth = depth
+        self.interval = interval
+        self.rows = {}  # Book ID -> row
+        self.keys = []  # Row -> book ID
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.allocate(0)
+
+    def allocate(self, books):
+        depth = self.depth
+        width = max((len(self.sizes.get(key, DEFAULT_SIZES)) for key in self.keys), default=1)
+        self.bid_prices = np.zeros((books, depth))
+        self.bid_quantities = np.zeros((books, depth))
+        self.ask_prices = np.zeros((books, depth))
+        self.ask_quantities = np.zeros((books, depth))
+        self.bid_counts = np.zeros(books, dtype=np.intp)
+        self.ask_counts = np.zeros(books, dtype=np.intp)
+        # Books with fewer sizes than the widest are padded with NaN sizes, which come out NaN
+        self.fill_sizes = np.full((books, width), np.nan)
+        for row, key in enumerate(self.keys):
+            sizes = self.sizes.get(key, DEFAULT_SIZES)
+            self.fill_sizes[row, :len(sizes)] = sizes
+
+    def register(self, key, name, exchange=None, aggregated=False):
+        if key in self.rows:
+            return
+        self.rows[key] = len(self.keys)
+        self.keys.append(key)
+        self.allocate(len(self.keys))  # Only at startup, before any data arrives
+
+    def update_book(self, key, book, exchange):
+        self.store(key, book, aggregated=False)
+
+    def update_aggregated_book(self, key, book):
+        self.store(key, book, aggregated=True)
+
+    def store(self, key, book, aggregated):
+        row = self.rows.get(key)
+        if row is None or book.provisional:
+            return
+        depth = self.depth
+        with self.lock:
+            for side, prices, quantities, counts in (
+                    (book.bids, self.bid_prices, self.bid_quantities, self.bid_counts),
+                    (book.asks, self.ask_prices, self.ask_quantities, self.ask_counts)):
+                # Read straight from the sorted levels: keys are signed ticks, turned into prices in one
+                # division; values are quantities, or AggregatedLevels in a consolidated book
+                levels = side.levels
+                count = min(len(levels), depth)
+                prices[row, :count] = levels.keys()[:count]
+                prices[row, :count] /= side.sign * book.scale
+                prices[row, count:] = 0.0
+                values = levels.values()[:count]
+                quantities[row, :count] = [level.quantity for level in values] if aggregated else values
+                quantities[row, count:] = 0.0
+                counts[row] = count
+            self.dirty.add(row)
+
+    def tick(self):
+        """Recompute and publish analytics for every book changed since the last tick."""
+        with self.lock:
+            if not self.dirty:
+                return
+            rows = np.fromiter(self.dirty, dtype=np.intp, count=len(self.dirty))
+            self.dirty.clear()
+            # Fancy indexing copies, so feed threads can carry on writing while this batch is computed
+            batch = (self.bid_prices[rows], self.bid_quantities[rows], self.bid_counts[rows],
+                     self.ask_prices[rows], self.ask_quantities[rows], self.ask_counts[rows], self.fill_sizes[rows])
+
+        started = time.perf_counter()
+        results = {name: values.tolist() for name, values in compute(*batch).items()}
+        metrics.ANALYTICS_SECONDS.labels().observe(time.perf_counter() - started)
+
+        for index, row in enumerate(rows.tolist()):
+            key = self.keys[row]
+            width = len(self.sizes.get(key, DEFAULT_SIZES))
+            analytics = BookAnalytics(
+                results['best_bid'][index], results['best_ask'][index], results['mid'][index],
+                results['spread'][index], results['spread_bps'][index], results['microprice'][index],
+                tuple(self.sizes.get(key, DEFAULT_SIZES)),
+                *(tuple(results[name][index][:width])
+                  for name in ('buy_vwap', 'buy_slippage_bps', 'sell_vwap', 'sell_slippage_bps')))
+            try:
+                self.publish(key, analytics)
+            except Exception as e:
+                logger.exception("Error publishing analytics for book %s: %s", key, e)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.tick()
+        self.tick()  # What changed since the last tick still goes out
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        else:
+            self.tick()
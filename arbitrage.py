@@ -0,0 +1,117 @@
+import time
+from collections import namedtuple
+
+import log
+import metrics
+from bus import INLINE
+from sinks.base import Sink
+
+OPENED = 'opened'
+CLOSED = 'closed'
+
+logger = log.get_logger('arbitrage')
+
+# An opportunity to buy at buy_venue's best ask and sell at sell_venue's best bid. net_bps is the edge
+# after both taker fees; peak_bps the best it reached, and duration how long it lasted (0 when opened).
+CrossAlert = namedtuple('CrossAlert', 'event instrument buy_venue sell_venue ask bid quantity net_bps peak_bps '
+                                      'duration time_ns')
+
+
+class Crossing:
+    __slots__ = ('opened', 'peak')
+
+    def __init__(self, opened, peak):
+        self.opened = opened
+        self.peak = peak
+
+
+def best_quotes(book):
+    """(bid, bid quantity, ask, ask quantity) of an OrderBook; prices are None for an empty side."""
+    bid = book.bids.best()
+    ask = book.asks.best()
+    return (book.to_price(bid[0]) if bid else None, bid[1] if bid else 0.0,
+            book.to_price(ask[0]) if ask else None, ask[1] if ask else 0.0)
+
+
+class CrossDetector(Sink):
+    """Alerts when one venue's best bid is above another venue's best ask by more than their fees.
+
+    Runs inline with every book update, ahead of the other sinks, and only looks at the venues of
+    the instrument that changed: their best quotes are held per instrument, indexed by venue, and
+    each buy/sell venue pair is checked. An alert goes to every on_alert callback when a crossing
+    opens, then once more when it closes. Layers restored from a checkpoint are left out until
+    their exchange resyncs, since their quotes may be minutes old.
+    """
+    delivery = INLINE
+
+    def __init__(self, registry, fees_bps=None, threshold_bps=0.0, on_alert=()):
+        self.registry = registry
+        self.fees = {venue: bps / 1e4 for venue, bps in (fees_bps or {}).items()}  # Taker fee per venue
+        self.threshold = threshold_bps / 1e4
+        self.on_alert = list(on_alert)
+        self.quotes = {}  # Instrument ID -> {venue: best_quotes()}, for per-exchange books
+        self.crossings = {}  # Instrument ID -> {(buy venue, sell venue): Crossing}
+
+    def update_book(self, key, book, exchange):
+        instrument = self.registry.books[key].instrument
+        quotes = self.quotes.setdefault(instrument.id, {})
+        if book.provisional:
+            quotes.pop(exchange, None)
+        else:
+            quotes[exchange] = best_quotes(book)
+        self.evaluate(instrument, quotes)
+
+    def update_aggregated_book(self, key, book):
+        self.evaluate(self.registry.books[key],
+                      {venue: best_quotes(layer) for venue, layer in book.venues.items() if not layer.provisional})
+
+    def evaluate(self, instrument, quotes):
+        crossings = self.crossings.get(instrument.id)
+        crossed = None
+        fees = self.fees
+        for buy_venue, (_, _, ask, ask_quantity) in quotes.items():
+            if ask is None:
+                continue
+            cost = ask * (1 + fees.get(buy_venue, 0.0))
+            for sell_venue, (bid, bid_quantity, _, _) in quotes.items():
+                if bid is None or sell_venue == buy_venue:
+                    continue
+                net = bid * (1 - fees.get(sell_venue, 0.0)) / cost - 1
+                if net <= self.threshold:
+                    continue
+                pair = (buy_venue, sell_venue)
+                if crossed is None:
+                    crossed = set()
+                crossed.add(pair)
+                if crossings is None:
+                    crossings = self.crossings[instrument.id] = {}
+                crossing = crossings.get(pair)
+                if crossing is None:
+                    crossings[pair] = Crossing(time.perf_counter(), net)
+                    since = metrics.since_received()
+                    if since is not None:
+                        metrics.CROSS_DETECTION.labels(instrument.name).observe(since)
+                    self.alert(CrossAlert(OPENED, instrument.name, buy_venue, sell_venue, ask, bid,
+                                          min(ask_quantity, bid_quantity), net * 1e4, net * 1e4, 0.0, time.time_ns()))
+                elif net > crossing.peak:
+                    crossing.peak = net
+
+        if not crossings:
+            return
+        for pair in [pair for pair in crossings if crossed is None or pair not in crossed]:
+            crossing = crossings.pop(pair)
+            buy_venue, sell_venue = pair
+            _, _, ask, _ = quotes.get(buy_venue, (None, 0.0, None, 0.0))
+            bid, _, _, _ = quotes.get(sell_venue, (None, 0.0, None, 0.0))
+            net = (bid * (1 - fees.get(sell_venue, 0.0)) / (ask * (1 + fees.get(buy_venue, 0.0))) - 1
+                   if ask is not None and bid is not None else float('nan'))
+            self.alert(CrossAlert(CLOSED, instrument.name, buy_venue, sell_venue, ask, bid, 0.0, net * 1e4,
+                                  crossing.peak * 1e4, time.perf_counter() - crossing.opened, time.time_ns()))
+
+    def alert(self, alert):
+        metrics.CROSS_ALERTS.labels(alert.instrument, alert.event).inc()
+        for callback in self.on_alert:
+            try:
+                callback(alert)
+            except Exception as e:
+                logger.exception("Error in cross alert callback: %s", e)
@@ -0,0 +1,109 @@
+import asyncio
+import signal
+
+import log
+from supervisor import Feed, PING, STALE
+
+logger = log.get_logger('runtime')
+
+
+class AsyncSocket:
+    """The ws object adapters are handed in asyncio mode.
+
+    Adapters send synchronously, and OKX subscribes from a helper thread, so send() only hands
+    the frame to the loop; the connection's writer task does the actual send.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.outgoing = asyncio.Queue()
+
+    def send(self, message):
+        self.loop.call_soon_threadsafe(self.outgoing.put_nowait, message)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.outgoing.put_nowait, None)
+
+
+async def pump(connection, socket):
+    while True:
+        message = await socket.outgoing.get()
+        if message is None:
+            await connection.close()
+            return
+        await connection.send(message)
+
+
+async def watch(feed, adapter, socket, connection, check_interval):
+    """Close a connection once its feed goes stale, pinging it first if it has gone quiet."""
+    while True:
+        await asyncio.sleep(check_interval)
+        state = feed.check()
+        if state == STALE:
+            logger.warning("No frames from %s for %ss.", feed.exchange, feed.stale_after)
+            await connection.close()
+            return
+        if state == PING and hasattr(adapter, 'ping'):
+            adapter.ping(socket)
+
+
+async def run_adapter(name, adapter, url, settings, on_down=None):
+    """Drive one adapter's on_open/on_message/on_error/on_close from a websockets connection.
+
+    Every message is handled on the loop thread, so the adapter's books, the consolidated
+    books and the sinks only ever see one writer. A connection that ends or goes stale is
+    reported to on_down(name) and reopened after a jittered exponential backoff.
+    """
+    import websockets  # Only needed in asyncio mode
+
+    loop = asyncio.get_running_loop()
+    feed = Feed(name, settings, on_down)
+    while True:
+        socket = AsyncSocket(loop)
+        reason = 'closed'
+        try:
+            feed.connected()
+            async with websockets.connect(url, max_size=None) as connection:
+                writer = asyncio.create_task(pump(connection, socket))
+                watchdog = asyncio.create_task(watch(feed, adapter, socket, connection, settings['check_interval']))
+                try:
+                    adapter.on_open(socket)
+                    async for message in connection:
+                        adapter.on_message(socket, message)
+                finally:
+                    writer.cancel()
+                    if watchdog.done() and not watchdog.cancelled() and watchdog.exception() is None:
+                        reason = 'stale'
+                    watchdog.cancel()
+        except asyncio.CancelledError:
+            adapter.on_close(socket)
+            raise
+        except Exception as e:
+            adapter.on_error(socket, e)
+        adapter.on_close(socket)
+        await asyncio.sleep(feed.down(reason))
+
+
+async def run(connections, settings, on_down=None):
+    """Run every {name: (adapter, url)} connection on this loop until SIGINT or SIGTERM.
+
+    settings are config.connections; on_down(name) is called each time a connection is lost.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt out of asyncio.run
+
+    tasks = [asyncio.create_task(run_adapter(name, adapter, url, settings, on_down), name=name)
+             for name, (adapter, url) in connections.items()]
+    for name in connections:
+        logger.info("Connecting to %s.", name)
+
+    await stop.wait()
+    logger.info("Terminating WebSocket connections...")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
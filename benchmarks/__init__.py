@@ -0,0 +1 @@
+#Empty file required by Python to recognize the directory
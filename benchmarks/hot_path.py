@@ -0,0 +1,276 @@
+# Per-stage benchmark of the message hot path, from raw frame to queued sheet grid, on synthetic payloads.
+# Run with: python -m benchmarks.hot_path [--messages 5000] [--output results.json] [--compare baseline.json]
+#
+# Each stage reports messages/sec, p50/p99 latency per message, and bytes allocated per message
+# (peak transient and retained, from tracemalloc). main's sinks are built as for --dry-run, so the
+# Sheets sink writes into a NullSpreadsheet and nothing leaves the machine. Results are written as JSON; --compare prints the
+# change against an earlier results file and exits non-zero when a stage regressed past --threshold.
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import decoders
+from benchmarks.payloads import binance_depth_updates, kraken_book_frames, okx_book_frames
+from order_book import ConsolidatedBook
+from recorder import ReplaySocket
+
+
+def ignore(*args):
+    pass
+
+
+def measure(func, inputs):
+    """Time func over inputs one call at a time; returns per-message latencies in nanoseconds."""
+    latencies = []
+    clock = time.perf_counter_ns
+    for item in inputs:
+        start = clock()
+        func(item)
+        latencies.append(clock() - start)
+    return latencies
+
+
+def measure_allocations(func, inputs):
+    """Bytes allocated per message: peak above the starting point while handling it, and what it kept."""
+    peak_total = 0
+    retained_total = 0
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func(item)
+            current, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            retained_total += current - before
+    finally:
+        tracemalloc.stop()
+    return peak_total / len(inputs), retained_total / len(inputs)
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_stage(setup):
+    """setup() returns (func, inputs) over fresh state; it is called once for timing and once for allocations."""
+    func, inputs = setup()
+    start = time.perf_counter()
+    latencies = measure(func, inputs)
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+
+    func, inputs = setup()
+    alloc_peak, alloc_retained = measure_allocations(func, inputs)
+    return {
+        'messages': len(inputs),
+        'messages_per_sec': len(inputs) / elapsed,
+        'p50_us': percentile(ordered, 0.50) / 1e3,
+        'p99_us': percentile(ordered, 0.99) / 1e3,
+        'alloc_peak_bytes_per_msg': alloc_peak,
+        'alloc_retained_bytes_per_msg': alloc_retained,
+    }
+
+
+def build_stages(main, args):
+    """Every stage of the hot path, keyed by name, each as a setup function."""
+    from exchanges.binance import BinanceWebSocket
+    from exchanges.kraken import KrakenWebSocket
+    from exchanges.okx import OKXWebSocket
+    from analytics import AnalyticsSink
+    from sinks.google_sheets import GoogleSheetsSink, NullSpreadsheet, TokenBucket
+
+    listing = main.registry.listing('binance', 'btcusdt')
+    instrument = listing.instrument
+    # Lay out every configured instrument in main's sinks, as startup would with every exchange enabled
+    for sink in main.sinks:
+        for configured in main.registry.listings():
+            sink.register(configured.instrument.id, configured.instrument.name, aggregated=True)
+
+    snapshot, binance_frames = binance_depth_updates(args.messages, args.binance_depth, args.churn)
+    okx_frames = okx_book_frames(args.messages, args.okx_depth, args.churn)
+    kraken_frames = kraken_book_frames(args.messages, args.kraken_depth, max(1, args.churn // 3))
+    socket = ReplaySocket()  # Keeps anything an adapter sends, e.g. a resubscribe after a checksum mismatch
+
+    def binance_adapter(callback=ignore):
+        return BinanceWebSocket(['btcusdt'], callback, ignore, ignore, ignore,
+                                fetch_snapshot=lambda symbol: snapshot, threaded_snapshot=False)
+
+    def okx_adapter(callback=ignore):
+        return OKXWebSocket(['BTC-USDT'], callback, ignore, ignore, ignore)
+
+    def kraken_adapter(callback=ignore):
+        return KrakenWebSocket(['XBT/USDT'], callback, ignore, ignore, ignore, depth=args.kraken_depth)
+
+    def adapter_stage(make_adapter, frames):
+        def setup():
+            adapter = make_adapter()
+            return (lambda frame: adapter.on_message(socket, frame)), frames
+        return setup
+
+    def pipeline_stage(make_adapter, frames, handler):
+        # Adapter wired to main's handlers, through aggregation, the inline sinks and the bus's queues;
+        # queued sinks' delivery threads aren't started, so their cost stays off the measured thread as in production
+        def setup():
+            main.create_books()
+            adapter = make_adapter(handler)
+            return (lambda frame: adapter.on_message(socket, frame)), frames
+        return setup
+
+    def decode_stage(decode, frames):
+        return lambda: (decode, frames)
+
+    def aggregate_setup():
+        main.create_books()
+        diffs = [{'bids': event.b, 'asks': event.a} for event in map(decoders.decode_binance, binance_frames)]
+        main.aggregate_books(listing, {'bids': snapshot['bids'], 'asks': snapshot['asks']}, snapshot=True)
+        return (lambda book: main.aggregate_books(listing, book)), diffs
+
+    def populated_books():
+        # The consolidated book as the sink sees it after each Binance diff (one object, moving on)
+        book = ConsolidatedBook(instrument.tick_size)
+        book.replace_venue('binance', snapshot['bids'], snapshot['asks'])
+        for event in map(decoders.decode_binance, binance_frames):
+            book.apply_venue('binance', event.b, event.a)
+            yield book
+
+    def sheets_prepare_setup():
+        sink = GoogleSheetsSink(NullSpreadsheet(), depth=main.depth)
+        sink.register(instrument.id, instrument.name, aggregated=True)
+        # Grid preparation only reads the top levels, so the fully built book stands in for every message
+        for book in populated_books():
+            pass
+        return (lambda book: sink.update_aggregated_book(instrument.id, book)), [book] * len(binance_frames)
+
+    def analytics_store_setup():
+        # Copying a consolidated book's top levels into the analytics arrays, as each update does
+        sink = AnalyticsSink(ignore, depth=main.config.analytics['depth'])
+        sink.register(instrument.id, instrument.name, aggregated=True)
+        for book in populated_books():
+            pass
+        return (lambda book: sink.update_aggregated_book(instrument.id, book)), [book] * len(binance_frames)
+
+    def sheets_flush_setup():
+        # One prepared grid per message, each flushed on its own: shadow diff plus the discarded batch update
+        sink = GoogleSheetsSink(NullSpreadsheet(), depth=main.depth)
+        sink.register(instrument.id, instrument.name, aggregated=True)
+        sink.writer.bucket = TokenBucket(args.messages + 1, 0)
+        block = sink.layout.get(instrument.id)
+        grids = []
+        for book in populated_books():
+            sink.update_aggregated_book(instrument.id, book)
+            grids.append(sink.writer.pending.pop(block.data_range))
+        sink.writer.pending.clear()
+
+        def flush(grid):
+            sink.writer.submit(block.data_range, grid)
+            sink.writer.flush()
+        return flush, grids
+
+    return {
+        'decode/binance': decode_stage(decoders.decode_binance, binance_frames),
+        'decode/okx': decode_stage(decoders.decode_okx, okx_frames),
+        'decode/kraken': decode_stage(decoders.loads, kraken_frames),
+        'adapter/binance': adapter_stage(binance_adapter, binance_frames),
+        'adapter/okx': adapter_stage(okx_adapter, okx_frames),
+        'adapter/kraken': adapter_stage(kraken_adapter, kraken_frames),
+        'aggregate_books': aggregate_setup,
+        'analytics/store': analytics_store_setup,
+        'sheets/prepare': sheets_prepare_setup,
+        'sheets/flush': sheets_flush_setup,
+        'pipeline/binance': pipeline_stage(binance_adapter, binance_frames,
+                                           lambda ws, message: main.on_message(ws, message, 'binance')),
+        'pipeline/okx': pipeline_stage(okx_adapter, okx_frames,
+                                       lambda ws, message: main.on_message(ws, message, 'okx')),
+        'pipeline/kraken': pipeline_stage(kraken_adapter, kraken_frames, main.on_message_kraken),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print each stage's change against a baseline run; returns the stages that regressed past threshold."""
+    regressions = []
+    print(f"\n{'stage':<20} {'msgs/s':>10} {'p99':>10}")
+    for name, stage in results['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+        throughput = stage['messages_per_sec'] / before['messages_per_sec'] - 1
+        p99 = stage['p99_us'] / before['p99_us'] - 1 if before['p99_us'] else 0.0
+        print(f"{name:<20} {throughput:>+9.1%} {p99:>+9.1%}")
+        if throughput < -threshold or p99 > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path per-stage benchmark")
+    parser.add_argument('--messages', type=int, default=5000, help="Messages per stage")
+    parser.add_argument('--churn', type=int, default=10, help="Levels changed per side in each update")
+    parser.add_argument('--binance-depth', type=int, default=1000, help="Levels in the Binance REST snapshot")
+    parser.add_argument('--okx-depth', type=int, default=400, help="Levels in the OKX books snapshot")
+    parser.add_argument('--kraken-depth', type=int, default=10, help="Kraken book subscription depth")
+    parser.add_argument('--stages', nargs='*', help="Only run stages whose name starts with one of these")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/hot_path-<time>.json)")
+    parser.add_argument('--compare', metavar='BASELINE', help="Earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Fractional throughput drop or p99 rise that counts as a regression")
+    args = parser.parse_args()
+
+    import main as hot_path
+    hot_path.sinks[:] = hot_path.build_sinks(dry_run=True)
+    hot_path.subscribe_sinks()
+    stages = build_stages(hot_path, args)
+    if args.stages:
+        stages = {name: setup for name, setup in stages.items() if name.startswith(tuple(args.stages))}
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'decoder': decoders.BACKEND,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'stages': {},
+    }
+
+    print(f"{'stage':<20} {'msgs/s':>10} {'p50 us':>9} {'p99 us':>9} {'peak B/msg':>11} {'kept B/msg':>11}")
+    for name, setup in stages.items():
+        # Logging is left unconfigured, as at INFO: hot path debug calls cost only their level check
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            stage = run_stage(setup)
+        results['stages'][name] = stage
+        print(f"{name:<20} {stage['messages_per_sec']:>10.0f} {stage['p50_us']:>9.1f} {stage['p99_us']:>9.1f} "
+              f"{stage['alloc_peak_bytes_per_msg']:>11.0f} {stage['alloc_retained_bytes_per_msg']:>11.0f}")
+
+    output_path = args.output or os.path.join('benchmarks', 'results',
+                                              time.strftime('hot_path-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressed past {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
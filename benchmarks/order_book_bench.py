@@ -0,0 +1,102 @@
+# Compares the per-update cost of the sorted OrderBook against the dict/list code it replaced.
+# Run with: python -m benchmarks.order_book_bench [--messages 20000] [--levels 20] [--depth 5]
+import argparse
+import random
+import time
+
+from order_book import ConsolidatedBook, OrderBook
+
+
+def generate_diffs(count, levels_per_message, seed=42):
+    """Generate Binance-style depth diffs as ([[price, qty], ...], [[price, qty], ...]) string pairs."""
+    rng = random.Random(seed)
+    mid = 50000.0
+    diffs = []
+    for _ in range(count):
+        mid += rng.uniform(-0.5, 0.5)
+        bids = []
+        asks = []
+        for _ in range(levels_per_message):
+            quantity = 0.0 if rng.random() < 0.3 else rng.uniform(0.001, 5.0)
+            bids.append([f"{mid - rng.randint(1, 400) * 0.01:.2f}", f"{quantity:.8f}"])
+            quantity = 0.0 if rng.random() < 0.3 else rng.uniform(0.001, 5.0)
+            asks.append([f"{mid + rng.randint(1, 400) * 0.01:.2f}", f"{quantity:.8f}"])
+        diffs.append((bids, asks))
+    return diffs
+
+
+def legacy_aggregate(aggregated, bids, asks, depth, exchange_code='Bi'):
+    """The string-keyed aggregation main.aggregate_books used to do."""
+    for side, entries in (('bids', bids), ('asks', asks)):
+        for entry in entries:
+            price = float(entry[0])
+            quantity = float(entry[1])
+            price_str = f"{price:.8f}"
+            if quantity > 0:
+                if price_str in aggregated[side]:
+                    aggregated[side][price_str]['quantity'] += quantity
+                    aggregated[side][price_str]['contributors'].add(exchange_code)
+                else:
+                    aggregated[side][price_str] = {'quantity': quantity, 'contributors': {exchange_code}}
+    aggregated['bids'] = dict(sorted(aggregated['bids'].items(), key=lambda x: -float(x[0]))[:depth])
+    aggregated['asks'] = dict(sorted(aggregated['asks'].items(), key=lambda x: float(x[0]))[:depth])
+
+
+def consolidated_aggregate(aggregated, bids, asks, depth, venue='binance'):
+    # The consolidated book applies diffs to the venue layer and is read top-N, never truncated
+    aggregated.apply_venue(venue, bids, asks)
+    aggregated.top_levels('bids', depth)
+    aggregated.top_levels('asks', depth)
+
+
+def legacy_kraken_update(book, bids, asks, depth):
+    """The list rebuild + full re-sort KrakenWebSocket.update_order_book used to do."""
+    for bid in bids:
+        price, volume = bid[:2]
+        book['bids'] = [b for b in book['bids'] if b[0] != price]
+        if float(volume) != 0:
+            book['bids'].append(bid)
+    book['bids'].sort(key=lambda x: float(x[0]), reverse=True)
+    for ask in asks:
+        price, volume = ask[:2]
+        book['asks'] = [a for a in book['asks'] if a[0] != price]
+        if float(volume) != 0:
+            book['asks'].append(ask)
+    book['asks'].sort(key=lambda x: float(x[0]))
+    return book['bids'][:10], book['asks'][:10]
+
+
+def sorted_kraken_update(book, bids, asks, depth):
+    book.apply(bids, asks)
+    return book.top_bids(10), book.top_asks(10)
+
+
+def time_per_update(func, book, diffs, depth):
+    start = time.perf_counter()
+    for bids, asks in diffs:
+        func(book, bids, asks, depth)
+    return (time.perf_counter() - start) / len(diffs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order book per-update benchmark")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--levels', type=int, default=20, help="Levels per side in each diff")
+    parser.add_argument('--depth', type=int, default=5, help="Depth read from the aggregated book")
+    args = parser.parse_args()
+
+    diffs = generate_diffs(args.messages, args.levels)
+    results = [
+        ("aggregate_books (legacy dict + sort)", time_per_update(legacy_aggregate, {'bids': {}, 'asks': {}}, diffs, args.depth)),
+        ("aggregate_books (ConsolidatedBook)", time_per_update(consolidated_aggregate, ConsolidatedBook(), diffs, args.depth)),
+        ("kraken update (legacy list + sort)", time_per_update(legacy_kraken_update, {'bids': [], 'asks': []}, diffs, args.depth)),
+        ("kraken update (OrderBook)", time_per_update(sorted_kraken_update, OrderBook(), diffs, args.depth)),
+    ]
+
+    print(f"{args.messages} messages, {args.levels} levels per side, aggregated depth {args.depth}")
+    for name, micros in results:
+        print(f"{name:<40} {micros:10.2f} us/update")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Synthetic exchange payloads for benchmarks: valid sequencing and checksums, configurable depth and churn.
+import json
+import random
+import time
+
+from decoders import decode_okx
+from exchanges.kraken import KrakenBook
+from exchanges.okx import OKXBook
+
+
+class PriceWalk:
+    """Random-walking mid price that hands out bid/ask levels on a fixed tick grid."""
+
+    def __init__(self, rng, mid=50000.0, tick=0.1):
+        self.rng = rng
+        self.tick = tick
+        self.mid_ticks = int(mid / tick)
+
+    def step(self):
+        self.mid_ticks += self.rng.randint(-2, 2)
+
+    def bid(self, depth):
+        return (self.mid_ticks - self.rng.randint(1, depth)) * self.tick
+
+    def ask(self, depth):
+        return (self.mid_ticks + self.rng.randint(1, depth)) * self.tick
+
+    def quantity(self, delete_probability):
+        return 0.0 if self.rng.random() < delete_probability else self.rng.uniform(0.001, 5.0)
+
+
+def binance_depth_updates(count, depth=20, churn=10, delete_probability=0.2, seed=1, symbol='BTCUSDT'):
+    """Return (REST snapshot, [depthUpdate frames]) with U/u chained the way Binance sends them.
+
+    The first diff straddles the snapshot's lastUpdateId, as it does when the snapshot is
+    fetched after the stream has started.
+    """
+    rng = random.Random(seed)
+    walk = PriceWalk(rng)
+    last_update_id = 997
+    snapshot = {
+        "lastUpdateId": 1000,
+        "bids": [[f"{walk.bid(depth):.2f}", f"{walk.quantity(0):.8f}"] for _ in range(depth)],
+        "asks": [[f"{walk.ask(depth):.2f}", f"{walk.quantity(0):.8f}"] for _ in range(depth)],
+    }
+
+    frames = []
+    event_time = int(time.time() * 1000)
+    for index in range(count):
+        walk.step()
+        first_id = last_update_id + 1
+        last_update_id = first_id + (3 if index == 0 else rng.randint(0, 5))
+        event_time += 100
+        frames.append(json.dumps({
+            "e": "depthUpdate", "E": event_time, "s": symbol, "U": first_id, "u": last_update_id,
+            "b": [[f"{walk.bid(depth):.2f}", f"{walk.quantity(delete_probability):.8f}"] for _ in range(churn)],
+            "a": [[f"{walk.ask(depth):.2f}", f"{walk.quantity(delete_probability):.8f}"] for _ in range(churn)],
+        }))
+    return snapshot, frames
+
+
+def okx_book_frames(count, depth=400, churn=10, delete_probability=0.2, seed=2, inst_id='BTC-USDT'):
+    """Return [books snapshot frame, update frames...] with seqId/prevSeqId and valid checksums."""
+    rng = random.Random(seed)
+    walk = PriceWalk(rng)
+    shadow = OKXBook(inst_id)
+    ts = int(time.time() * 1000)
+
+    def level(price, quantity):
+        return [f"{price:.1f}", f"{quantity:.4f}" if quantity else "0", "0", str(rng.randint(1, 9))]
+
+    def frame(action, data):
+        push = {"arg": {"channel": "books", "instId": inst_id}, "action": action, "data": [data]}
+        shadow.apply(action, decode_okx(json.dumps(push)).data[0])
+        data["checksum"] = shadow.checksum()
+        return json.dumps(push)
+
+    seq_id = 100
+    frames = [frame("snapshot", {
+        "bids": [level(walk.bid(depth), walk.quantity(0)) for _ in range(depth)],
+        "asks": [level(walk.ask(depth), walk.quantity(0)) for _ in range(depth)],
+        "ts": str(ts), "seqId": seq_id, "prevSeqId": -1,
+    })]
+    for _ in range(count):
+        walk.step()
+        ts += 100
+        prev_seq_id, seq_id = seq_id, seq_id + rng.randint(1, 5)
+        frames.append(frame("update", {
+            "bids": [level(walk.bid(depth), walk.quantity(delete_probability)) for _ in range(churn)],
+            "asks": [level(walk.ask(depth), walk.quantity(delete_probability)) for _ in range(churn)],
+            "ts": str(ts), "seqId": seq_id, "prevSeqId": prev_seq_id,
+        }))
+    return frames
+
+
+def kraken_book_frames(count, depth=10, churn=3, delete_probability=0.2, seed=3, pair='XBT/USDT'):
+    """Return [snapshot frame, update frames...] for a book-<depth> subscription with valid checksums."""
+    rng = random.Random(seed)
+    walk = PriceWalk(rng)
+    shadow = KrakenBook(depth)
+    channel = f"book-{depth}"
+    ts = time.time()
+
+    def level(price, quantity):
+        return [f"{price:.1f}", f"{quantity:.8f}", f"{ts:.6f}"]
+
+    bids = [level(walk.bid(depth * 2), walk.quantity(0)) for _ in range(depth)]
+    asks = [level(walk.ask(depth * 2), walk.quantity(0)) for _ in range(depth)]
+    shadow.apply_snapshot(bids, asks)
+    frames = [json.dumps([0, {"as": asks, "bs": bids}, channel, pair])]
+
+    for _ in range(count):
+        walk.step()
+        ts += 0.1
+        bids = [level(walk.bid(depth * 2), walk.quantity(delete_probability)) for _ in range(churn)]
+        asks = [level(walk.ask(depth * 2), walk.quantity(delete_probability)) for _ in range(churn)]
+        shadow.apply_update(bids, asks)
+        checksum = str(shadow.checksum())
+        frames.append(json.dumps([0, {"a": asks}, {"b": bids, "c": checksum}, channel, pair]))
+    return frames
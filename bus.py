@@ -0,0 +1,130 @@
+import threading
+from collections import deque, namedtuple
+
+import log
+import metrics
+
+# Delivery policies, chosen per subscriber
+INLINE = 'inline'  # Called on the publishing thread, for subscribers cheap enough to keep up with every event
+LATEST = 'latest'  # Latest state wins: one pending event per key, replaced by each newer one
+EVERY = 'every'  # Every event, in order, until the queue is full
+
+# Most events (or keys, under LATEST) a subscriber's queue holds before the oldest is dropped
+DEFAULT_QUEUE_SIZE = 1024
+
+logger = log.get_logger('bus')
+
+# A book that changed: exchange is None for a consolidated book. Read the book while holding lock,
+# which the feed threads hold while they apply updates to it. applied is the time.monotonic() the
+# update was applied at, so sinks can measure latency including the time spent queued here.
+BookEvent = namedtuple('BookEvent', 'key exchange book lock applied')
+
+
+class Subscription:
+    """One subscriber's bounded queue, drained by its own delivery thread.
+
+    Under LATEST the queue holds at most one event per key, so a subscriber that falls behind
+    skips straight to the newest state of each book, in the order the books first changed.
+    """
+
+    def __init__(self, name, handler, policy=LATEST, maxsize=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.maxsize = maxsize
+        self.pending = {} if policy == LATEST else deque()
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.thread = None
+        self.dropped = metrics.BUS_DROPPED.labels(name)
+        self.conflated = metrics.BUS_CONFLATED.labels(name)
+        self.depth = metrics.BUS_QUEUE_DEPTH.labels(name)
+
+    def offer(self, key, event):
+        """Hand over one event; only ever waits for the queue's lock, never for the subscriber."""
+        if self.policy == INLINE:
+            try:
+                self.handler(event)
+            except Exception as e:
+                logger.exception("Error delivering to %s: %s", self.name, e)
+            return
+        pending = self.pending
+        with self.condition:
+            if self.policy == LATEST:
+                if key in pending:
+                    self.conflated.inc()
+                elif len(pending) >= self.maxsize:
+                    del pending[next(iter(pending))]
+                    self.dropped.inc()
+                pending[key] = event
+            else:
+                if len(pending) >= self.maxsize:
+                    pending.popleft()
+                    self.dropped.inc()
+                pending.append(event)
+            self.depth.set(len(pending))
+            self.condition.notify()
+
+    def run(self):
+        pending = self.pending
+        latest = self.policy == LATEST
+        while True:
+            with self.condition:
+                while not pending and not self.stopping:
+                    self.condition.wait()
+                if not pending:
+                    return  # Stopping, with everything delivered
+                event = pending.pop(next(iter(pending))) if latest else pending.popleft()
+                self.depth.set(len(pending))
+            try:
+                self.handler(event)
+            except Exception as e:
+                logger.exception("Error delivering to %s: %s", self.name, e)
+
+    def start(self):
+        if self.policy != INLINE and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=f'bus-{self.name}', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Deliver what is still queued, then end the delivery thread."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+
+class Bus:
+    """In-process publish/subscribe between the feed handlers and everything consuming their output.
+
+    publish() hands an event to each of the topic's subscribers: INLINE ones are called right away,
+    the others only have it queued, so a slow subscriber never holds up the publishing thread.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}  # Topic -> [Subscription]
+
+    def subscribe(self, topic, name, handler, policy=LATEST, maxsize=DEFAULT_QUEUE_SIZE):
+        subscription = Subscription(name, handler, policy, maxsize)
+        self.subscriptions.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def publish(self, topic, key, event):
+        for subscription in self.subscriptions.get(topic, ()):
+            subscription.offer(key, event)
+
+    def start(self):
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                subscription.start()
+
+    def stop(self):
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                subscription.stop()
+
+    def clear(self):
+        self.stop()
+        self.subscriptions.clear()
@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+import log
+import metrics
+from order_book import BIDS, ASKS
+
+# Bumped whenever the saved layout changes; checkpoints of another version are ignored
+VERSION = 1
+
+logger = log.get_logger('checkpoint')
+
+
+def capture(book, lock, depth):
+    """A consolidated book's live venue layers, as {venue: {'bids': [[price, quantity], ...], 'asks': [...]}}.
+
+    Only the levels are copied under lock; turning them into prices happens once it is released.
+    Provisional layers are left out, so restored data is never saved again as if it were fresh.
+    """
+    with lock:
+        layers = [(venue, layer.bids.top(depth), layer.asks.top(depth))
+                  for venue, layer in book.venues.items() if not layer.provisional]
+    to_price = book.to_price
+    return {venue: {BIDS: [[to_price(ticks), quantity] for ticks, quantity in bids],
+                    ASKS: [[to_price(ticks), quantity] for ticks, quantity in asks]}
+            for venue, bids, asks in layers if bids or asks}
+
+
+def save(path, state):
+    """Write state to path as gzip-compressed JSON, atomically: a restart, even after a crash
+    mid-write, finds either the previous checkpoint or this one, never part of one."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+            f.write(json.dumps(dict(state, version=VERSION, time=time.time()), separators=(',', ':')).encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temporary, path)
+
+
+def load(path, max_age=None):
+    """The state saved at path; None when there is none, it can't be read, or it is older than max_age seconds."""
+    try:
+        with gzip.open(path, 'rb') as f:
+            state = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+        return None
+    if not isinstance(state, dict) or state.get('version') != VERSION:
+        logger.warning("Ignoring checkpoint %s from another version.", path)
+        return None
+    age = time.time() - state['time']
+    if max_age is not None and age > max_age:
+        logger.info("Checkpoint %s is %.0fs old, past max_age; starting with empty books.", path, age)
+        return None
+    return state
+
+
+class Checkpointer:
+    """Saves capture() to path every interval seconds from its own thread, and once more on stop()."""
+
+    def __init__(self, path, capture, interval=5.0):
+        self.path = path
+        self.capture = capture
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def write(self):
+        started = time.perf_counter()
+        try:
+            save(self.path, self.capture())
+        except Exception as e:
+            logger.exception("Could not write checkpoint %s: %s", self.path, e)
+            return
+        metrics.CHECKPOINT_SECONDS.labels().observe(time.perf_counter() - started)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='checkpoint', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.write()
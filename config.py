@@ -2,6 +2,115 @@ JSON_KEYFILE_NAME = "credentials.json"
 
 aggregation_enabled = True  # Set to True for aggregating order books across exchanges
 
+# Google Sheets output; the spreadsheet is opened in the background once the sink starts
+sheets = {
+    'credentials': 'ServiceAccountCredentials.json',  # Service account key file
+    'spreadsheet_key': '1rzcGKK4dMGWhthJQWn7wSSLpaVehNs5zV1GmSZ1yVZU',
+    'worksheet': 'Sheet1'  # First tab of the layout; more are added as "Sheet1 2", "Sheet1 3", ...
+}
+
+# Cross-venue crossed-book alerts (see arbitrage.py): raised when buying at one exchange's best ask and
+# selling at another's best bid beats both taker fees by more than threshold_bps, and again once it closes
+arbitrage = {
+    'enabled': True,
+    'threshold_bps': 0.0,
+    'fees_bps': {'binance': 10, 'okx': 10, 'kraken': 40, 'coinbase': 60}  # Taker fee per exchange
+}
+
+# Book analytics (see analytics.py): mid, spread, microprice, and the VWAP and slippage of filling each
+# size (in the base asset) against the top `depth` levels. Recomputed every `interval` seconds for the
+# books that changed, and written beside each book's rows in the sheet. In sharded mode books only
+# carry config.sharding['depth'] levels, so sizes past that depth come out N/A.
+analytics = {
+    'enabled': True,
+    'interval': 1.0,
+    'depth': 50,
+    'sizes': {  # By instrument; others use analytics.DEFAULT_SIZES
+        'btcusdt': [0.1, 1, 5, 25],
+        'ethusdt': [1, 10, 50, 250]
+    }
+}
+
+# How exchange connections run: 'threads' (one websocket-client thread per exchange) or
+# 'asyncio' (every exchange as a coroutine on one event loop; needs the websockets package)
+runtime = 'threads'
+
+# Connection supervision (see supervisor.py). A feed that sends no frame, heartbeats included, for
+# stale_after seconds is reconnected, as is one whose connection closed. Reconnects back off
+# exponentially with jitter, from backoff_initial up to backoff_max seconds.
+connections = {
+    'stale_after': {'binance': 10, 'okx': 20, 'kraken': 10, 'coinbase': 10},
+    'backoff_initial': 0.5,
+    'backoff_max': 30,
+    'check_interval': 0.25  # Seconds between checks
+}
+
+# Book events from the feed threads to the sinks (see bus.py). Sinks that can't keep up with every
+# update, such as the sheet writer, get their own thread and queue holding only the newest state of
+# each book; queue_size bounds that queue, the oldest book being dropped once it is full.
+bus = {
+    'queue_size': 1024
+}
+
+# Multi-process mode: the enabled pairs are split across this many worker processes, each with its
+# own connections and per-exchange books (and its own GIL). Workers send their top `depth` levels to
+# the main process, which aggregates them and runs the sinks. 0 keeps everything in one process.
+sharding = {
+    'workers': 0,
+    'depth': 20,  # Levels per side sent by workers; keep at or above the sheet and tick store depths
+    'assignment': {}  # Pin pairs to workers, e.g. {'binance': {'btcusdt': 0}}; the rest are dealt round-robin
+}
+
+# Full-rate local book history: fixed-width binary files, one per book per UTC day (see sinks/tick_store.py)
+tick_store = {
+    'enabled': False,
+    'path': 'tick_data',
+    'depth': 10  # Levels per side stored in each record
+}
+
+# Top of every book in a shared memory region, for other programs on this machine to read with
+# sinks.shared_memory.SharedBookReader (fixed slot per book, seqlock-guarded; see sinks/shared_memory.py)
+shared_memory = {
+    'enabled': False,
+    'name': 'mdf_books',
+    'depth': 10  # Levels per side in each slot
+}
+
+# Warm restart (see checkpoint.py): every `interval` seconds each exchange's top `depth` levels per
+# book, and the sheet writer's record of what the sheet holds, are saved to `path` (replaced atomically).
+# At startup a checkpoint up to max_age seconds old is restored, marked provisional until each exchange
+# sends its first snapshot, so the sheet and other sinks have books before any exchange connects.
+checkpoint = {
+    'enabled': True,
+    'path': 'checkpoints/books.json.gz',
+    'interval': 5,
+    'depth': 50,
+    'max_age': 600
+}
+
+# Raw websocket frame recording for replay with `python main.py --replay <file>` (see recorder.py)
+recorder = {
+    'enabled': False,
+    'path': 'recordings'
+}
+
+# Prometheus-style /metrics endpoint: message/error/resync counters and latency histograms (see metrics.py)
+metrics = {
+    'enabled': False,
+    'host': '127.0.0.1',
+    'port': 9108
+}
+
+# Logging (see log.py). Records are written by a background thread; each category (binance, okx,
+# kraken, main, sheets, ...) is rate limited separately, and DEBUG payload dumps are sampled.
+logs = {
+    'level': 'INFO',
+    'rate_per_second': 5,  # Sustained records per second per category, below ERROR
+    'burst': 20,
+    'category_limits': {},  # Per-category (rate_per_second, burst) overrides, e.g. {'sheets': (1, 5)}
+    'payload_sample_every': 1000  # At DEBUG, dump one in this many full payloads per category
+}
+
 # Exchange configuration
 exchanges = {
     'binance': {
@@ -10,25 +119,27 @@ exchanges = {
     },
     'okx': {
         'enabled': True,  # Set True or False based on your need
-        'pairs': ['BTC-USDT', 'ETH-USDT']  # OKX format uses dash between pairs
+        'pairs': ['BTC-USDT', 'ETH-USDT'],  # OKX format uses dash between pairs
+        # Book channel per pair: 'books' (400 levels, incremental), 'books5' (top 5) or 'bbo-tbt' (top 1).
+        # Pairs not listed here use 'books'.
+        'channels': {}  # e.g. {'ETH-USDT': 'books5'}
     },
     'kraken': {
         'enabled': False,  # Enable Kraken
         'pairs': ['XBT/USDT', 'ETH/USDT']  # Adjust pairs as needed
     },
-    'coinbase': {  # Currently not available due to lack of credentials for Coinbase
+    'coinbase': {
         'enabled': False,  # Set True or False based on your need
-        'pairs': ['BTC-USDT', 'ETH-USDT']  # Coinbase format uses dash between pairs
+        'pairs': ['BTC-USDT', 'ETH-USDT'],  # Coinbase format uses dash between pairs
+        # API key file for the full level2 channel; without it the public level2_batch channel is used
+        'credentials': 'coinbase_auth.json'
     }
 }
 
-SYMBOL_MAPPING = {
-    "BINANCE": {"BTCUSDT": "BTC-USDT", "ETHUSDT": "ETH-USDT"},
-    "OKX": {"BTC-USDT": "BTC-USDT", "ETH-USDT": "ETH-USDT"},
-    "KRAKEN": {"XBTUSD": "BTC-USDT", "ETHUSD": "ETH-USDT"},
-    "COINBASE": {"BTC-USD": "BTC-USDT", "ETH-USD": "ETH-USDT"}
-    # Add additional mappings as necessary
+# Per-instrument settings, by canonical name (see instruments.py; venue symbols such as 'BTC-USDT' or
+# 'XBT/USDT' are mapped to these names once at startup). The tick size is the one consolidated books
+# use, so it must be the finest of the venues listing the instrument. Unlisted instruments use a 1e-8 tick.
+instruments = {
+    'btcusdt': {'tick_size': 0.01, 'lot_size': 0.00000001},
+    'ethusdt': {'tick_size': 0.01, 'lot_size': 0.000001}
 }
-
-def normalize_pair(exchange, symbol):
-    return SYMBOL_MAPPING.get(exchange, {}).get(symbol, symbol)
\ No newline at end of file
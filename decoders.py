@@ -0,0 +1,136 @@
+import json
+from typing import List, Optional, Tuple
+
+# Frame decoding for the exchange adapters, fastest available backend first:
+#   msgspec - book frames decode straight into typed structs, with no intermediate dicts
+#   orjson  - fast generic decode, structs built from the resulting dicts
+#   json    - stdlib fallback, same shapes as orjson
+# Every backend hands the adapters the same types, so nothing downstream needs to know which one ran.
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec is not None:
+    BACKEND = 'msgspec'
+    loads = msgspec.json.decode
+elif orjson is not None:
+    BACKEND = 'orjson'
+    loads = orjson.loads
+else:
+    BACKEND = 'json'
+    loads = json.loads
+
+
+if msgspec is not None:
+    class DepthUpdate(msgspec.Struct, tag_field='e', tag='depthUpdate'):
+        """Binance diff-depth event; levels are decoded to (price, quantity) floats."""
+        s: str
+        U: int
+        u: int
+        b: List[Tuple[float, float]]
+        a: List[Tuple[float, float]]
+        E: int = 0
+
+    class OKXArg(msgspec.Struct, rename='camel'):
+        channel: str
+        inst_id: str
+
+    class OKXBookData(msgspec.Struct, rename='camel'):
+        """One OKX book push; levels keep OKX's strings, which its checksum is computed over."""
+        bids: List[List[str]] = []
+        asks: List[List[str]] = []
+        ts: str = ''
+        checksum: Optional[int] = None
+        seq_id: Optional[int] = None
+        prev_seq_id: Optional[int] = None
+
+    class OKXBookPush(msgspec.Struct):
+        arg: OKXArg
+        data: List[OKXBookData]
+        action: str = 'snapshot'  # books5 and bbo-tbt pushes carry no action; each is a full snapshot
+
+    # Lax mode lets Binance's numeric strings decode straight to floats
+    _depth_update_decoder = msgspec.json.Decoder(DepthUpdate, strict=False)
+    _okx_push_decoder = msgspec.json.Decoder(OKXBookPush)
+
+    def decode_binance(frame):
+        """A DepthUpdate for diff-depth events; anything else (subscription replies, errors) as plain JSON."""
+        try:
+            return _depth_update_decoder.decode(frame)
+        except msgspec.ValidationError:
+            return loads(frame)
+
+    def decode_okx(frame):
+        """An OKXBookPush for order book pushes; events and other channels as plain JSON."""
+        try:
+            return _okx_push_decoder.decode(frame)
+        except msgspec.ValidationError:
+            return loads(frame)
+
+else:
+    class DepthUpdate:
+        """Binance diff-depth event; levels are [price, quantity] numeric strings."""
+        __slots__ = ('s', 'U', 'u', 'b', 'a', 'E')
+
+        def __init__(self, s, U, u, b, a, E=0):
+            self.s = s
+            self.U = U
+            self.u = u
+            self.b = b
+            self.a = a
+            self.E = E
+
+    class OKXArg:
+        __slots__ = ('channel', 'inst_id')
+
+        def __init__(self, channel, inst_id):
+            self.channel = channel
+            self.inst_id = inst_id
+
+    class OKXBookData:
+        """One OKX book push; levels keep OKX's strings, which its checksum is computed over."""
+        __slots__ = ('bids', 'asks', 'ts', 'checksum', 'seq_id', 'prev_seq_id')
+
+        def __init__(self, bids=(), asks=(), ts='', checksum=None, seq_id=None, prev_seq_id=None):
+            self.bids = bids
+            self.asks = asks
+            self.ts = ts
+            self.checksum = checksum
+            self.seq_id = seq_id
+            self.prev_seq_id = prev_seq_id
+
+    class OKXBookPush:
+        __slots__ = ('arg', 'data', 'action')
+
+        def __init__(self, arg, data, action='snapshot'):
+            self.arg = arg
+            self.data = data
+            self.action = action
+
+    def decode_binance(frame):
+        """A DepthUpdate for diff-depth events; anything else (subscription replies, errors) as plain JSON."""
+        data = loads(frame)
+        if isinstance(data, dict) and data.get('e') == 'depthUpdate':
+            return DepthUpdate(data['s'], data['U'], data['u'], data['b'], data['a'], data.get('E', 0))
+        return data
+
+    def decode_okx(frame):
+        """An OKXBookPush for order book pushes; events and other channels as plain JSON."""
+        data = loads(frame)
+        if not (isinstance(data, dict) and 'arg' in data and data.get('data')
+                and isinstance(data['data'][0], dict) and 'bids' in data['data'][0]):
+            return data
+        arg = data['arg']
+        return OKXBookPush(
+            OKXArg(arg.get('channel', ''), arg.get('instId', '')),
+            [OKXBookData(entry.get('bids', []), entry.get('asks', []), entry.get('ts', ''), entry.get('checksum'),
+                         entry.get('seqId'), entry.get('prevSeqId'))
+             for entry in data['data']],
+            data.get('action', 'snapshot'),
+        )
@@ -1,10 +1,142 @@
 import websocket
 import json
 import threading
+import urllib.parse
+import urllib.request
+from collections import deque
+
+import log
+import metrics
+from decoders import DepthUpdate, decode_binance, loads
+from order_book import OrderBook
+
+BINANCE_REST_URL = "https://api.binance.com"
+
+logger = log.get_logger('binance')
+
+
+def fetch_depth_snapshot(symbol, limit=1000, rest_url=BINANCE_REST_URL, timeout=10):
+    """Fetch a REST depth snapshot: {"lastUpdateId": ..., "bids": [...], "asks": [...]}."""
+    query = urllib.parse.urlencode({"symbol": symbol.upper(), "limit": limit})
+    with urllib.request.urlopen(f"{rest_url}/api/v3/depth?{query}", timeout=timeout) as response:
+        return loads(response.read())
+
+
+class BinanceBookManager:
+    """Local order book for one symbol, built from the <symbol>@depth diff stream.
+
+    Follows Binance's documented sync: buffer diffs, load a REST snapshot, drop diffs already
+    contained in it, then apply diffs only while each U is at most the previous u + 1. A gap triggers
+    a fresh snapshot instead of a reconnect. Every applied change is passed to
+    on_update(symbol, bids, asks, snapshot, event_time), with event_time in epoch seconds, and a
+    synced book dropped for such a resync is reported to on_resync(symbol).
+    """
+
+    def __init__(self, symbol, on_update, rest_url=BINANCE_REST_URL, snapshot_limit=1000,
+                 fetch_snapshot=None, threaded_snapshot=True, max_buffer=1000, on_resync=None):
+        self.symbol = symbol.upper()
+        self.on_update = on_update
+        self.on_resync = on_resync
+        self.fetch_snapshot = fetch_snapshot or (
+            lambda symbol: fetch_depth_snapshot(symbol, snapshot_limit, rest_url))
+        self.threaded_snapshot = threaded_snapshot
+        self.book = OrderBook()
+        self.buffer = deque(maxlen=max_buffer)
+        self.last_update_id = None
+        self.synced = False
+        self.resyncs = 0
+        self._snapshot = None
+        self._fetching = False
+
+    def process(self, event):
+        """Handle one DepthUpdate event (U: first id, u: final id, b/a: [price, quantity] levels)."""
+        if not self.synced:
+            self.buffer.append(event)
+            self._try_sync()
+            return
+
+        if event.u <= self.last_update_id:
+            return  # Already contained in the book
+        if event.U > self.last_update_id + 1:
+            logger.warning("Gap in Binance depth stream for %s: expected U<=%d, got U=%d. Resyncing.",
+                           self.symbol, self.last_update_id + 1, event.U)
+            self.resync()
+            self.resyncs += 1
+            metrics.RESYNCS.labels('binance', self.symbol).inc()
+            if self.on_resync:
+                self.on_resync(self.symbol)
+            self.buffer.append(event)
+            self._try_sync()
+            return
+        self._apply(event)
+
+    def resync(self):
+        """Drop the local book state and start over from a new snapshot."""
+        self.synced = False
+        self.last_update_id = None
+        self.buffer.clear()
+        self._snapshot = None
+
+    def _apply(self, event):
+        self.book.apply(event.b, event.a)
+        self.last_update_id = event.u
+        self.on_update(self.symbol, event.b, event.a, False, event.E / 1000 if event.E else None)
+
+    def _try_sync(self):
+        if self._snapshot is None:
+            self._request_snapshot()
+            if self._snapshot is None:
+                return  # Still loading in the background; retried on the next diff
+        snapshot = self._snapshot
+        self._snapshot = None
+
+        last_update_id = snapshot['lastUpdateId']
+        if last_update_id < self.buffer[0].U:
+            # Snapshot predates the oldest buffered diff; fetch a newer one
+            self._request_snapshot()
+            return
+
+        pending = [event for event in self.buffer if event.u > last_update_id]
+        self.buffer.clear()
+        if pending and pending[0].U > last_update_id + 1:
+            logger.warning("Binance snapshot for %s does not line up with buffered diffs. Resyncing.", self.symbol)
+            self.resyncs += 1
+            metrics.RESYNCS.labels('binance', self.symbol).inc()
+            self._request_snapshot()
+            return
+
+        self.book.replace(snapshot['bids'], snapshot['asks'])
+        self.last_update_id = last_update_id
+        self.synced = True
+        self.on_update(self.symbol, snapshot['bids'], snapshot['asks'], True, None)
+
+        for event in pending:
+            self.process(event)
+
+    def _request_snapshot(self):
+        if self._fetching:
+            return
+        self._fetching = True
+        if self.threaded_snapshot:
+            threading.Thread(target=self._load_snapshot, daemon=True).start()
+        else:
+            self._load_snapshot()
+
+    def _load_snapshot(self):
+        try:
+            self._snapshot = self.fetch_snapshot(self.symbol)
+        except Exception as e:
+            logger.error("Error fetching Binance depth snapshot for %s: %s", self.symbol, e)
+        finally:
+            self._fetching = False
+
 
 class BinanceWebSocket:
-    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback):
+    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback,
+                 rest_url=BINANCE_REST_URL, fetch_snapshot=None, threaded_snapshot=True, recorder=None,
+                 on_resync_callback=None):
         self.symbols = symbols
+        self.recorder = recorder
         self.ws_url = "wss://stream.binance.com:9443/ws"
         self.ws = None
         self.thread = None
@@ -12,9 +144,33 @@ class BinanceWebSocket:
         self.on_error_callback = on_error_callback
         self.on_close_callback = on_close_callback
         self.on_open_callback = on_open_callback
+        self.on_resync_callback = on_resync_callback
+        if recorder:
+            fetch_snapshot = recorder.wrap_fetch(
+                'binance', fetch_snapshot or (lambda symbol: fetch_depth_snapshot(symbol, rest_url=rest_url)))
+        # Local books keyed by the upper-case symbol Binance puts in the "s" field
+        self.books = {
+            symbol.upper(): BinanceBookManager(symbol, self.on_book_update, rest_url=rest_url,
+                                               fetch_snapshot=fetch_snapshot, threaded_snapshot=threaded_snapshot,
+                                               on_resync=self.on_book_resync)
+            for symbol in symbols
+        }
+
+    def on_book_update(self, symbol, bids, asks, snapshot, event_time):
+        """Forward an in-sequence book change; snapshot=True means the book was rebuilt from REST."""
+        self.on_message_callback(self.ws, {"e": "depthUpdate", "E": event_time, "s": symbol, "b": bids, "a": asks,
+                                           "snapshot": snapshot})
+
+    def on_book_resync(self, symbol):
+        """A gap made a synced book start over from a new snapshot."""
+        if self.on_resync_callback:
+            self.on_resync_callback(self.ws, symbol)
 
     def on_open(self, ws):
-        print("WebSocket connection opened to Binance.")
+        logger.info("WebSocket connection opened to Binance.")
+        # Diffs from a previous connection can't be chained onto the new stream
+        for book in self.books.values():
+            book.resync()
         # Subscribe to market data for each symbol
         for symbol in self.symbols:
             params = {
@@ -23,18 +179,30 @@ class BinanceWebSocket:
                 "id": 1
             }
             ws.send(json.dumps(params))
-            print(f"Subscribed to {symbol} on Binance.")
+            logger.info("Subscribed to %s on Binance.", symbol)
         self.on_open_callback(ws)
 
+    def ping(self, ws):
+        """Ask for the subscription list; the reply shows the connection is still live."""
+        ws.send(json.dumps({"method": "LIST_SUBSCRIPTIONS", "id": 2}))
+
     def on_message(self, ws, message):
-        self.on_message_callback(ws, message)
+        metrics.received('binance')
+        if self.recorder:
+            self.recorder.record('binance', message)
+        data = decode_binance(message)
+        if isinstance(data, DepthUpdate) and data.s in self.books:
+            # Book changes reach the callback through on_book_update once they are in sequence
+            self.books[data.s].process(data)
+        else:
+            self.on_message_callback(ws, data)
 
-    def on_close(self, ws):
-        print("WebSocket connection closed for Binance.")
+    def on_close(self, ws, *args):
+        logger.info("WebSocket connection closed for Binance.")
         self.on_close_callback(ws)
 
     def on_error(self, ws, error):
-        print(f"Error encountered in Binance WebSocket: {error}")
+        logger.error("Error encountered in Binance WebSocket: %s", error)
         self.on_error_callback(ws, error)
 
     def connect(self):
@@ -1,28 +1,41 @@
 import websocket
-import json
-import hmac
+import base64
 import hashlib
+import hmac
+import json
+import os
+import threading
 import time
-import base64
-import requests
-import config
+from datetime import datetime
 
-# For loading credentials
-import os
-import json
+import log
+import metrics
+from decoders import loads
+from order_book import OrderBook, BIDS, ASKS
 
 COINBASE_WS_URL = "wss://ws-feed.exchange.coinbase.com"
 
-# Load API credentials from the 'client_secret.json' file
-with open('coinbase_auth.json') as f:
-    credentials = json.load(f)
+# Full level2 needs an authenticated subscription; level2_batch carries the same messages
+# (batched every 50ms) without one
+AUTHENTICATED_CHANNEL = 'level2'
+PUBLIC_CHANNEL = 'level2_batch'
 
-api_key = credentials['api_key']
-api_secret = credentials['api_secret']
-passphrase = credentials['passphrase']
+# Sent every second per product, so a quiet book still shows the connection is live
+HEARTBEAT_CHANNEL = 'heartbeat'
 
-# Generate authentication signature
-def generate_signature():
+logger = log.get_logger('coinbase')
+
+
+def load_credentials(path):
+    """{'api_key', 'api_secret', 'passphrase'} from a JSON file, or None if there is no such file."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def generate_signature(api_secret):
+    """Timestamp and signature for an authenticated feed subscription."""
     timestamp = str(time.time())
     message = timestamp + 'GET' + '/users/self/verify'
     hmac_key = base64.b64decode(api_secret)
@@ -30,54 +43,137 @@ def generate_signature():
     signature_b64 = base64.b64encode(signature).decode('utf-8')
     return timestamp, signature_b64
 
-# Open Coinbase WebSocket connection and authenticate
-def on_open(ws):
-    timestamp, signature_b64 = generate_signature()
-
-    # Dynamically pull product IDs from config.py
-    coinbase_pairs = config.exchanges['coinbase']['pairs']
-
-    subscribe_message = {
-        "type": "subscribe",
-        "channels": [
-            {
-                "name": "level2",  # You can subscribe to other channels as needed
-                "product_ids": coinbase_pairs
-            }
-        ],
-        "signature": signature_b64,
-        "key": api_key,
-        "passphrase": passphrase,
-        "timestamp": timestamp
-    }
-
-    ws.send(json.dumps(subscribe_message))
-    print(f"Coinbase WebSocket connection opened and subscription sent for pairs: {coinbase_pairs}")
-
-# Handle incoming messages from Coinbase
-def on_message(ws, message):
-    data = json.loads(message)
-    process_message(data)
-
-# Handle WebSocket errors
-def on_error(ws, error):
-    print(f"Coinbase WebSocket error: {error}")
-
-# Handle WebSocket closure
-def on_close(ws):
-    print("Coinbase WebSocket closed.")
-
-# Process incoming messages from Coinbase
-def process_message(data):
-    print(f"Received data from Coinbase: {data}")
-
-# Function to start Coinbase WebSocket connection
-def connect():
-    ws = websocket.WebSocketApp(
-        COINBASE_WS_URL,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close
-    )
-    ws.run_forever()
+
+def parse_time(value):
+    """Coinbase's ISO 8601 'time' field in epoch seconds."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() if value else None
+
+
+class CoinbaseBook:
+    """Local level2 book for one Coinbase product, from a full snapshot and then l2update changes.
+
+    Coinbase's level2 feed has no sequence numbers or checksum, so a crossed book (best bid at or
+    above best ask) is what gives away a missed update.
+    """
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        self.book = OrderBook()
+        self.ready = False
+
+    def apply_snapshot(self, bids, asks):
+        self.book.replace(bids, asks)
+        self.ready = True
+
+    def apply_changes(self, bids, asks):
+        """Apply [price, size] changes; returns False if the book is crossed afterwards."""
+        self.book.apply(bids, asks)
+        best_bid = self.book.bids.best()
+        best_ask = self.book.asks.best()
+        return best_bid is None or best_ask is None or best_bid[0] < best_ask[0]
+
+
+class CoinbaseWebSocket:
+    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback,
+                 credentials_path='coinbase_auth.json', recorder=None, on_resync_callback=None):
+        self.ws_url = COINBASE_WS_URL
+        self.symbols = symbols
+        self.recorder = recorder
+        self.on_message_callback = on_message_callback
+        self.on_error_callback = on_error_callback
+        self.on_close_callback = on_close_callback
+        self.on_open_callback = on_open_callback
+        self.on_resync_callback = on_resync_callback
+        self.ws = None
+        self.thread = None
+        self.books = {symbol: CoinbaseBook(symbol) for symbol in symbols}
+
+        # Only read when Coinbase is enabled, i.e. when this adapter is built
+        self.credentials = load_credentials(credentials_path)
+        if self.credentials:
+            self.channel = AUTHENTICATED_CHANNEL
+        else:
+            self.channel = PUBLIC_CHANNEL
+            logger.warning("No Coinbase credentials at %s; subscribing to %s.", credentials_path, PUBLIC_CHANNEL)
+
+    def subscription(self, message_type, product_ids):
+        message = {"type": message_type, "product_ids": product_ids, "channels": [self.channel, HEARTBEAT_CHANNEL]}
+        if self.credentials:
+            timestamp, signature = generate_signature(self.credentials['api_secret'])
+            message.update(signature=signature, key=self.credentials['api_key'],
+                           passphrase=self.credentials['passphrase'], timestamp=timestamp)
+        return json.dumps(message)
+
+    def resubscribe(self, ws, product_id):
+        """Drop the local book and ask Coinbase for a fresh snapshot of one product."""
+        self.books[product_id] = CoinbaseBook(product_id)
+        if self.on_resync_callback:
+            self.on_resync_callback(ws, product_id)
+        ws.send(self.subscription("unsubscribe", [product_id]))
+        ws.send(self.subscription("subscribe", [product_id]))
+
+    def on_open(self, ws):
+        # Updates from a previous connection can't be applied to the snapshot this one will send
+        for product_id in self.symbols:
+            self.books[product_id] = CoinbaseBook(product_id)
+        ws.send(self.subscription("subscribe", self.symbols))
+        logger.info("Subscribed to %s on Coinbase (%s).", ', '.join(self.symbols), self.channel)
+        self.on_open_callback(ws)
+
+    def on_message(self, ws, message):
+        metrics.received('coinbase')
+        if self.recorder:
+            self.recorder.record('coinbase', message)
+        data = loads(message)
+        message_type = data.get('type') if isinstance(data, dict) else None
+        book = self.books.get(data.get('product_id')) if message_type in ('snapshot', 'l2update') else None
+        if book is None:
+            # Subscription replies, heartbeats and errors are passed through already decoded
+            self.on_message_callback(ws, data)
+            return
+
+        if message_type == 'snapshot':
+            bids, asks = data['bids'], data['asks']
+            book.apply_snapshot(bids, asks)
+            snapshot = True
+        else:
+            if not book.ready:
+                return  # Updates before the snapshot can't be applied
+            bids = []
+            asks = []
+            for side, price, size in data['changes']:
+                (bids if side == 'buy' else asks).append((price, size))
+            if not book.apply_changes(bids, asks):
+                metrics.RESYNCS.labels('coinbase', book.product_id).inc()
+                logger.warning("Coinbase book for %s is crossed. Resubscribing.", book.product_id)
+                self.resubscribe(ws, book.product_id)
+                return
+            snapshot = False
+
+        # The consolidated book gets the same changes as the local one, not a copy of the book
+        self.on_message_callback(ws, {"product_id": book.product_id, BIDS: bids, ASKS: asks, "snapshot": snapshot,
+                                      "time": parse_time(data.get('time'))})
+
+    def on_error(self, ws, error):
+        logger.error("Coinbase WebSocket error: %s", error)
+        self.on_error_callback(ws, error)
+
+    def on_close(self, ws, *args):
+        logger.info("Coinbase WebSocket closed.")
+        self.on_close_callback(ws)
+
+    def start(self):
+        self.ws = websocket.WebSocketApp(self.ws_url,
+                                         on_open=self.on_open,
+                                         on_message=self.on_message,
+                                         on_error=self.on_error,
+                                         on_close=self.on_close)
+        self.thread = threading.Thread(target=self.ws.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        if self.ws:
+            self.ws.close()
+        if self.thread:
+            self.thread.join()
@@ -1,6 +1,14 @@
 import websocket
 import json
 import threading
+import zlib
+
+import log
+import metrics
+from decoders import loads
+from order_book import OrderBook, BIDS, ASKS
+
+logger = log.get_logger('kraken')
 
 
 def process_message(data):
@@ -14,87 +22,163 @@ def process_message(data):
 
         return symbol, bids, asks
     else:
-        print(f"Non-list message received from Kraken: {data}")
+        logger.debug("Non-list message received from Kraken: %s", data)
         return None
 
 
+def decimals(value):
+    """Number of decimal places in a Kraken price/volume string, e.g. "0.00050000" -> 8."""
+    return len(value.split('.')[1]) if '.' in value else 0
+
+
+class KrakenBook:
+    """Local book for one Kraken pair, bounded to the subscribed depth.
+
+    Level updates go through OrderBook (O(log n)); levels pushed beyond the subscribed depth
+    are dropped, as Kraken's book feed expects. Prices are stored as ticks of the pair's own
+    precision, so the CRC32 checksum can be rebuilt from integers without float formatting.
+    """
+
+    def __init__(self, depth=10):
+        self.depth = depth
+        self.book = None
+        self.volume_scale = 10 ** 8
+
+    @property
+    def ready(self):
+        return self.book is not None
+
+    def apply_snapshot(self, bids, asks):
+        # Kraken sends fixed precision per pair; learn it from the snapshot strings
+        sample = (asks or bids)[0] if (asks or bids) else None
+        price_decimals = decimals(sample[0]) if sample else 8
+        volume_decimals = decimals(sample[1]) if sample else 8
+        self.book = OrderBook(tick_size=10 ** -price_decimals)
+        self.volume_scale = 10 ** volume_decimals
+        self.book.apply(bids, asks)
+        self.book.truncate(self.depth)
+
+    def apply_update(self, bids, asks, checksum=None):
+        """Apply level updates; returns False when Kraken's checksum does not match the book."""
+        self.book.apply(bids, asks)
+        self.book.truncate(self.depth)
+        return checksum is None or self.checksum() == int(checksum)
+
+    def checksum(self):
+        """CRC32 over the top 10 asks then top 10 bids, as described in Kraken's book docs."""
+        volume_scale = self.volume_scale
+        parts = []
+        for side in (self.book.asks, self.book.bids):
+            for ticks, quantity in side.top(10):
+                # Dropping the decimal point and leading zeros leaves exactly the integer tick count
+                parts.append(str(ticks))
+                parts.append(str(int(round(quantity * volume_scale))))
+        return zlib.crc32(''.join(parts).encode())
+
+    def top(self, side, n):
+        return self.book.top(side, n) if self.book else []
+
+
 class KrakenWebSocket:
-    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback):
-        self.url = "wss://ws.kraken.com"
+    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback,
+                 depth=10, recorder=None, on_resync_callback=None):
+        self.ws_url = "wss://ws.kraken.com"
         self.symbols = symbols
+        self.recorder = recorder
+        self.depth = depth
         self.on_message_callback = on_message_callback
         self.on_error_callback = on_error_callback
         self.on_close_callback = on_close_callback
         self.on_open_callback = on_open_callback
+        self.on_resync_callback = on_resync_callback
         self.ws = None
-        self.order_book = {symbol: {'bids': [], 'asks': []} for symbol in symbols}  # Memory to store the full book
-
-    def update_order_book(self, symbol, bids, asks):
-        # Update bids
-        for bid in bids:
-            price, volume = bid[:2]
-            if float(volume) == 0:
-                self.order_book[symbol]['bids'] = [b for b in self.order_book[symbol]['bids'] if b[0] != price]
-            else:
-                self.order_book[symbol]['bids'] = [b for b in self.order_book[symbol]['bids'] if b[0] != price]
-                self.order_book[symbol]['bids'].append(bid)
-        self.order_book[symbol]['bids'].sort(key=lambda x: float(x[0]), reverse=True)
-
-        # Update asks
-        for ask in asks:
-            price, volume = ask[:2]
-            if float(volume) == 0:
-                self.order_book[symbol]['asks'] = [a for a in self.order_book[symbol]['asks'] if a[0] != price]
-            else:
-                self.order_book[symbol]['asks'] = [a for a in self.order_book[symbol]['asks'] if a[0] != price]
-                self.order_book[symbol]['asks'].append(ask)
-        self.order_book[symbol]['asks'].sort(key=lambda x: float(x[0]))
+        self.thread = None
+        self.order_book = {symbol: KrakenBook(depth) for symbol in symbols}  # Memory to store the full book
+        self.checksum_failures = 0
+
+    def update_order_book(self, symbol, bids, asks, checksum=None):
+        """Apply level updates; returns False when the book no longer matches Kraken's checksum."""
+        # Each level is [price, volume, timestamp]; a zero volume removes the level
+        return self.order_book[symbol].apply_update(bids, asks, checksum)
+
+    def subscription(self, pairs):
+        return {"pair": pairs, "subscription": {"name": "book", "depth": self.depth}}
+
+    def resubscribe(self, ws, symbol):
+        """Drop the local book and ask Kraken for a fresh snapshot of one pair."""
+        self.order_book[symbol] = KrakenBook(self.depth)
+        if self.on_resync_callback:
+            self.on_resync_callback(ws, symbol)
+        ws.send(json.dumps({"event": "unsubscribe", **self.subscription([symbol])}))
+        ws.send(json.dumps({"event": "subscribe", **self.subscription([symbol])}))
 
     def on_open(self, ws):
+        # Updates from a previous connection can't be applied to the snapshots this one will send
+        self.order_book = {symbol: KrakenBook(self.depth) for symbol in self.symbols}
         # Subscribe to the Kraken feed for the given symbols
-        subscribe_message = {
-            "event": "subscribe",
-            "pair": self.symbols,
-            "subscription": {
-                "name": "book",
-                "depth": 10  # Adjust depth here based on your requirements
-            }
-        }
+        subscribe_message = {"event": "subscribe", **self.subscription(self.symbols)}
         ws.send(json.dumps(subscribe_message))
         self.on_open_callback(ws)
 
     def on_message(self, ws, message):
-        data = json.loads(message)
-        if isinstance(data, list) and len(data) > 1:
-            symbol = data[-1]  # Extract the symbol
-            message_data = data[1]
-            bids = message_data.get('bs', message_data.get('b', []))
-            asks = message_data.get('as', message_data.get('a', []))
-
-            # Update the full book in memory
-            self.update_order_book(symbol, bids, asks)
-
-            # Pass the full book to the callback
-            full_bids = self.order_book[symbol]['bids'][:10]  # Use full order book
-            full_asks = self.order_book[symbol]['asks'][:10]
-            self.on_message_callback(ws, json.dumps({"symbol": symbol, "bids": full_bids, "asks": full_asks}))
+        metrics.received('kraken')
+        if self.recorder:
+            self.recorder.record('kraken', message)
+        data = loads(message)
+        if not (isinstance(data, list) and len(data) > 3):
+            # Events and heartbeats are passed through already decoded
+            self.on_message_callback(ws, data)
+            return
+
+        # [channelID, {"as"/"bs" or "a"/"b"}, (optional second {"b", "c"}), "book-10", "XBT/USD"]
+        symbol = data[-1]  # Extract the symbol
+        book = self.order_book.get(symbol)
+        if book is None:
+            return
+        bids = []
+        asks = []
+        checksum = None
+        for message_data in data[1:-2]:
+            if 'as' in message_data or 'bs' in message_data:
+                book.apply_snapshot(message_data.get('bs', []), message_data.get('as', []))
+            else:
+                bids.extend(message_data.get('b', []))
+                asks.extend(message_data.get('a', []))
+                checksum = message_data.get('c', checksum)
+
+        if not book.ready:
+            return  # Updates before the snapshot can't be applied
+        if (bids or asks or checksum) and not self.update_order_book(symbol, bids, asks, checksum):
+            self.checksum_failures += 1
+            metrics.RESYNCS.labels('kraken', symbol).inc()
+            logger.warning("Kraken checksum mismatch for %s. Resubscribing.", symbol)
+            self.resubscribe(ws, symbol)
+            return
+
+        # Kraken stamps every level it sends; the newest stamp in an update is the event time
+        timestamp = max((float(level[2]) for level in bids + asks), default=None)
+        # Pass the bounded book to the callback as-is; no JSON round trip
+        self.on_message_callback(ws, {"symbol": symbol, "bids": book.top(BIDS, self.depth),
+                                      "asks": book.top(ASKS, self.depth), "timestamp": timestamp})
 
     def on_error(self, ws, error):
         self.on_error_callback(ws, error)
 
-    def on_close(self, ws):
+    def on_close(self, ws, *args):
         self.on_close_callback(ws)
 
     def start(self):
-        self.ws = websocket.WebSocketApp(self.url,
+        self.ws = websocket.WebSocketApp(self.ws_url,
                                          on_open=self.on_open,
                                          on_message=self.on_message,
                                          on_error=self.on_error,
                                          on_close=self.on_close)
-        wst = threading.Thread(target=self.ws.run_forever)
-        wst.daemon = True
-        wst.start()
+        self.thread = threading.Thread(target=self.ws.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
 
     def close(self):
         if self.ws:
             self.ws.close()
+        if self.thread:
+            self.thread.join()
@@ -2,12 +2,105 @@
 import websocket
 import json
 import threading
-import time
+import zlib
+
+import log
+import metrics
+from decoders import OKXBookPush, decode_okx
+from order_book import OrderBook
+
+# Order book channels we know how to maintain. "books" pushes a 400-level snapshot followed by
+# incremental updates; "books5" and "bbo-tbt" push full 5-level / 1-level snapshots every time.
+BOOK_CHANNELS = ('books', 'books5', 'bbo-tbt')
+DEFAULT_CHANNEL = 'books'
+
+logger = log.get_logger('okx')
+
+
+def signed_crc32(text):
+    """OKX publishes its checksum as a signed 32-bit integer."""
+    value = zlib.crc32(text.encode())
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+
+class OKXBook:
+    """Local book for one OKX instrument, maintained from snapshot and update pushes.
+
+    Levels keep OKX's original price/size strings, since the checksum is computed over them.
+    Updates must chain prevSeqId -> seqId and match the pushed checksum, otherwise the book is
+    reported invalid and has to be rebuilt from a new snapshot.
+    """
+
+    def __init__(self, inst_id):
+        self.inst_id = inst_id
+        self.book = OrderBook()
+        self.seq_id = None
+
+    @property
+    def ready(self):
+        return self.seq_id is not None
+
+    def apply(self, action, data):
+        """Apply one OKXBookData push; returns False when the sequence or checksum check fails.
+
+        Updates may only be applied once the book is ready, i.e. after its snapshot.
+        """
+        if action == 'update':
+            prev_seq_id = data.prev_seq_id
+            if prev_seq_id is not None and prev_seq_id != self.seq_id:
+                logger.warning("OKX sequence gap for %s: expected prevSeqId=%s, got %s",
+                               self.inst_id, self.seq_id, prev_seq_id)
+                return False
+        else:
+            self.book.clear()
+
+        self._apply_levels(self.book.bids, data.bids)
+        self._apply_levels(self.book.asks, data.asks)
+        self.seq_id = data.seq_id or 0
+
+        checksum = data.checksum
+        if checksum is not None and self.checksum() != checksum:
+            logger.warning("OKX checksum mismatch for %s", self.inst_id)
+            return False
+        return True
+
+    def _apply_levels(self, book_side, levels):
+        to_ticks = self.book.to_ticks
+        for level in levels:
+            price, size = level[0], level[1]
+            if float(size) > 0:
+                book_side.set(to_ticks(price), (price, size))
+            else:
+                book_side.discard(to_ticks(price))
+
+    def checksum(self):
+        """CRC32 over "bid:size:ask:size:..." for the top 25 levels, as OKX documents it."""
+        bids = self.book.bids.top(25)
+        asks = self.book.asks.top(25)
+        parts = []
+        for i in range(max(len(bids), len(asks))):
+            if i < len(bids):
+                parts.extend(bids[i][1])
+            if i < len(asks):
+                parts.extend(asks[i][1])
+        return signed_crc32(':'.join(parts))
+
+    def top(self, side, n):
+        return [[float(price), float(size)] for _, (price, size) in self.book.side(side).top(n)]
 
 
 class OKXWebSocket:
-    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback):
+    def __init__(self, symbols, on_message_callback, on_error_callback, on_close_callback, on_open_callback,
+                 channels=None, recorder=None, on_resync_callback=None):
         self.symbols = symbols
+        self.recorder = recorder
+        # Per-symbol book channel, e.g. {"ETH-USDT": "books5"}; anything unlisted uses DEFAULT_CHANNEL
+        self.channels = {symbol: (channels or {}).get(symbol, DEFAULT_CHANNEL) for symbol in symbols}
+        for symbol, channel in self.channels.items():
+            if channel not in BOOK_CHANNELS:
+                raise ValueError(f"Unsupported OKX book channel '{channel}' for {symbol}")
+        self.books = {symbol: OKXBook(symbol) for symbol in symbols}
+        self.resyncs = 0
         self.ws_url = "wss://ws.okx.com:8443/ws/v5/public"
         self.ws = None
         self.thread = None
@@ -15,7 +108,10 @@ class OKXWebSocket:
         self.on_error_callback = on_error_callback
         self.on_close_callback = on_close_callback
         self.on_open_callback = on_open_callback
-        self.keep_running = True
+        self.on_resync_callback = on_resync_callback
+
+    def subscription(self, symbol):
+        return {"channel": self.channels[symbol], "instId": symbol}
 
     def request_snapshot(self, ws):
         """Subscribe to order book snapshots once upon connection."""
@@ -23,15 +119,31 @@ class OKXWebSocket:
         for symbol in self.symbols:
             params = {
                 "op": "subscribe",
-                "args": [{"channel": "books", "instId": symbol}]
+                "args": [self.subscription(symbol)]
             }
             ws.send(json.dumps(params))
-            print(f"Subscribed to snapshot of {symbol} on OKX.")
+            logger.info("Subscribed to %s of %s on OKX.", self.channels[symbol], symbol)
+
+        logger.info("Initial snapshots requested; maintaining order book in memory.")
 
-        print("Initial snapshots requested; maintaining order book in memory.")
+    def resubscribe(self, ws, symbol):
+        """Drop the local book and resubscribe, which makes OKX push a fresh snapshot."""
+        self.books[symbol] = OKXBook(symbol)
+        self.resyncs += 1
+        metrics.RESYNCS.labels('okx', symbol).inc()
+        if self.on_resync_callback:
+            self.on_resync_callback(ws, symbol)
+        ws.send(json.dumps({"op": "unsubscribe", "args": [self.subscription(symbol)]}))
+        ws.send(json.dumps({"op": "subscribe", "args": [self.subscription(symbol)]}))
+
+    def ping(self, ws):
+        """OKX answers a plain 'ping' with 'pong'."""
+        ws.send('ping')
 
     def on_open(self, ws):
-        print("WebSocket connection opened to OKX.")
+        logger.info("WebSocket connection opened to OKX.")
+        # Updates from a previous connection can't be chained onto the snapshots this one will send
+        self.books = {symbol: OKXBook(symbol) for symbol in self.symbols}
         self.on_open_callback(ws)
 
         # Request snapshots once upon connection
@@ -39,17 +151,35 @@ class OKXWebSocket:
         snapshot_thread.start()
 
     def on_message(self, ws, message):
-        """Log all messages received from OKX."""
-        print(f"Received message from OKX: {message}")
-        self.on_message_callback(ws, message)
+        """Keep the local books in sync and forward valid book pushes already decoded."""
+        metrics.received('okx')
+        if self.recorder:
+            self.recorder.record('okx', message)
+        if message == 'pong':
+            return
+        data = decode_okx(message)
+        if not isinstance(data, OKXBookPush):
+            self.on_message_callback(ws, data)  # Subscription events and errors, as plain JSON
+            return
+        book = self.books.get(data.arg.inst_id)
+        if book is None or data.arg.channel not in BOOK_CHANNELS:
+            self.on_message_callback(ws, data)
+            return
+
+        if data.action == 'update' and not book.ready:
+            return  # Updates before the snapshot, e.g. still in flight from before a resubscribe, can't be applied
+        if not book.apply(data.action, data.data[0]):
+            logger.warning("Resubscribing to %s of %s on OKX.", data.arg.channel, book.inst_id)
+            self.resubscribe(ws, book.inst_id)
+            return
+        self.on_message_callback(ws, data)
 
-    def on_close(self, ws):
-        print("WebSocket connection closed for OKX.")
-        self.keep_running = False  # Stop the snapshot requests
+    def on_close(self, ws, *args):
+        logger.info("WebSocket connection closed for OKX.")
         self.on_close_callback(ws)
 
     def on_error(self, ws, error):
-        print(f"Error encountered in OKX WebSocket: {error}")
+        logger.error("Error encountered in OKX WebSocket: %s", error)
         self.on_error_callback(ws, error)
 
     def connect(self):
@@ -0,0 +1,114 @@
+from order_book import DEFAULT_TICK_SIZE
+
+# Venue-specific asset codes and the canonical code they stand for; Kraken still quotes bitcoin as XBT
+ASSET_ALIASES = {'XBT': 'BTC', 'XDG': 'DOGE'}
+
+# Quote assets recognised at the end of symbols without a separator (Binance's BTCUSDT), longest first
+QUOTE_ASSETS = sorted(('USDT', 'USDC', 'FDUSD', 'TUSD', 'DAI', 'USD', 'EUR', 'GBP', 'TRY', 'BTC', 'ETH', 'BNB'),
+                      key=len, reverse=True)
+
+
+def split_symbol(native):
+    """Canonical (base, quote) for a venue symbol: 'btcusdt', 'BTC-USDT' and 'XBT/USDT' all give ('BTC', 'USDT')."""
+    symbol = native.strip().upper()
+    for separator in ('-', '/', '_'):
+        if separator in symbol:
+            base, quote = symbol.split(separator, 1)
+            break
+    else:
+        quote = next((quote for quote in QUOTE_ASSETS if symbol.endswith(quote) and symbol != quote), None)
+        if quote is None:
+            raise ValueError(f"Can't tell the quote asset of symbol '{native}'")
+        base = symbol[:-len(quote)]
+    return ASSET_ALIASES.get(base, base), ASSET_ALIASES.get(quote, quote)
+
+
+class Instrument:
+    """A canonical instrument, whichever venues list it; its consolidated book has this ID."""
+    __slots__ = ('id', 'name', 'base', 'quote', 'tick_size', 'lot_size')
+
+    def __init__(self, id, base, quote, tick_size=DEFAULT_TICK_SIZE, lot_size=None):
+        self.id = id
+        self.name = (base + quote).lower()  # 'btcusdt', as sheets, tick store paths and metrics label it
+        self.base = base
+        self.quote = quote
+        self.tick_size = tick_size
+        self.lot_size = lot_size
+
+    def __repr__(self):
+        return f"Instrument({self.id}, {self.name!r})"
+
+
+class Listing:
+    """One venue's symbol for an instrument; that venue's book for it has this ID."""
+    __slots__ = ('id', 'name', 'venue', 'native', 'instrument')
+
+    def __init__(self, id, venue, native, instrument):
+        self.id = id
+        self.name = f'{venue}_{instrument.name}'
+        self.venue = venue
+        self.native = native
+        self.instrument = instrument
+
+    def __repr__(self):
+        return f"Listing({self.id}, {self.name!r}, native={self.native!r})"
+
+
+class InstrumentRegistry:
+    """Every instrument and venue listing, built once at startup.
+
+    Instruments and listings share one ID space, so a book ID names exactly one book whether it
+    is consolidated or a single venue's. IDs follow config order, so every process building the
+    registry from the same config agrees on them. Handlers resolve a symbol from the wire with
+    one dict lookup in symbols(venue), which holds each listing under the spellings venues use.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or {}  # Instrument name -> {'tick_size': ..., 'lot_size': ...}
+        self.instruments = {}  # Name -> Instrument
+        self.books = {}  # Book ID -> Instrument or Listing
+        self.venues = {}  # Venue -> {native symbol: Listing}
+
+    @classmethod
+    def from_config(cls, exchanges, settings=None):
+        registry = cls(settings)
+        for venue, venue_settings in exchanges.items():
+            for native in venue_settings['pairs']:
+                registry.add(venue, native)
+        return registry
+
+    def instrument(self, base, quote):
+        name = (base + quote).lower()
+        instrument = self.instruments.get(name)
+        if instrument is None:
+            settings = self.settings.get(name, {})
+            instrument = self.instruments[name] = Instrument(
+                len(self.books), base, quote, settings.get('tick_size', DEFAULT_TICK_SIZE), settings.get('lot_size'))
+            self.books[instrument.id] = instrument
+        return instrument
+
+    def add(self, venue, native):
+        """Register a venue's symbol, creating its instrument on first sight; returns the Listing."""
+        symbols = self.venues.setdefault(venue, {})
+        listing = symbols.get(native)
+        if listing is not None:
+            return listing
+        instrument = self.instrument(*split_symbol(native))
+        listing = Listing(len(self.books), venue, native, instrument)
+        self.books[listing.id] = listing
+        # Config and wire spellings differ in case (Binance: 'btcusdt' in config, 'BTCUSDT' on the wire)
+        for spelling in (native, native.upper(), native.lower()):
+            symbols.setdefault(spelling, listing)
+        return listing
+
+    def symbols(self, venue):
+        """{native symbol: Listing} for a venue, for handlers to hold on to."""
+        return self.venues.setdefault(venue, {})
+
+    def listing(self, venue, native):
+        return self.venues.get(venue, {}).get(native)
+
+    def listings(self, venue=None):
+        """Each distinct listing, optionally for one venue, in registration order."""
+        return [book for book in self.books.values()
+                if isinstance(book, Listing) and (venue is None or book.venue == venue)]
@@ -0,0 +1,118 @@
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Every logger lives under this root, one child per category: mdf.binance, mdf.okx, mdf.main, ...
+ROOT = 'mdf'
+
+# Payload dumps go to a "<category>.payload" child logger, so they have their own rate limit
+_payload_loggers = {}
+_payload_counts = {}
+_payload_sample_every = 1000
+
+
+def get_logger(category):
+    return logging.getLogger(f'{ROOT}.{category}')
+
+
+def log_payload(logger, payload, message, *args):
+    """DEBUG dump of a whole payload, sampled to one in every payload_sample_every calls per category.
+
+    At INFO and above this costs a single isEnabledFor check, so it is safe on the hot path.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    count = _payload_counts.get(logger.name, 0)
+    _payload_counts[logger.name] = count + 1
+    if count % _payload_sample_every == 0:
+        payload_logger = _payload_loggers.get(logger.name)
+        if payload_logger is None:
+            payload_logger = _payload_loggers[logger.name] = logger.getChild('payload')
+        payload_logger.debug(message + " (1 in %d sampled): %s", *args, _payload_sample_every, payload)
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per category; records over the limit are dropped and counted.
+
+    ERROR and above always pass. The next record let through for a category carries the number
+    dropped before it, which the formatter appends.
+    """
+
+    def __init__(self, rate_per_second=5.0, burst=20, category_limits=None):
+        super().__init__()
+        self.default_limit = (rate_per_second, burst)
+        self.category_limits = category_limits or {}
+        self.buckets = {}  # Logger name -> [tokens, last refill, suppressed, rate, burst]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(record.name)
+            if bucket is None:
+                category = record.name[len(ROOT) + 1:]
+                rate, burst = self.category_limits.get(category, self.default_limit)
+                bucket = self.buckets[record.name] = [burst, now, 0, rate, burst]
+            tokens, last, suppressed, rate, burst = bucket
+            tokens = min(burst, tokens + (now - last) * rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] = suppressed + 1
+                return False
+            bucket[0] = tokens - 1
+            bucket[2] = 0
+        record.suppressed = suppressed
+        return True
+
+
+class Formatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f" [{suppressed} earlier {record.name[len(ROOT) + 1:]} messages suppressed]"
+        return text
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread.
+
+    The stock prepare() formats the message on the calling thread; here the record is queued
+    untouched, so log calls must pass arguments that won't change afterwards (strings, numbers).
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup(level='INFO', rate_per_second=5.0, burst=20, category_limits=None, payload_sample_every=1000,
+          stream=None, tag=None):
+    """Route every mdf.* logger through a queue to a background writer thread.
+
+    tag, when given, is shown on every line (worker processes use it to tell their output apart).
+    Returns the QueueListener; stop() it on shutdown to flush what is still queued.
+    """
+    global _payload_sample_every
+    _payload_sample_every = max(1, payload_sample_every)
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(RateLimitFilter(rate_per_second, burst, category_limits))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    prefix = f'[{tag}] ' if tag else ''
+    output.setFormatter(Formatter('%(asctime)s %(levelname)-7s ' + prefix + '%(name)s: %(message)s'))
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(level)
+    root.handlers[:] = [handler]
+    root.propagate = False
+    return listener
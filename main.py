@@ -1,434 +1,678 @@
-import json
-import gspread
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import threading
 import time
-from oauth2client.service_account import ServiceAccountCredentials
 from exchanges.binance import BinanceWebSocket
 from exchanges.okx import OKXWebSocket
 from exchanges.kraken import KrakenWebSocket
-from exchanges.coinbase import connect as coinbase_connect
-from config import normalize_pair  # Updated import
-from data_utils import format_order_data
+from exchanges.coinbase import CoinbaseWebSocket
+from analytics import AnalyticsSink, DEFAULT_SIZES
+from arbitrage import CrossDetector, OPENED
+from bus import Bus, BookEvent, EVERY
+from decoders import OKXBookPush, loads
+from instruments import InstrumentRegistry
+from order_book import ConsolidatedBook, BIDS, ASKS
+from sinks.google_sheets import GoogleSheetsSink, NullSpreadsheet, open_spreadsheet
+from sinks.tick_store import TickStoreSink
+from sinks.shared_memory import SharedMemorySink
+from recorder import FrameRecorder, RecordedSnapshots, ReplaySocket, replay
+from supervisor import Supervisor
+import async_runtime
+import checkpoint
+import log
+import metrics
+import sharding
 import config
-from collections import defaultdict
+
+logger = log.get_logger('main')
 
 # Set the depth of the order book (number of levels to retrieve)
 depth = 5
 
-# Set the frequency for updates in seconds
+# Set the frequency for updates in seconds; the sheet writer flushes at this interval
 update_freq = 10
 
-aggregated_books = defaultdict(lambda: {'bids': [], 'asks': []})
-
-# Set up Google Sheets API
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name('ServiceAccountCredentials.json', scope)
-client = gspread.authorize(creds)
-
-# Open the Google Sheet
-sheet = client.open_by_key('1rzcGKK4dMGWhthJQWn7wSSLpaVehNs5zV1GmSZ1yVZU').sheet1
-
-order_books = {}
-last_update_times = {}
-google_sheet_cache = {}
-
+# Every configured symbol mapped to its instrument, with integer book IDs; built once from config
+registry = InstrumentRegistry.from_config(config.exchanges, config.instruments)
 
-def normalize_pair(pair: str, exchange: str) -> str:
-    """Normalize pair names based on exchange-specific formats."""
-    if not pair:
-        print(f"Warning: Received an invalid pair value for {exchange}. Pair is: {pair}")
-        return None
+# One ConsolidatedBook per instrument ID, layered over a book per exchange
+aggregated_books = {}
 
-    pair = pair.strip()  # Strip spaces just in case
+# Rows per worksheet before the sheet layout spills symbols onto a new tab
+max_rows_per_sheet = 1000
 
-    print(f"Normalizing pair '{pair}' for exchange '{exchange}'")
+# Instrument ID -> lock held while a feed thread changes its consolidated book, and while a
+# subscriber on another thread reads it
+book_locks = {}
 
-    if exchange == 'binance' or exchange == 'okx':
-        # Binance and OKX format is 'btcusdt' (lowercase, no dashes)
-        return pair.replace('-', '').lower()
-    elif exchange == 'kraken':
-        # Kraken uses uppercase format with 'XBT' for 'BTC'
-        pair = pair.replace('/', '').upper()
-        if 'BTC' in pair:
-            pair = pair.replace('BTC', 'XBT')
-        return pair.lower()  # Ensure it's lowercase to match Binance/OKX
-    else:
-        print(f"Warning: Unrecognized exchange '{exchange}' or unsupported format for pair '{pair}'")
-        return None
+# Every destination for book output, each one a sinks.base.Sink; filled by build_sinks() at startup
+sinks = []
 
+# Book events go from the feed threads to the sinks through the bus, each sink with its own delivery
+# policy (see bus.py); cross alerts go to their handlers the same way. Wired up by subscribe_sinks().
+bus = Bus()
+BOOKS = 'books'
+ALERTS = 'alerts'
 
-def aggregate_books(pair, book, exchange):
-    """Aggregate order books for a given pair from multiple exchanges."""
-    normalized_pair = normalize_pair(pair, exchange)
-    if normalized_pair is None:
-        print(f"Error: Could not normalize pair '{pair}' for exchange '{exchange}'. Skipping subscription.")
-        return
+# Listing ID -> perf_counter time its exchange's book was withdrawn, until a snapshot rebuilds it
+resyncing = {}
 
-    # Ensure the aggregated_books entry is initialized
-    if normalized_pair not in aggregated_books:
-        aggregated_books[normalized_pair] = {'bids': {}, 'asks': {}}
 
-    exchange_code = exchange[:2].capitalize()  # e.g., "Bi" for Binance, "Ok" for OKX
+def aggregate_books(listing, book, snapshot=False, event_time=None):
+    """Apply one exchange's order book message to the consolidated book for its instrument.
 
-    # Process bids
-    for entry in book.get('bids', []):
-        try:
-            # Convert price and quantity to float immediately
-            price = float(entry[0])
-            quantity = float(entry[1])
-        except (ValueError, IndexError):
-            print(f"Invalid bid entry {entry} for {normalized_pair} from {exchange}. Skipping.")
-            continue
-
-        # Format the price as a string with fixed precision (8 decimal places)
-        price_str = f"{price:.8f}"
-        # (Optional) Debug logging: print the key and its type
-        # print(f"Using bid price key: {price_str} (type: {type(price_str)})")
-
-        if quantity > 0:
-            if price_str in aggregated_books[normalized_pair]['bids']:
-                aggregated_books[normalized_pair]['bids'][price_str]['quantity'] += quantity
-                aggregated_books[normalized_pair]['bids'][price_str]['contributors'].add(exchange_code)
-            else:
-                aggregated_books[normalized_pair]['bids'][price_str] = {
-                    'quantity': quantity,
-                    'contributors': {exchange_code}
-                }
+    Diffs only touch the levels they mention; a snapshot replaces that exchange's layer.
+    Quantities from other exchanges are never modified. event_time is the exchange's own
+    timestamp for the message, in epoch seconds, when it carries one.
+    """
+    instrument = listing.instrument
+    consolidated_book = aggregated_books[instrument.id]
+    # A layer restored from a checkpoint goes live with the exchange's first snapshot
+    layer = consolidated_book.venues.get(listing.venue) if snapshot else None
+    restored = layer is not None and layer.provisional
 
-    # Process asks
-    for entry in book.get('asks', []):
-        try:
-            price = float(entry[0])
-            quantity = float(entry[1])
-        except (ValueError, IndexError):
-            print(f"Invalid ask entry {entry} for {normalized_pair} from {exchange}. Skipping.")
-            continue
-
-        price_str = f"{price:.8f}"
-        # (Optional) Debug logging: print the key and its type
-        # print(f"Using ask price key: {price_str} (type: {type(price_str)})")
-
-        if quantity > 0:
-            if price_str in aggregated_books[normalized_pair]['asks']:
-                aggregated_books[normalized_pair]['asks'][price_str]['quantity'] += quantity
-                aggregated_books[normalized_pair]['asks'][price_str]['contributors'].add(exchange_code)
+    # Levels go to the book as decoded ([price, quantity] floats or numeric strings); it converts each once
+    try:
+        with book_locks[instrument.id]:
+            if snapshot:
+                consolidated_book.replace_venue(listing.venue, book.get(BIDS, []), book.get(ASKS, []))
             else:
-                aggregated_books[normalized_pair]['asks'][price_str] = {
-                    'quantity': quantity,
-                    'contributors': {exchange_code}
-                }
-
-    # Sort and limit to top 'depth' levels for bids and asks
-    aggregated_books[normalized_pair]['bids'] = dict(sorted(
-        aggregated_books[normalized_pair]['bids'].items(),
-        key=lambda x: -float(x[0])
-    )[:depth])
-
-    aggregated_books[normalized_pair]['asks'] = dict(sorted(
-        aggregated_books[normalized_pair]['asks'].items(),
-        key=lambda x: float(x[0])
-    )[:depth])
-
-    print(
-        f"Aggregated book for {normalized_pair}: Bids = {len(aggregated_books[normalized_pair]['bids'])}, "
-        f"Asks = {len(aggregated_books[normalized_pair]['asks'])}"
-    )
+                consolidated_book.apply_venue(listing.venue, book.get(BIDS, []), book.get(ASKS, []))
+    except (ValueError, TypeError, IndexError) as e:
+        logger.warning("Invalid level in book for %s from %s: %s. Skipping.", instrument.name, listing.venue, e)
+        metrics.ERRORS.labels(listing.venue, instrument.name).inc()
+        return
+    metrics.book_applied(listing.venue, instrument.name, event_time)
+    if snapshot and resyncing:
+        withdrawn = resyncing.pop(listing.id, None)
+        if withdrawn is not None:
+            elapsed = time.perf_counter() - withdrawn
+            metrics.RESYNC_SECONDS.labels(listing.venue, instrument.name).observe(elapsed)
+            logger.info("%s book for %s rebuilt %.2fs after its connection went down.",
+                        listing.venue, instrument.name, elapsed)
+    if restored:
+        logger.info("%s book for %s is live; its restored levels have been replaced.", listing.venue, instrument.name)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Aggregated book for %s: Bids = %d, Asks = %d",
+                     instrument.name, len(consolidated_book.bids), len(consolidated_book.asks))
+
+
+def create_books():
+    """An empty ConsolidatedBook and its lock for every registered instrument, replacing any there were.
+
+    Books are only ever created here, before any feed or restore starts, so the feed threads just
+    look them up and never race to create the same one.
+    """
+    aggregated_books.clear()
+    book_locks.clear()
+    for instrument in registry.instruments.values():
+        book_locks[instrument.id] = threading.Lock()
+        aggregated_books[instrument.id] = ConsolidatedBook(instrument.tick_size)
 
 
 def initialize_order_books():
     for exchange, config_data in config.exchanges.items():
         if config_data['enabled']:
             for pair in config_data['pairs']:
-                normalized_pair = normalize_pair(pair, exchange)
-                if normalized_pair:
-                    unique_key = f"{exchange}_{normalized_pair}"  # Construct unique_key
-                    order_books[unique_key] = {'bids': [], 'asks': []}  # Use unique_key for order_books
-                    last_update_times[unique_key] = 0  # Use unique_key for last_update_times
-                else:
-                    print(f"Warning: Could not normalize pair '{pair}' for exchange '{exchange}'. Skipping.")
+                listing = registry.add(exchange, pair)  # Already registered unless config changed since import
+
+                # Let sinks lay out their output up front, so pushes never search for their place
+                instrument = listing.instrument
+                for sink in sinks:
+                    if config.aggregation_enabled:
+                        sink.register(instrument.id, instrument.name, aggregated=True)
+                    else:
+                        sink.register(listing.id, listing.name, exchange=exchange)
+    create_books()
 
 
 def process_order_book(symbol, bids, asks):
     """Process order book data."""
-    print(f"Processing order book for {symbol}")
+    logger.debug("Processing order book for %s", symbol)
     for bid in bids:
-        print(f"Bid: {bid}")
+        logger.debug("Bid: %s", bid)
     for ask in asks:
-        print(f"Ask: {ask}")
+        logger.debug("Ask: %s", ask)
 
 
 def on_message_kraken(ws, message):
     try:
-        parsed_data = json.loads(message)
-        print(f"Kraken message received: {parsed_data}")
+        # KrakenWebSocket hands over already-decoded books and events
+        parsed_data = loads(message) if isinstance(message, (str, bytes)) else message
+        log.log_payload(logger, parsed_data, "Kraken message received")
 
         if 'event' in parsed_data:
             if parsed_data['event'] == 'subscriptionStatus':
-                print(f"Kraken subscription event: {parsed_data}")
+                logger.info("Kraken subscription event: %s", parsed_data)
             elif parsed_data['event'] == 'heartbeat':
-                print("Kraken heartbeat received, no action needed.")
+                logger.debug("Kraken heartbeat received, no action needed.")
             else:
-                print(f"Unhandled Kraken event type: {parsed_data['event']}")
-                print(f"Full Kraken message: {json.dumps(parsed_data, indent=2)}")
+                logger.warning("Unhandled Kraken event type: %s", parsed_data['event'])
+                logger.debug("Full Kraken message: %s", parsed_data)
 
         elif isinstance(parsed_data, dict) and 'bids' in parsed_data and 'asks' in parsed_data:
             symbol = parsed_data.get('symbol')
-            normalized_symbol = normalize_pair(symbol, 'kraken')  # Updated reference
-
-            bids = [bid[:2] for bid in parsed_data.get('bids', [])]
-            asks = [ask[:2] for ask in parsed_data.get('asks', [])]
+            listing = registry.symbols('kraken').get(symbol)
+            if listing is None:
+                logger.warning("Unknown Kraken symbol %r. Skipping.", symbol)
+                return
 
-            formatted_data = format_order_data('kraken', {
-                "bids": bids,
-                "asks": asks,
-                "timestamp": parsed_data.get("timestamp")
-            })
+            # KrakenBook.top already gives [price, volume] levels, so the message is used as-is
+            bids = parsed_data['bids']
+            asks = parsed_data['asks']
 
-            if formatted_data["bids"] or formatted_data["asks"]:
-                print(f"Updating Kraken order book for {normalized_symbol}: Bids = {len(bids)}, Asks = {len(asks)}")
-                unique_key = f"kraken_{normalized_symbol}"
-                update_google_sheet(unique_key, formatted_data["bids"], formatted_data["asks"], 'kraken')
+            if bids or asks:
+                logger.debug("Updating Kraken order book for %s: Bids = %d, Asks = %d",
+                             listing.name, len(bids), len(asks))
+                # KrakenWebSocket hands over its full top-of-book, so it replaces Kraken's layer
+                aggregate_books(listing, parsed_data, snapshot=True, event_time=parsed_data.get('timestamp'))
+                publish(listing)
             else:
-                print(f"No bids or asks found for {normalized_symbol}")
+                logger.warning("No bids or asks found for %s", listing.name)
         else:
-            print(f"Unhandled Kraken message structure: {parsed_data}")
+            logger.warning("Unhandled Kraken message structure: %s", parsed_data)
     except Exception as e:
-        print(f"Error processing Kraken message: {str(e)}")
+        logger.exception("Error processing Kraken message: %s", e)
+        metrics.ERRORS.labels('kraken', '').inc()
 
 
 def on_message(ws, message, exchange):
     """Process incoming WebSocket messages and handle order book updates."""
     try:
-        parsed_data = json.loads(message)
-        print(f"Received message from {exchange}: {parsed_data}")
+        # The adapters hand over already-decoded, sequenced book events
+        parsed_data = loads(message) if isinstance(message, (str, bytes)) else message
+        log.log_payload(logger, parsed_data, "Received message from %s", exchange)
 
         # Filter messages to process only those with valid order book data
         if exchange == 'binance':
-            if 'b' in parsed_data and 'a' in parsed_data:
-                symbol = parsed_data.get('s', '').lower()
-                normalized_symbol = normalize_pair(symbol, 'binance')
+            if isinstance(parsed_data, dict) and 'b' in parsed_data and 'a' in parsed_data:
+                symbol = parsed_data.get('s')
 
-                # Process and format bids and asks
-                bids = [[float(bid[0]), float(bid[1])] for bid in parsed_data.get('b', [])]
-                asks = [[float(ask[0]), float(ask[1])] for ask in parsed_data.get('a', [])]
-                formatted_data = {"bids": bids, "asks": asks}
+                # Levels are passed through as decoded; the consolidated book converts them
+                formatted_data = {"bids": parsed_data['b'], "asks": parsed_data['a']}
+                # Diffs, except when BinanceBookManager has just rebuilt the book from a REST snapshot
+                snapshot = parsed_data.get('snapshot', False)
+                event_time = parsed_data.get('E')
 
             else:
-                print("Non-order book message received from Binance, ignoring.")
+                logger.debug("Non-order book message received from Binance, ignoring.")
                 return
 
         elif exchange == 'okx':
-            if 'arg' in parsed_data and 'data' in parsed_data:
-                symbol = parsed_data['arg'].get('instId', '').lower()
-                normalized_symbol = normalize_pair(symbol, 'okx')
-                data_entry = parsed_data.get('data', [{}])[0]
-                formatted_data = {"bids": data_entry.get("bids", []), "asks": data_entry.get("asks", [])}
+            if isinstance(parsed_data, OKXBookPush):
+                symbol = parsed_data.arg.inst_id
+                data_entry = parsed_data.data[0]
+                formatted_data = {"bids": data_entry.bids, "asks": data_entry.asks}
+                # The books channel sends a full snapshot first, then incremental updates that
+                # OKXWebSocket has already checked; books5/bbo-tbt pushes are always snapshots
+                snapshot = parsed_data.action == 'snapshot'
+                event_time = int(data_entry.ts) / 1000 if data_entry.ts else None  # OKX ts is in milliseconds
 
             else:
-                print("Non-order book message received from OKX, ignoring.")
+                logger.debug("Non-order book message received from OKX, ignoring.")
                 return
 
-        # Process order book data if available
-        if formatted_data and (formatted_data["bids"] or formatted_data["asks"]):
-            unique_key = f"{exchange}_{normalized_symbol}"
-            print(f"Processing order book for '{unique_key}': Bids = {len(formatted_data['bids'])}, Asks = {len(formatted_data['asks'])}")
-
-            if config.aggregation_enabled:
-                print(f"Aggregation is enabled for pair '{normalized_symbol}'")
-                aggregate_books(normalized_symbol, formatted_data, exchange)
-                push_aggregated_data_to_spreadsheet(normalized_symbol)
+        elif exchange == 'coinbase':
+            if isinstance(parsed_data, dict) and 'product_id' in parsed_data and 'bids' in parsed_data:
+                symbol = parsed_data['product_id']
+                # CoinbaseWebSocket hands over the same [price, size] changes it applied to its own book
+                formatted_data = parsed_data
+                snapshot = parsed_data['snapshot']
+                event_time = parsed_data['time']
+
             else:
-                print(f"Aggregation disabled - pushing data to sheet for '{unique_key}'")
-                update_google_sheet(unique_key, formatted_data["bids"], formatted_data["asks"], exchange)
+                logger.debug("Non-order book message received from Coinbase, ignoring.")
+                return
+
+        listing = registry.symbols(exchange).get(symbol)
+        if listing is None:
+            logger.warning("Unknown %s symbol %r. Skipping.", exchange, symbol)
+            return
+
+        # Process order book data if available
+        if formatted_data["bids"] or formatted_data["asks"]:
+            logger.debug("Processing order book for '%s': Bids = %d, Asks = %d",
+                         listing.name, len(formatted_data['bids']), len(formatted_data['asks']))
+
+            # Per-exchange books live in the consolidated book's venue layers either way
+            aggregate_books(listing, formatted_data, snapshot=snapshot, event_time=event_time)
+            publish(listing)
         else:
-            print(f"Error: No valid order book data for '{normalized_symbol}' on '{exchange}'.")
+            logger.warning("No valid order book data for '%s'.", listing.name)
 
     except Exception as e:
-        print(f"Error encountered in {exchange} WebSocket: {str(e)}")
+        logger.exception("Error encountered in %s WebSocket: %s", exchange, e)
+        metrics.ERRORS.labels(exchange, '').inc()
 
-def update_google_sheet(symbol, bids, asks, exchange, update_interval=10):
-    """Update Google Sheets with order book data with a reduced update frequency."""
-    try:
-        global last_update_times, google_sheet_cache, sheet
-        current_time = time.time()
-
-        unique_key = symbol
-
-        # Initialize the cache entry if it doesn't exist
-        if unique_key not in google_sheet_cache:
-            google_sheet_cache[unique_key] = {"bids": [], "asks": []}
-
-        # Update the cache with the latest order book data
-        google_sheet_cache[unique_key] = {
-            "bids": bids[:depth],  # Limit to specified depth
-            "asks": asks[:depth]
-        }
-
-        # Only update the sheet if enough time has passed since the last update
-        if current_time - last_update_times.get(unique_key, 0) >= update_interval:
-            # Prepare data for Google Sheets
-            data = [
-                [f'Level {i + 1}', bid[0] or 'N/A', bid[1] or 'N/A', ask[0] or 'N/A', ask[1] or 'N/A']
-                for i, (bid, ask) in enumerate(zip(google_sheet_cache[unique_key]["bids"], google_sheet_cache[unique_key]["asks"]))
-            ]
-
-            # Calculate start and end rows for this symbol's data in the sheet
-            try:
-                start_row = (list(order_books.keys()).index(unique_key) * (depth + 3)) + 2
-                end_row = start_row + depth - 1
-            except ValueError:
-                print(f"Error: Could not find '{unique_key}' in order_books keys for row indexing.")
-                return
 
-            # Initialize header in Google Sheets if this symbol is new
-            if last_update_times.get(unique_key, 0) == 0:
-                try:
-                    sheet.update(range_name=f'A{start_row - 1}', values=[[f'{unique_key.upper()} {exchange.upper()} Market Data']])
-                    sheet.update(range_name=f'B{start_row - 1}', values=[['Level', 'Bid Price', 'Bid Quantity', 'Ask Price', 'Ask Quantity']])
-                except Exception as e:
-                    print(f"Exception during initial header update for '{unique_key}': {e}")
-                    return
+def publish(listing):
+    """Publish the book a listing's update changed to the bus: consolidated, or the exchange's own."""
+    if config.aggregation_enabled:
+        publish_aggregated_book(listing.instrument)
+    else:
+        publish_book(listing)
 
-            # Update Google Sheets with the cached order book data
-            try:
-                sheet.update(range_name=f'B{start_row}:F{end_row}', values=data)
-                last_update_times[unique_key] = current_time
-                print(f"Google Sheet updated for {unique_key} on {exchange}")
-            except Exception as e:
-                print(f"Exception during data update for '{unique_key}': {e}")
 
-    except Exception as e:
-        print(f"General exception in update_google_sheet: {e}")
+def publish_book(listing):
+    """Publish one exchange's book for an instrument."""
+    instrument_id = listing.instrument.id
+    book = aggregated_books[instrument_id].venue(listing.venue)
+    event = BookEvent(listing.id, listing.venue, book, book_locks[instrument_id], time.monotonic())
+    bus.publish(BOOKS, listing.id, event)
 
 
-def push_aggregated_data_to_spreadsheet(normalized_pair):
-    """Push aggregated order book data to the Google Sheet."""
-    try:
-        if normalized_pair not in aggregated_books:
-            print(f"Error: Aggregated book for pair '{normalized_pair}' not found.")
-            return
+def publish_aggregated_book(instrument):
+    """Publish the consolidated book for an instrument."""
+    book = aggregated_books.get(instrument.id)
+    if book is None:
+        logger.error("Aggregated book for '%s' not found.", instrument.name)
+        return
 
-        current_time = time.time()
-
-        bids = list(aggregated_books[normalized_pair]['bids'].items())[:depth]
-        asks = list(aggregated_books[normalized_pair]['asks'].items())[:depth]
-
-        formatted_bids = [
-            [
-                f'Level {i + 1}',
-                bid_price,  # Bid price
-                bid_data['quantity'],  # Bid quantity
-                ', '.join(sorted(bid_data['contributors']))  # Data source(s)
-            ]
-            for i, (bid_price, bid_data) in enumerate(bids)
-        ]
-
-        formatted_asks = [
-            [
-                f'Level {i + 1}',
-                ask_price,  # Ask price
-                ask_data['quantity'],  # Ask quantity
-                ', '.join(sorted(ask_data['contributors']))  # Data source(s)
-            ]
-            for i, (ask_price, ask_data) in enumerate(asks)
-        ]
-
-        while len(formatted_bids) < depth:
-            formatted_bids.append([f'Level {len(formatted_bids) + 1}', 'N/A', 'N/A', 'N/A'])
-
-        while len(formatted_asks) < depth:
-            formatted_asks.append([f'Level {len(formatted_asks) + 1}', 'N/A', 'N/A', 'N/A'])
-
-        data = [
-            [f'Level {i + 1}', formatted_bids[i][1], formatted_bids[i][2], formatted_bids[i][3], formatted_asks[i][1],
-             formatted_asks[i][2], formatted_asks[i][3]]
-            for i in range(depth)
-        ]
-
-        start_row = (list(order_books.keys()).index(f'binance_{normalized_pair}') * (depth + 4)) + 2
-        end_row = start_row + depth - 1
-
-        sheet.batch_clear([f'B{start_row}:H{end_row}'])
-        sheet.update(values=[[f'{normalized_pair.upper()} Aggregated Order Book']], range_name=f'A{start_row - 1}')
-        sheet.update(values=[['Level', 'Bid Price', 'Bid Quantity', 'Source', 'Ask Price', 'Ask Quantity', 'Source']],
-                     range_name=f'B{start_row - 1}')
-        sheet.update(values=data, range_name=f'B{start_row}:H{end_row}')
-
-        last_update_times[normalized_pair] = current_time
-        print(f"Aggregated order book for {normalized_pair} successfully pushed to Google Sheets.")
+    event = BookEvent(instrument.id, None, book, book_locks[instrument.id], time.monotonic())
+    bus.publish(BOOKS, instrument.id, event)
+
+
+def book_handler(sink):
+    """A bus handler passing book events to one sink, which reads the book under its lock."""
+    name = type(sink).__name__
+
+    def handle(event):
+        try:
+            metrics.delivering(event.applied)
+            with event.lock:
+                if event.exchange is None:
+                    sink.update_aggregated_book(event.key, event.book)
+                else:
+                    sink.update_book(event.key, event.book, event.exchange)
+        except Exception as e:
+            logger.exception("Error in %s for book %s: %s", name, event.key, e)
+            metrics.SINK_ERRORS.labels(name).inc()
+    return handle
+
+
+def subscribe_sinks():
+    """Subscribe every sink to book events, in order, with its own delivery policy; and the alert log to alerts."""
+    bus.clear()
+    for sink in sinks:
+        bus.subscribe(BOOKS, type(sink).__name__, book_handler(sink), sink.delivery, config.bus['queue_size'])
+    bus.subscribe(ALERTS, 'log_cross_alert', log_cross_alert, EVERY, config.bus['queue_size'])
+
+
+def publish_alert(alert):
+    bus.publish(ALERTS, alert.instrument, alert)
+
+
+def publish_analytics(key, analytics):
+    """Hand a book's analytics to every sink; called from the analytics thread."""
+    for sink in sinks:
+        try:
+            sink.update_analytics(key, analytics)
+        except Exception as e:
+            logger.exception("Error in %s.update_analytics for book %s: %s", type(sink).__name__, key, e)
+            metrics.SINK_ERRORS.labels(type(sink).__name__).inc()
 
-    except Exception as e:
-        print(f"Error in push_aggregated_data_to_spreadsheet: {e}")
+
+def log_cross_alert(alert):
+    if alert.event == OPENED:
+        logger.warning("%s crossed: buy %s on %s at %s, sell on %s at %s, net %.2f bps after fees.",
+                       alert.instrument, alert.quantity, alert.buy_venue, alert.ask, alert.sell_venue, alert.bid,
+                       alert.net_bps)
+    else:
+        logger.info("%s crossing from %s to %s closed after %.3fs (peak %.2f bps).",
+                    alert.instrument, alert.buy_venue, alert.sell_venue, alert.duration, alert.peak_bps)
+
+
+def apply_top_of_book(exchange, book_id, received, bids, asks):
+    """Apply one sharding worker's top levels for an exchange's book, then publish as usual."""
+    listing = registry.books[book_id]
+    metrics.received_at(received)
+    aggregate_books(listing, {'bids': bids, 'asks': asks}, snapshot=True)
+    publish(listing)
 
 
 def on_error(ws, error, exchange):
-    print(f"Error on {exchange}: {error}")
+    logger.error("Error on %s: %s", exchange, error)
+    metrics.ERRORS.labels(exchange, '').inc()
+
+
+def on_close(ws, exchange):
+    logger.info("WebSocket connection to %s closed", exchange)
+
+
+def invalidate_listing(listing):
+    """Withdraw one exchange's book for an instrument, so no sink keeps showing it.
+
+    The exchange's next snapshot for the pair rebuilds its layer of the consolidated book, and the
+    time until then is recorded in mdf_resync_seconds.
+    """
+    resyncing.setdefault(listing.id, time.perf_counter())
+    book = aggregated_books[listing.instrument.id]
+    if listing.venue in book.venues:
+        with book_locks[listing.instrument.id]:
+            book.clear_venue(listing.venue)
+        publish(listing)
+
 
+def invalidate_venue(exchange):
+    """Withdraw an exchange's books once its connection is down."""
+    for pair in config.exchanges[exchange]['pairs']:
+        invalidate_listing(registry.listing(exchange, pair))
 
-def on_close(ws, *args):
-    print(f"WebSocket closed")
+
+def on_resync(ws, exchange, symbol):
+    """An adapter dropped its book for a symbol to rebuild it from a new snapshot, on the same connection."""
+    listing = registry.symbols(exchange).get(symbol)
+    if listing is not None:
+        invalidate_listing(listing)
+
+
+def checkpoint_state():
+    """Every book's live venue layers, by instrument name, and each sink's own state; runs on the checkpoint thread."""
+    depth = config.checkpoint['depth']
+    books = {}
+    for instrument_id, book in list(aggregated_books.items()):
+        layers = checkpoint.capture(book, book_locks[instrument_id], depth)
+        if layers:
+            books[registry.books[instrument_id].name] = layers
+    states = {}
+    for sink in sinks:
+        state = sink.checkpoint()
+        if state is not None:
+            states[type(sink).__name__] = state
+    return {'books': books, 'sinks': states}
+
+
+def restore_checkpoint(state):
+    """Load a checkpoint's venue layers into the books and give each sink its saved state.
+
+    Only pairs still enabled are restored. Each layer is provisional until its exchange's first
+    snapshot replaces it; if its connection never comes up, the supervisor withdraws it like any
+    other once the feed goes stale. Returns the listings restored, for publishing once sinks start.
+    """
+    enabled = {}
+    for exchange, config_data in config.exchanges.items():
+        if config_data['enabled']:
+            for pair in config_data['pairs']:
+                listing = registry.listing(exchange, pair)
+                enabled[(exchange, listing.instrument.name)] = listing
+
+    restored = []
+    for name, layers in state['books'].items():
+        for venue, levels in layers.items():
+            listing = enabled.get((venue, name))
+            if listing is None:
+                continue
+            instrument = listing.instrument
+            book = aggregated_books[instrument.id]
+            with book_locks[instrument.id]:
+                book.restore_venue(venue, levels[BIDS], levels[ASKS])
+            restored.append(listing)
+
+    for sink in sinks:
+        sink_state = state['sinks'].get(type(sink).__name__)
+        if sink_state is not None:
+            try:
+                sink.restore(sink_state)
+            except Exception as e:
+                logger.exception("Could not restore %s from the checkpoint: %s", type(sink).__name__, e)
+    logger.info("Restored %d books from a checkpoint %.1fs old; each is provisional until its exchange resyncs.",
+                len(restored), time.time() - state['time'])
+    return restored
 
 
 def on_open(ws, exchange):
-    print(f"WebSocket connection opened to {exchange}")
+    logger.info("WebSocket connection opened to %s", exchange)
+
+
+def build_sinks(dry_run=False, online=True):
+    """Create the configured sinks. Nothing here touches the network: the spreadsheet is opened by
+    the sheet writer's thread once started, alongside the websocket connections.
+
+    Offline, the Sheets sink writes into a NullSpreadsheet. A dry run is offline and also leaves out
+    the sinks that write locally, so the whole pipeline runs without any output.
+    """
+    built = []
+    if config.arbitrage['enabled']:
+        # First, so crossings are caught before any other sink spends time on the update
+        built.append(CrossDetector(registry, config.arbitrage['fees_bps'], config.arbitrage['threshold_bps'],
+                                   on_alert=[publish_alert]))
+    analytics_rows = 0
+    if config.analytics['enabled']:
+        # Fill sizes by book ID, consolidated and per-exchange books alike, from their instrument's settings
+        sizes = {}
+        for book_id, book in registry.books.items():
+            instrument = getattr(book, 'instrument', book)
+            sizes[book_id] = config.analytics['sizes'].get(instrument.name, DEFAULT_SIZES)
+        analytics_rows = max(map(len, sizes.values()), default=0)
+        # Ahead of the writers, so that on shutdown its last tick still reaches the sinks stopped after it
+        built.append(AnalyticsSink(publish_analytics, sizes, depth=config.analytics['depth'],
+                                   interval=config.analytics['interval']))
+
+    if dry_run or not online:
+        built.append(GoogleSheetsSink(NullSpreadsheet(config.sheets['worksheet']), depth=depth,
+                                      update_interval=update_freq, max_rows=max_rows_per_sheet,
+                                      analytics_rows=analytics_rows))
+    else:
+        built.append(GoogleSheetsSink(depth=depth, update_interval=update_freq, max_rows=max_rows_per_sheet,
+                                      open_spreadsheet=lambda: open_spreadsheet(config.sheets['credentials'],
+                                                                                config.sheets['spreadsheet_key']),
+                                      worksheet=config.sheets['worksheet'], analytics_rows=analytics_rows))
+    if dry_run:
+        return built
+    if config.tick_store['enabled']:
+        built.append(TickStoreSink(config.tick_store['path'], depth=config.tick_store['depth']))
+    if config.shared_memory['enabled']:
+        built.append(SharedMemorySink(config.shared_memory['name'], list(config.exchanges),
+                                      depth=config.shared_memory['depth']))
+    return built
+
+
+def build_websockets(recorder=None, **binance_options):
+    """Create an adapter for every enabled exchange, wired to this module's handlers."""
+    websockets = {}
+
+    if config.exchanges['binance']['enabled']:
+        binance_pairs = config.exchanges['binance']['pairs']
+        websockets['binance'] = BinanceWebSocket(
+            symbols=binance_pairs,
+            on_message_callback=lambda ws, msg: on_message(ws, msg, 'binance'),
+            on_error_callback=lambda ws, err: on_error(ws, err, 'binance'),
+            on_close_callback=lambda ws: on_close(ws, 'binance'),
+            on_open_callback=lambda ws: on_open(ws, 'binance'),
+            on_resync_callback=lambda ws, symbol: on_resync(ws, 'binance', symbol),
+            recorder=recorder,
+            **binance_options
+        )
+
+    if config.exchanges['okx']['enabled']:
+        okx_pairs = config.exchanges['okx']['pairs']
+        websockets['okx'] = OKXWebSocket(
+            symbols=okx_pairs,
+            on_message_callback=lambda ws, msg: on_message(ws, msg, 'okx'),
+            on_error_callback=lambda ws, err: on_error(ws, err, 'okx'),
+            on_close_callback=lambda ws: on_close(ws, 'okx'),
+            on_open_callback=lambda ws: on_open(ws, 'okx'),
+            on_resync_callback=lambda ws, symbol: on_resync(ws, 'okx', symbol),
+            channels=config.exchanges['okx'].get('channels'),
+            recorder=recorder
+        )
+
+    if config.exchanges['kraken']['enabled']:
+        kraken_pairs = config.exchanges['kraken']['pairs']
+        websockets['kraken'] = KrakenWebSocket(
+            symbols=kraken_pairs,
+            on_message_callback=lambda ws, msg: on_message_kraken(ws, msg),  # Use dedicated Kraken handler
+            on_error_callback=lambda ws, err: on_error(ws, err, 'kraken'),
+            on_close_callback=lambda ws: on_close(ws, 'kraken'),
+            on_open_callback=lambda ws: on_open(ws, 'kraken'),
+            on_resync_callback=lambda ws, symbol: on_resync(ws, 'kraken', symbol),
+            recorder=recorder
+        )
+
+    if config.exchanges['coinbase']['enabled']:
+        websockets['coinbase'] = CoinbaseWebSocket(
+            symbols=config.exchanges['coinbase']['pairs'],
+            on_message_callback=lambda ws, msg: on_message(ws, msg, 'coinbase'),
+            on_error_callback=lambda ws, err: on_error(ws, err, 'coinbase'),
+            on_close_callback=lambda ws: on_close(ws, 'coinbase'),
+            on_open_callback=lambda ws: on_open(ws, 'coinbase'),
+            on_resync_callback=lambda ws, symbol: on_resync(ws, 'coinbase', symbol),
+            credentials_path=config.exchanges['coinbase'].get('credentials', 'coinbase_auth.json'),
+            recorder=recorder
+        )
+
+    return websockets
+
+
+def setup_logging(level=None, tag=None):
+    """Start the queued logging pipeline from config.logs; returns the listener to stop on exit."""
+    settings = config.logs
+    return log.setup(level or settings['level'], settings['rate_per_second'], settings['burst'],
+                     settings['category_limits'], settings['payload_sample_every'], tag=tag)
+
+
+def replay_session(path, speed=None, dry_run=False):
+    """Re-run a recorded session through the same adapters and handlers, without a network.
+
+    Binance REST snapshots are served from the recording and fetched inline, so a replay of
+    the same file always produces the same books. Sheets output goes nowhere; local sinks run
+    as configured unless dry_run.
+    """
+    sinks[:] = build_sinks(dry_run, online=False)
+    initialize_order_books()
+    subscribe_sinks()
+    for sink in sinks:
+        sink.start()
+    bus.start()
+    snapshots = RecordedSnapshots(path, 'binance')
+    websockets = build_websockets(fetch_snapshot=snapshots.fetch, threaded_snapshot=False)
+    socket = ReplaySocket()
+    handlers = {
+        exchange: (lambda frame, adapter=adapter: adapter.on_message(socket, frame))
+        for exchange, adapter in websockets.items()
+    }
+
+    frames, elapsed = replay(path, handlers, speed=speed)
+    logger.info("Replayed %d frames in %.2fs (%.0f frames/s)", frames, elapsed, frames / max(elapsed, 1e-9))
+    bus.stop()  # Delivers what is still queued before the sinks stop
+    for sink in sinks:
+        sink.stop()
+
+
+def run_threads(websockets):
+    """One websocket-client thread per exchange; the main thread supervises them until SIGINT or SIGTERM."""
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    Supervisor(websockets, config.connections, on_down=invalidate_venue).run(stop)
+
+
+def run_asyncio(websockets):
+    """Every exchange as a coroutine on one event loop, so books are only ever written from one thread."""
+    connections = {exchange: (ws, ws.ws_url) for exchange, ws in websockets.items()}
+    asyncio.run(async_runtime.run(connections, config.connections, on_down=invalidate_venue))
+
+
+def run_sharded(workers, dry_run=False):
+    """Connections in worker processes (see sharding.py); this process aggregates until SIGINT or SIGTERM."""
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    sharding.run(workers, apply_top_of_book, stop, assignment=config.sharding['assignment'], dry_run=dry_run,
+                 on_exit=invalidate_shard)
+
+
+def invalidate_shard(shard):
+    """Withdraw every book of a sharding worker whose process ended, until its replacement resyncs them."""
+    for exchange, config_data in shard.items():
+        if config_data['enabled']:
+            for pair in config_data['pairs']:
+                invalidate_listing(registry.listing(exchange, pair))
 
 
-def main():
+def main(runtime=None, workers=None, dry_run=False):
+    """Connect to every enabled exchange and feed the sinks until SIGINT or SIGTERM.
+
+    dry_run runs the whole feed -> book -> sink pipeline with sinks that write nowhere. Books are
+    restored from the last checkpoint, if there is a recent one, so output starts before the first
+    snapshot arrives; a dry run restores but never writes a checkpoint.
+    """
+    runtime = runtime or config.runtime
+    workers = config.sharding['workers'] if workers is None else workers
+    metrics_server = None
+    if config.metrics['enabled']:
+        metrics_server = metrics.serve(config.metrics['host'], config.metrics['port'])
+
+    if not sinks:  # Sharding workers install their own
+        sinks.extend(build_sinks(dry_run))
     initialize_order_books()
-    websockets = []
+    subscribe_sinks()
+    restored = []
+    if config.checkpoint['enabled']:
+        state = checkpoint.load(config.checkpoint['path'], config.checkpoint['max_age'])
+        if state is not None:
+            restored = restore_checkpoint(state)
+    for sink in sinks:
+        sink.start()  # Non-blocking; the spreadsheet is opened while the exchanges connect
+    bus.start()
+    for listing in restored:
+        publish(listing)
+
+    checkpointer = None
+    if config.checkpoint['enabled'] and not dry_run:
+        checkpointer = checkpoint.Checkpointer(config.checkpoint['path'], checkpoint_state, config.checkpoint['interval'])
+        checkpointer.start()
+
+    recorder = None
+    # Sharding workers record their own frames; a dry run records nothing
+    if config.recorder['enabled'] and not workers and not dry_run:
+        recorder = FrameRecorder(os.path.join(config.recorder['path'],
+                                              time.strftime('session-%Y%m%d-%H%M%S.frames.gz')))
+        recorder.start()
 
     try:
-        if config.exchanges['binance']['enabled']:
-            binance_pairs = config.exchanges['binance']['pairs']
-            binance_ws = BinanceWebSocket(
-                symbols=binance_pairs,
-                on_message_callback=lambda ws, msg: on_message(ws, msg, 'binance'),
-                on_error_callback=lambda ws, err: on_error(ws, err, 'binance'),
-                on_close_callback=lambda ws: on_close(ws),
-                on_open_callback=lambda ws: on_open(ws, 'binance')
-            )
-            binance_ws.start()
-            websockets.append(binance_ws)
-            print("Connected to Binance.")
-
-        if config.exchanges['okx']['enabled']:
-            okx_pairs = config.exchanges['okx']['pairs']
-            okx_ws = OKXWebSocket(
-                symbols=okx_pairs,
-                on_message_callback=lambda ws, msg: on_message(ws, msg, 'okx'),
-                on_error_callback=lambda ws, err: on_error(ws, err, 'okx'),
-                on_close_callback=lambda ws: on_close(ws),
-                on_open_callback=lambda ws: on_open(ws, 'okx')
-            )
-            okx_ws.start()
-            websockets.append(okx_ws)
-            print("Connected to OKX.")
-
-        if config.exchanges['kraken']['enabled']:
-            kraken_pairs = config.exchanges['kraken']['pairs']
-            kraken_ws = KrakenWebSocket(
-                symbols=kraken_pairs,
-                on_message_callback=lambda ws, msg: on_message_kraken(ws, msg),  # Use dedicated Kraken handler
-                on_error_callback=lambda ws, err: on_error(ws, err, 'kraken'),
-                on_close_callback=lambda ws: on_close(ws),
-                on_open_callback=lambda ws: on_open(ws, 'kraken')
-            )
-            kraken_ws.start()
-            websockets.append(kraken_ws)
-            print("Connected to Kraken.")
-
-        if config.exchanges['coinbase']['enabled']:
-            print("Starting Coinbase WebSocket...")
-            coinbase_connect()  # Start the Coinbase WebSocket connection
-            print("Connected to Coinbase.")
-
-        while True:
-            pass
-
-    except KeyboardInterrupt:
-        print("Terminating WebSocket connections...")
-        for ws in websockets:
-            ws.close()
+        if workers:
+            run_sharded(workers, dry_run)
+        elif runtime == 'asyncio':
+            run_asyncio(build_websockets(recorder))
+        else:
+            run_threads(build_websockets(recorder))
+    finally:
+        bus.stop()  # Delivers what is still queued before the sinks stop
+        for sink in sinks:
+            sink.stop()
+        if checkpointer:
+            checkpointer.stop()  # After the sinks, so the final checkpoint has the sheet as last written
+        if recorder:
+            recorder.stop()
+        if metrics_server:
+            metrics_server.shutdown()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Order book feeds to Google Sheets")
+    parser.add_argument('--replay', metavar='PATH', help="Replay a recorded session instead of connecting")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="Replay speed relative to real time (default: as fast as possible)")
+    parser.add_argument('--runtime', choices=('threads', 'asyncio'), default=None,
+                        help="Connection runtime (default: config.runtime)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Split pairs across this many worker processes (default: config.sharding['workers'])")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Run the full pipeline, but write to no Google Sheet, tick store or recording")
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'), default=None,
+                        help="Log level (default: config.logs['level'])")
+    args = parser.parse_args()
+
+    log_listener = setup_logging(args.log_level)
+    try:
+        if args.replay:
+            replay_session(args.replay, speed=args.speed, dry_run=args.dry_run)
+        else:
+            main(runtime=args.runtime, workers=args.workers, dry_run=args.dry_run)
+    finally:
+        log_listener.stop()
@@ -0,0 +1,248 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import log
+
+# Latency buckets in seconds, from sub-millisecond handler work up to Sheets flush intervals
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = log.get_logger('metrics')
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and three additions."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    """One named metric with a child per combination of label values.
+
+    Children are never locked: each is only written by the thread that owns its labels (an
+    exchange's socket thread, or the sheet writer) or under a lock of its own (a bus subscriber's
+    queue), and the GIL keeps the additions whole.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames, factory):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = labelnames
+        self.factory = factory
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, self.factory())
+        return child
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in list(self.children.items()):
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values)]
+            if self.kind in ('counter', 'gauge'):
+                lines.append(f"{self.name}{format_labels(labels)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = format_labels(labels + ['le="' + le + '"'])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {child.sum}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {child.count}")
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Registry:
+    def __init__(self):
+        self.families = []
+
+    def counter(self, name, documentation, labelnames=()):
+        family = MetricFamily(name, documentation, 'counter', labelnames, Counter)
+        self.families.append(family)
+        return family
+
+    def gauge(self, name, documentation, labelnames=()):
+        family = MetricFamily(name, documentation, 'gauge', labelnames, Gauge)
+        self.families.append(family)
+        return family
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        family = MetricFamily(name, documentation, 'histogram', labelnames, lambda: Histogram(buckets))
+        self.families.append(family)
+        return family
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for family in self.families:
+            family.render(lines)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+FRAMES = REGISTRY.counter('mdf_frames_total', "Websocket frames received", ('exchange',))
+MESSAGES = REGISTRY.counter('mdf_messages_total', "Book updates applied to the consolidated book",
+                            ('exchange', 'symbol'))
+ERRORS = REGISTRY.counter('mdf_errors_total', "Websocket and message handling errors; symbol is empty when not known",
+                          ('exchange', 'symbol'))
+RESYNCS = REGISTRY.counter('mdf_resyncs_total', "Local book rebuilds after a sequence gap or checksum mismatch",
+                           ('exchange', 'symbol'))
+SINK_ERRORS = REGISTRY.counter('mdf_sink_errors_total', "Exceptions raised by a sink", ('sink',))
+SHEET_WRITES = REGISTRY.counter('mdf_sheet_writes_total', "Google Sheets batch updates that carried changes to a book",
+                                ('exchange', 'symbol'))
+SHEET_RATE_LIMITED = REGISTRY.counter('mdf_sheet_rate_limited_total',
+                                      "Google Sheets batch updates rejected with 429, per book they carried",
+                                      ('exchange', 'symbol'))
+EVENT_TO_RECEIVE = REGISTRY.histogram('mdf_event_to_receive_seconds',
+                                      "Exchange event time (E/ts/timestamp) to frame receipt", ('exchange', 'symbol'))
+RECEIVE_TO_APPLIED = REGISTRY.histogram('mdf_receive_to_applied_seconds',
+                                        "Frame receipt to the consolidated book being updated", ('exchange', 'symbol'))
+APPLIED_TO_FLUSHED = REGISTRY.histogram('mdf_applied_to_flushed_seconds',
+                                        "Book update applied by the feed thread to a sink writing it out",
+                                        ('sink', 'exchange', 'symbol'))
+SHARD_CONFLATED = REGISTRY.counter('mdf_shard_conflated_total',
+                                   "Worker top-of-book updates superseded before the aggregator applied them",
+                                   ('exchange',))
+RECONNECTS = REGISTRY.counter('mdf_reconnects_total', "Connections restarted after closing or going stale",
+                              ('exchange', 'reason'))
+RESYNC_SECONDS = REGISTRY.histogram('mdf_resync_seconds',
+                                    "Connection loss to the exchange's book being rebuilt from a new snapshot",
+                                    ('exchange', 'symbol'))
+ANALYTICS_SECONDS = REGISTRY.histogram('mdf_analytics_seconds',
+                                       "Time to recompute analytics for the books changed since the last tick")
+CROSS_ALERTS = REGISTRY.counter('mdf_cross_alerts_total', "Cross-venue crossings opened and closed",
+                                ('symbol', 'event'))
+CROSS_DETECTION = REGISTRY.histogram('mdf_cross_detection_seconds',
+                                     "Frame receipt to the alert for the cross-venue crossing it opened", ('symbol',))
+BUS_DROPPED = REGISTRY.counter('mdf_bus_dropped_total', "Events dropped from a full subscriber queue",
+                               ('subscriber',))
+BUS_CONFLATED = REGISTRY.counter('mdf_bus_conflated_total',
+                                 "Events replaced by a newer one for the same book before delivery", ('subscriber',))
+BUS_QUEUE_DEPTH = REGISTRY.gauge('mdf_bus_queue_depth', "Events waiting in a subscriber queue", ('subscriber',))
+CHECKPOINT_SECONDS = REGISTRY.histogram('mdf_checkpoint_seconds', "Time to capture and write a book checkpoint")
+
+# perf_counter time of the latest frame from each exchange, for the connection watchdog (see supervisor.py)
+last_frame = {}
+
+# Receive times of the frame each thread is currently handling; adapters set them, main reads them
+_current = threading.local()
+
+
+def received(exchange):
+    """Called by an adapter as each frame arrives."""
+    FRAMES.labels(exchange).inc()
+    _current.wall = time.time()
+    _current.perf = last_frame[exchange] = time.perf_counter()
+
+
+def receive_time():
+    """Wall-clock receive time of the frame this thread is handling, to hand to another process."""
+    return getattr(_current, 'wall', None)
+
+
+def received_at(wall):
+    """Adopt a receive time from another process, so receive-to-applied includes the hand-off."""
+    if wall is None:
+        _current.perf = None
+        return
+    _current.wall = wall
+    _current.perf = time.perf_counter() - (time.time() - wall)
+
+
+def since_received():
+    """Seconds since this thread's current frame arrived, or None if it has no receive time."""
+    perf = getattr(_current, 'perf', None)
+    return None if perf is None else time.perf_counter() - perf
+
+
+def delivering(applied):
+    """Called before a sink handles a book event, with the time.monotonic() its update was applied at."""
+    _current.applied = applied
+
+
+def applied_time():
+    """time.monotonic() the book a sink is handling on this thread was applied at, or None outside a delivery."""
+    return getattr(_current, 'applied', None)
+
+
+def book_applied(exchange, symbol, event_time=None):
+    """Called once a frame's levels are in the consolidated book; event_time is in epoch seconds."""
+    MESSAGES.labels(exchange, symbol).inc()
+    perf = getattr(_current, 'perf', None)
+    if perf is None:
+        return
+    RECEIVE_TO_APPLIED.labels(exchange, symbol).observe(time.perf_counter() - perf)
+    if event_time:
+        # Clock skew between us and the exchange can make this slightly negative; that lands in the first bucket
+        EVENT_TO_RECEIVE.labels(exchange, symbol).observe(_current.wall - event_time)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the console
+
+
+def serve(host='127.0.0.1', port=9108):
+    """Serve /metrics from a daemon thread; returns the server so it can be shut down."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,262 @@
+from itertools import islice
+
+from sortedcontainers import SortedDict
+
+# Smallest price increment used when a venue does not tell us its tick size.
+# 1e-8 matches the 8 decimal places the aggregated sheet has always shown.
+DEFAULT_TICK_SIZE = 1e-8
+
+BIDS = 'bids'
+ASKS = 'asks'
+
+
+class BookSide:
+    """One side of an L2 book, kept sorted best price first.
+
+    Levels are stored in a SortedDict keyed by signed integer ticks (negated for bids),
+    so inserts, updates and deletes are O(log n) and reading the top N levels is O(N).
+    """
+    __slots__ = ('sign', 'levels')
+
+    def __init__(self, is_bid):
+        self.sign = -1 if is_bid else 1
+        self.levels = SortedDict()
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __contains__(self, ticks):
+        return self.sign * ticks in self.levels
+
+    def get(self, ticks, default=None):
+        return self.levels.get(self.sign * ticks, default)
+
+    def set(self, ticks, value):
+        self.levels[self.sign * ticks] = value
+
+    def discard(self, ticks):
+        self.levels.pop(self.sign * ticks, None)
+
+    def best(self):
+        """Return (ticks, value) for the best level, or None if the side is empty."""
+        if not self.levels:
+            return None
+        key, value = self.levels.peekitem(0)
+        return self.sign * key, value
+
+    def top(self, n):
+        """Return [(ticks, value), ...] for the best n levels."""
+        sign = self.sign
+        return [(sign * key, value) for key, value in islice(self.levels.items(), n)]
+
+    def truncate(self, depth):
+        """Drop every level beyond the best `depth` levels."""
+        levels = self.levels
+        while len(levels) > depth:
+            levels.popitem()
+
+    def clear(self):
+        self.levels.clear()
+
+
+class OrderBook:
+    """Price-level order book for a single venue and instrument.
+
+    Prices are converted to integer ticks once on the way in, so level lookups never
+    depend on float formatting and no side is ever re-sorted as a whole. A provisional book
+    holds levels restored from a checkpoint rather than received, until a snapshot replaces them.
+    """
+    __slots__ = ('tick_size', 'scale', 'bids', 'asks', 'provisional')
+
+    def __init__(self, tick_size=DEFAULT_TICK_SIZE):
+        self.tick_size = tick_size
+        # Dividing by an integer scale gives exact decimal prices back for 10^-k tick sizes
+        scale = 1 / tick_size
+        self.scale = round(scale) if abs(scale - round(scale)) < 1e-9 else scale
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.provisional = False
+
+    def side(self, name):
+        return self.bids if name == BIDS else self.asks
+
+    def to_ticks(self, price):
+        return int(round(float(price) * self.scale))
+
+    def to_price(self, ticks):
+        return ticks / self.scale
+
+    def update(self, side, price, quantity):
+        """Set the quantity at a price level; a zero quantity removes the level."""
+        # Hot path: the tick conversion and side lookup are inlined to avoid extra calls
+        book_side = self.bids if side == BIDS else self.asks
+        key = book_side.sign * int(round(float(price) * self.scale))
+        quantity = float(quantity)
+        if quantity > 0:
+            book_side.levels[key] = quantity
+        else:
+            book_side.levels.pop(key, None)
+
+    def apply(self, bids, asks):
+        """Apply [price, quantity, ...] level updates to both sides."""
+        for entry in bids:
+            self.update(BIDS, entry[0], entry[1])
+        for entry in asks:
+            self.update(ASKS, entry[0], entry[1])
+
+    def replace(self, bids, asks):
+        """Replace the whole book with a snapshot."""
+        self.clear()
+        self.apply(bids, asks)
+        self.provisional = False
+
+    def top(self, side, n):
+        """Return the best n levels of a side as [[price, quantity], ...]."""
+        to_price = self.to_price
+        return [[to_price(ticks), quantity] for ticks, quantity in self.side(side).top(n)]
+
+    def top_bids(self, n):
+        return self.top(BIDS, n)
+
+    def top_asks(self, n):
+        return self.top(ASKS, n)
+
+    def best_bid(self):
+        best = self.bids.best()
+        return None if best is None else [self.to_price(best[0]), best[1]]
+
+    def best_ask(self):
+        best = self.asks.best()
+        return None if best is None else [self.to_price(best[0]), best[1]]
+
+    def truncate(self, depth):
+        self.bids.truncate(depth)
+        self.asks.truncate(depth)
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+
+
+class AggregatedLevel:
+    """Quantity resting at one price across exchanges, broken down by exchange."""
+    __slots__ = ('quantity', 'quantities')
+
+    def __init__(self):
+        self.quantity = 0.0
+        self.quantities = {}
+
+    @property
+    def contributors(self):
+        return self.quantities.keys()
+
+    def set(self, venue, quantity):
+        self.quantities[venue] = quantity
+        # Re-summing a handful of venues avoids float drift from repeated += / -=
+        self.quantity = sum(self.quantities.values())
+
+    def discard(self, venue):
+        """Remove a venue's quantity; returns True once no venue quotes this level."""
+        if self.quantities.pop(venue, None) is not None:
+            self.quantity = sum(self.quantities.values())
+        return not self.quantities
+
+
+class ConsolidatedBook:
+    """Merged view over one OrderBook per exchange.
+
+    Each exchange only ever changes its own layer. A level update touches that layer and the
+    single consolidated level at the same price, so the merged book never has to be rebuilt.
+    """
+    __slots__ = ('tick_size', 'scale', 'bids', 'asks', 'venues')
+
+    def __init__(self, tick_size=DEFAULT_TICK_SIZE):
+        self.tick_size = tick_size
+        scale = 1 / tick_size
+        self.scale = round(scale) if abs(scale - round(scale)) < 1e-9 else scale
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.venues = {}
+
+    def side(self, name):
+        return self.bids if name == BIDS else self.asks
+
+    def to_ticks(self, price):
+        return int(round(float(price) * self.scale))
+
+    def to_price(self, ticks):
+        return ticks / self.scale
+
+    @property
+    def provisional(self):
+        """True while any exchange's layer still holds levels restored from a checkpoint."""
+        return any(layer.provisional for layer in self.venues.values())
+
+    def venue(self, venue):
+        """Return the per-exchange layer, creating it on first use."""
+        book = self.venues.get(venue)
+        if book is None:
+            book = self.venues[venue] = OrderBook(self.tick_size)
+        return book
+
+    def update_level(self, venue, side, price, quantity):
+        """Set one exchange's quantity at a price level; a zero quantity removes it."""
+        venue_side = self.venue(venue).side(side)
+        self._set(venue, venue_side, self.side(side), self.to_ticks(price), float(quantity))
+
+    def apply_venue(self, venue, bids, asks):
+        """Apply [price, quantity, ...] diffs from one exchange."""
+        venue_book = self.venue(venue)
+        scale = self.scale
+        _set = self._set
+        for entries, venue_side, merged_side in ((bids, venue_book.bids, self.bids),
+                                                 (asks, venue_book.asks, self.asks)):
+            for entry in entries:
+                _set(venue, venue_side, merged_side, int(round(float(entry[0]) * scale)), float(entry[1]))
+
+    def replace_venue(self, venue, bids, asks):
+        """Replace one exchange's layer with a snapshot, touching only the levels that differ."""
+        venue_book = self.venue(venue)
+        to_ticks = self.to_ticks
+        for entries, venue_side, merged_side in ((bids, venue_book.bids, self.bids),
+                                                 (asks, venue_book.asks, self.asks)):
+            incoming = {}
+            for entry in entries:
+                incoming[to_ticks(entry[0])] = float(entry[1])
+            stale = [ticks for ticks, _ in venue_side.top(len(venue_side)) if ticks not in incoming]
+            for ticks in stale:
+                self._set(venue, venue_side, merged_side, ticks, 0.0)
+            for ticks, quantity in incoming.items():
+                if venue_side.get(ticks) != quantity:
+                    self._set(venue, venue_side, merged_side, ticks, quantity)
+        venue_book.provisional = False
+
+    def restore_venue(self, venue, bids, asks):
+        """Load one exchange's layer from a checkpoint; it stays provisional until replace_venue() is next called."""
+        self.replace_venue(venue, bids, asks)
+        self.venues[venue].provisional = True
+
+    def clear_venue(self, venue):
+        """Withdraw one exchange's contribution from the consolidated book."""
+        self.replace_venue(venue, [], [])
+
+    @staticmethod
+    def _set(venue, venue_side, merged_side, ticks, quantity):
+        # Both sides share the same sign, so the signed key is computed once
+        key = merged_side.sign * ticks
+        merged_levels = merged_side.levels
+        level = merged_levels.get(key)
+        if quantity > 0:
+            venue_side.levels[key] = quantity
+            if level is None:
+                level = merged_levels[key] = AggregatedLevel()
+            level.set(venue, quantity)
+        else:
+            venue_side.levels.pop(key, None)
+            if level is not None and level.discard(venue):
+                del merged_levels[key]
+
+    def top_levels(self, side, n):
+        """Return the best n consolidated levels of a side as [(price, AggregatedLevel), ...]."""
+        to_price = self.to_price
+        return [(to_price(ticks), level) for ticks, level in self.side(side).top(n)]
@@ -0,0 +1,131 @@
+import gzip
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+
+# Each record: receive time (ns), tag length, frame length, then the tag and the raw frame bytes.
+# Tags are the exchange name for websocket frames, or "<exchange>/rest/<symbol>" for REST snapshots.
+RECORD_HEADER = struct.Struct('<qHI')
+
+
+class FrameRecorder:
+    """Writes every raw frame, tagged and timestamped on receipt, to a gzip-compressed log.
+
+    record() only timestamps the frame and puts it on a queue; compression and disk writes
+    happen on a background thread so the socket threads never wait on them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.frames = 0
+
+    def record(self, tag, frame):
+        self.queue.put((time.time_ns(), tag, frame))
+
+    def wrap_fetch(self, exchange, fetch_snapshot):
+        """Wrap a REST snapshot fetcher so every snapshot it returns is recorded too."""
+        def fetch(symbol):
+            snapshot = fetch_snapshot(symbol)
+            self.record(f"{exchange}/rest/{symbol}", json.dumps(snapshot))
+            return snapshot
+        return fetch
+
+    def run(self):
+        with gzip.open(self.path, 'ab', compresslevel=1) as f:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                ts_ns, tag, frame = item
+                tag_bytes = tag.encode()
+                frame_bytes = frame.encode() if isinstance(frame, str) else frame
+                f.write(RECORD_HEADER.pack(ts_ns, len(tag_bytes), len(frame_bytes)))
+                f.write(tag_bytes)
+                f.write(frame_bytes)
+                self.frames += 1
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join()
+
+
+def read_frames(path):
+    """Yield (ts_ns, tag, frame) from a recording, with frames decoded as text."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return  # End of file, or a record cut short by a crash
+            ts_ns, tag_length, frame_length = RECORD_HEADER.unpack(header)
+            tag = f.read(tag_length).decode()
+            frame = f.read(frame_length)
+            if len(frame) < frame_length:
+                return
+            yield ts_ns, tag, frame.decode()
+
+
+class RecordedSnapshots:
+    """Serves recorded REST snapshots back, in recorded order, in place of the live endpoint."""
+
+    def __init__(self, path, exchange):
+        prefix = f"{exchange}/rest/"
+        self.snapshots = defaultdict(deque)
+        for _, tag, frame in read_frames(path):
+            if tag.startswith(prefix):
+                self.snapshots[tag[len(prefix):]].append(json.loads(frame))
+
+    def fetch(self, symbol):
+        if not self.snapshots[symbol]:
+            raise LookupError(f"No more recorded snapshots for {symbol}")
+        return self.snapshots[symbol].popleft()
+
+
+class ReplaySocket:
+    """Stands in for the websocket during replay; anything an adapter sends is kept, not transmitted."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+def replay(path, handlers, speed=None):
+    """Feed recorded frames to handlers[tag](frame) in recorded order.
+
+    speed=None replays as fast as possible; otherwise frames are paced to the recorded
+    inter-arrival times divided by speed (1.0 = real time, 10.0 = ten times faster).
+    Frames whose tag has no handler, such as REST snapshots, are skipped.
+    Returns (frames replayed, elapsed seconds).
+    """
+    frames = 0
+    start = time.perf_counter()
+    first_ts = None
+    for ts_ns, tag, frame in read_frames(path):
+        handler = handlers.get(tag)
+        if handler is None:
+            continue
+        if speed:
+            if first_ts is None:
+                first_ts = ts_ns
+            delay = (ts_ns - first_ts) / 1e9 / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        handler(frame)
+        frames += 1
+    return frames, time.perf_counter() - start
@@ -0,0 +1,185 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+import config
+import log
+import metrics
+from bus import INLINE
+from sinks.base import Sink
+from supervisor import Backoff
+
+# Seconds the aggregator waits on the update queue before checking its workers
+POLL_INTERVAL = 0.5
+
+# Most queued updates the aggregator drains before applying what it has
+MAX_BATCH = 1000
+
+logger = log.get_logger('sharding')
+
+
+def assign(exchanges, workers, assignment=None):
+    """Split every enabled exchange's pairs across workers; returns one exchanges config per worker.
+
+    Pairs pinned in assignment ({exchange: {pair: worker}}, pairs spelled as in config.exchanges)
+    go to their worker; the rest are dealt out round-robin, in config order.
+    """
+    assignment = assignment or {}
+    shards = [{name: dict(settings, pairs=[]) for name, settings in exchanges.items()} for _ in range(workers)]
+    position = 0
+    for name, settings in exchanges.items():
+        if not settings['enabled']:
+            continue
+        pinned = assignment.get(name, {})
+        for pair in settings['pairs']:
+            if pair in pinned:
+                index = pinned[pair]
+                if not 0 <= index < workers:
+                    raise ValueError(f"{name} {pair} is assigned to worker {index}, but there are {workers} workers")
+            else:
+                index = position % workers
+                position += 1
+            shards[index][name]['pairs'].append(pair)
+
+    for shard in shards:
+        for settings in shard.values():
+            settings['enabled'] = settings['enabled'] and bool(settings['pairs'])
+    return shards
+
+
+class ShardSink(Sink):
+    """Worker-side sink: ships each venue book's top levels to the aggregator process.
+
+    An update is only sent when the top levels changed, so diffs deeper in the book cost no IPC.
+    """
+    delivery = INLINE
+
+    def __init__(self, updates, depth, index=0):
+        self.updates = updates
+        self.depth = depth
+        self.index = index  # This worker's, so the aggregator can tell whose updates are whose
+        self.last_sent = {}
+
+    def update_book(self, key, book, exchange):
+        top = (book.top_bids(self.depth), book.top_asks(self.depth))
+        if top == self.last_sent.get(key):
+            return
+        self.last_sent[key] = top
+        # key is the listing's book ID, which the aggregator's registry (built from the same config) shares
+        self.updates.put((self.index, exchange, key, metrics.receive_time(), top[0], top[1]))
+
+
+def run_worker(index, shard, updates, depth, log_level, dry_run=False):
+    """Worker process: connect to one shard's pairs and ship their books to the aggregator."""
+    # Under fork the parent's signal handlers come along; the worker installs its own in main
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    import main  # Imported here because main imports this module
+
+    log_listener = main.setup_logging(log_level, tag=f'shard-{index}')
+    try:
+        # This process's own copy of config, narrowed to the shard; venue books are published unaggregated
+        config.exchanges = shard
+        config.aggregation_enabled = False
+        if config.metrics['enabled']:
+            config.metrics = dict(config.metrics, port=config.metrics['port'] + 1 + index)
+        config.recorder = dict(config.recorder, path=os.path.join(config.recorder['path'], f'shard-{index}'))
+        config.checkpoint = dict(config.checkpoint, enabled=False)  # The aggregator checkpoints the books
+        main.sinks[:] = [ShardSink(updates, depth, index)]
+        # Under fork, the aggregator's resync timings come along; its books are replaced at startup
+        main.resyncing.clear()
+        main.main(workers=0, dry_run=dry_run)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_listener.stop()
+
+
+def describe(shard):
+    return ', '.join(f"{name} {'/'.join(settings['pairs'])}" for name, settings in shard.items() if settings['enabled'])
+
+
+def run(workers, apply, stop, depth=None, assignment=None, dry_run=False, on_exit=None):
+    """Run config.exchanges across worker processes and apply their updates in this one.
+
+    apply(exchange, book_id, received, bids, asks) is called on this thread for every top-of-book
+    update, with only the latest per book when updates queue up. Returns once the stop Event is set.
+
+    A worker whose process ends is restarted after a backoff delay (see supervisor.Backoff). Until
+    then, on_exit(shard), called with its exchanges config, can withdraw its books, and updates it
+    left in the queue are dropped.
+    """
+    depth = depth or config.sharding['depth']
+    shards = assign(config.exchanges, workers, assignment)
+    updates = multiprocessing.Queue()
+    log_level = logging.getLevelName(logging.getLogger(log.ROOT).getEffectiveLevel())
+
+    def start(index):
+        process = multiprocessing.Process(target=run_worker, name=f'shard-{index}',
+                                          args=(index, shards[index], updates, depth, log_level, dry_run), daemon=True)
+        process.start()
+        logger.info("Started shard-%d (pid %d): %s", index, process.pid, describe(shards[index]))
+        return process
+
+    # Workers left without pairs are not started
+    processes = {index: start(index) for index, shard in enumerate(shards) if describe(shard)}
+    started = {index: time.monotonic() for index in processes}
+    backoffs = {index: Backoff(config.connections['backoff_initial'], config.connections['backoff_max'])
+                for index in processes}
+    restart_at = {}  # Index -> monotonic time a worker that exited is started again
+    next_check = time.monotonic() + POLL_INTERVAL
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            if now >= next_check:
+                next_check = now + POLL_INTERVAL
+                for index, process in processes.items():
+                    if index in restart_at:
+                        if now >= restart_at[index]:
+                            del restart_at[index]
+                            processes[index] = start(index)
+                            started[index] = now
+                    elif not process.is_alive():
+                        backoff = backoffs[index]
+                        if now - started[index] > backoff.maximum:
+                            backoff.reset()  # It had been running fine, so this is a fresh failure
+                        delay = backoff.next()
+                        restart_at[index] = now + delay
+                        logger.error("shard-%d exited with code %s. Restarting in %.1fs.",
+                                     index, process.exitcode, delay)
+                        if on_exit:
+                            on_exit(shards[index])
+            try:
+                update = updates.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            # Each update is a whole top of book, so an older one for the same book can be skipped
+            batch = [update]
+            for _ in range(MAX_BATCH):
+                try:
+                    batch.append(updates.get_nowait())
+                except queue.Empty:
+                    break
+            latest = {}
+            for update in batch:
+                if update[0] in restart_at:
+                    continue  # Left behind by a worker that has since exited
+                if update[2] in latest:
+                    metrics.SHARD_CONFLATED.labels(update[1]).inc()
+                latest[update[2]] = update
+            for update in latest.values():
+                apply(*update[1:])
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        updates.cancel_join_thread()
@@ -0,0 +1,40 @@
+from bus import LATEST
+
+
+class Sink:
+    """Destination for order book output.
+
+    main registers every book once at startup, then calls update_book for per-exchange books
+    (when aggregation is disabled) and update_aggregated_book for consolidated books. Books are
+    keyed by their integer book ID from the instrument registry; name is for labelling output.
+
+    Updates arrive through main's bus according to `delivery`: by default on the sink's own thread
+    with only the newest state of each book (bus.LATEST). Sinks that must see every update, or are
+    cheap enough to, set bus.INLINE and are called on the feed thread, so must never block.
+    """
+    delivery = LATEST
+
+    def register(self, key, name, exchange=None, aggregated=False):
+        """Called once per book before any data arrives."""
+
+    def update_book(self, key, book, exchange):
+        """Publish one exchange's OrderBook for an instrument."""
+
+    def update_aggregated_book(self, key, book):
+        """Publish an instrument's ConsolidatedBook."""
+
+    def update_analytics(self, key, analytics):
+        """Publish an analytics.BookAnalytics for a book; called from the analytics thread."""
+
+    def checkpoint(self):
+        """JSON-serializable state to save with the books for a warm restart, or None; called from the checkpoint thread."""
+        return None
+
+    def restore(self, state):
+        """Take back what checkpoint() returned before the last shutdown; called before start()."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
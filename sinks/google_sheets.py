@@ -0,0 +1,580 @@
+import math
+import re
+import threading
+import time
+
+import log
+import metrics
+from order_book import BIDS, ASKS
+from sinks.base import Sink
+
+# Google Sheets allows 60 write requests per minute per user; one batch update is one request
+SHEETS_WRITE_QUOTA_PER_MINUTE = 60
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+# Seconds between attempts to open the spreadsheet when the first one fails
+CONNECT_RETRY_INTERVAL = 30
+
+logger = log.get_logger('sheets')
+
+CELL_PATTERN = re.compile(r'([A-Z]+)(\d+)')
+
+# Analytics table written beside a book's levels (see analytics.py): the book-wide values on its first
+# row, then one row per fill size
+ANALYTICS_HEADER = ['Mid', 'Spread', 'Spread (bps)', 'Microprice',
+                    'Fill Size', 'Buy VWAP', 'Buy Slippage (bps)', 'Sell VWAP', 'Sell Slippage (bps)']
+
+
+def column_index(letters):
+    """'A' -> 0, 'Z' -> 25, 'AA' -> 26."""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def column_letters(index):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA'."""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def split_range(range_name):
+    """Split 'Sheet2!B7:F11' into ('Sheet2!', 1, 7): the sheet prefix and the top-left column and row."""
+    prefix, _, cells = range_name.rpartition('!')
+    letters, row = CELL_PATTERN.match(cells).groups()
+    return (prefix + '!' if prefix else ''), column_index(letters), int(row)
+
+
+def changed_ranges(range_name, values, previous):
+    """Return [{'range', 'values'}] covering only the cells of `values` that differ from `previous`.
+
+    Changed cells are grouped into contiguous runs per row, so a grid where one price moved
+    becomes a single one-row range instead of a rewrite of the whole block.
+    """
+    if previous is None or len(previous) != len(values):
+        return [{'range': range_name, 'values': values}]
+
+    prefix, first_column, first_row = split_range(range_name)
+    updates = []
+    for row_offset, (row, old_row) in enumerate(zip(values, previous)):
+        if row == old_row:
+            continue
+        if len(row) != len(old_row):
+            runs = [(0, len(row))]
+        else:
+            runs = []
+            start = None
+            for column, (cell, old_cell) in enumerate(zip(row, old_row)):
+                if cell != old_cell:
+                    if start is None:
+                        start = column
+                elif start is not None:
+                    runs.append((start, column))
+                    start = None
+            if start is not None:
+                runs.append((start, len(row)))
+
+        sheet_row = first_row + row_offset
+        for start, end in runs:
+            first_cell = f'{column_letters(first_column + start)}{sheet_row}'
+            last_cell = f'{column_letters(first_column + end - 1)}{sheet_row}'
+            cells = first_cell if start == end - 1 else f'{first_cell}:{last_cell}'
+            updates.append({'range': f'{prefix}{cells}', 'values': [row[start:end]]})
+    return updates
+
+
+def open_spreadsheet(credentials_path, spreadsheet_key):
+    """Authorize with a service account and open a spreadsheet; both are blocking network calls."""
+    # Imported here so nothing that never talks to Sheets (dry runs, benchmarks, replays) pays for them
+    from oauth2client.service_account import ServiceAccountCredentials
+    import gspread
+
+    creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_path, SCOPE)
+    return gspread.authorize(creds).open_by_key(spreadsheet_key)
+
+
+class NullWorksheet:
+    def __init__(self, title):
+        self.title = title
+
+
+class NullSpreadsheet:
+    """Stands in for a gspread Spreadsheet and writes nowhere; batch updates are only counted."""
+
+    def __init__(self, title='Sheet1'):
+        self.sheet1 = NullWorksheet(title)
+        self.sheets = [self.sheet1]
+        self.batch_updates = 0
+
+    def worksheets(self):
+        return self.sheets
+
+    def add_worksheet(self, title, rows, cols):
+        self.sheets.append(NullWorksheet(title))
+        return self.sheets[-1]
+
+    def values_batch_update(self, body):
+        self.batch_updates += 1
+
+
+def is_rate_limited(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 429 or '429' in str(error)
+
+
+class TokenBucket:
+    """Token bucket that refills continuously up to `capacity` tokens."""
+
+    def __init__(self, capacity, refill_per_second, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def fill(self):
+        """Fraction of the bucket currently available, between 0 and 1."""
+        self.refill()
+        return self.tokens / self.capacity
+
+    def take(self, tokens=1):
+        self.refill()
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def drain(self):
+        self.refill()
+        self.tokens = 0
+
+
+class SheetBlock:
+    """Where one symbol's block lives: a title/header row followed by its data rows, and optionally
+    an analytics table to the right of them."""
+    __slots__ = ('worksheet', 'header_range', 'data_range', 'analytics_header_range', 'analytics_range')
+
+    def __init__(self, worksheet, header_range, data_range, analytics_header_range=None, analytics_range=None):
+        self.worksheet = worksheet
+        self.header_range = header_range
+        self.data_range = data_range
+        self.analytics_header_range = analytics_header_range
+        self.analytics_range = analytics_range
+
+
+class SheetLayout:
+    """Placement of every symbol's block, computed once at startup.
+
+    Blocks are stacked down a worksheet; once the next block would not fit in max_rows a new
+    worksheet is started ("Sheet1", "Sheet1 2", "Sheet1 3", ...). Lookups are a dict access and
+    ranges come pre-qualified with their worksheet title, so writes to any tab can share one
+    batch request.
+    """
+
+    def __init__(self, base_title='Sheet1', max_rows=1000):
+        self.base_title = base_title
+        self.max_rows = max_rows
+        self.blocks = {}
+        self.worksheets = [base_title]
+        self.next_row = 1
+        self.columns = 0  # Widest block, for sizing new worksheets
+
+    def add(self, key, data_rows, last_column, spacing=2, analytics_rows=0):
+        """Reserve a header row plus data_rows rows (columns A..last_column) for key, and with
+        analytics_rows an analytics table of that many rows one column further right."""
+        height = 1 + max(data_rows, analytics_rows) + spacing
+        if self.next_row + height - 1 > self.max_rows and self.next_row > 1:
+            self.worksheets.append(f"{self.base_title} {len(self.worksheets) + 1}")
+            self.next_row = 1
+
+        title = self.worksheets[-1]
+        header_row = self.next_row
+        first_data_row = header_row + 1
+        last_data_row = first_data_row + data_rows - 1
+        block = self.blocks[key] = SheetBlock(
+            title,
+            f"'{title}'!A{header_row}:{last_column}{header_row}",
+            f"'{title}'!B{first_data_row}:{last_column}{last_data_row}",
+        )
+        last_column_index = column_index(last_column)
+        if analytics_rows:
+            first = column_letters(last_column_index + 2)
+            last_column_index += 1 + len(ANALYTICS_HEADER)
+            last = column_letters(last_column_index)
+            block.analytics_header_range = f"'{title}'!{first}{header_row}:{last}{header_row}"
+            block.analytics_range = f"'{title}'!{first}{first_data_row}:{last}{first_data_row + analytics_rows - 1}"
+        self.columns = max(self.columns, last_column_index + 1)
+        self.next_row += height
+        return block
+
+    def get(self, key):
+        return self.blocks.get(key)
+
+    def ranges(self):
+        """Every range the layout writes to."""
+        return {range_name for block in self.blocks.values()
+                for range_name in (block.header_range, block.data_range, block.analytics_header_range,
+                                   block.analytics_range) if range_name}
+
+    def ensure_worksheets(self, spreadsheet, cols=10):
+        """Create any worksheet the layout spills onto that the spreadsheet doesn't have yet."""
+        existing = {worksheet.title for worksheet in spreadsheet.worksheets()}
+        for title in self.worksheets:
+            if title not in existing:
+                spreadsheet.add_worksheet(title=title, rows=self.max_rows, cols=max(cols, self.columns))
+                logger.info("Added worksheet '%s' for sheet layout.", title)
+
+
+class SheetWriter:
+    """Background writer that batches Google Sheets updates.
+
+    Feed handlers call submit(), which only records the latest values for a range and returns.
+    A single thread flushes everything pending with one batch update every update_interval
+    seconds, so socket threads never wait on the Sheets API and a burst of updates to the same
+    range costs a single write.
+
+    The writer keeps a shadow copy of the last grid it pushed per range and only sends cells
+    that changed. Writes draw from a token bucket sized to the Sheets write quota; as it runs
+    low (or after a 429) the flush interval stretches towards max_interval.
+
+    Without a spreadsheet, the writer thread first calls connect() (retrying until it succeeds)
+    and submits just accumulate until then, so opening the spreadsheet never holds up the feeds.
+    The first flush goes out as soon as the spreadsheet is open.
+    """
+
+    def __init__(self, spreadsheet, update_interval=10, write_quota_per_minute=SHEETS_WRITE_QUOTA_PER_MINUTE,
+                 max_interval=60, low_water=0.25, connect=None):
+        self.spreadsheet = spreadsheet
+        self.connect = connect
+        self.update_interval = update_interval
+        self.max_interval = max(max_interval, update_interval)
+        self.low_water = low_water
+        self.bucket = TokenBucket(write_quota_per_minute, write_quota_per_minute / 60)
+        self.pending = {}
+        self.pending_since = {}  # When the oldest unflushed values for each range were applied
+        self.range_books = {}  # (exchange, symbol) per range, for labelling metrics
+        self.shadow = {}
+        self.writes = 0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def submit(self, range_name, values, book=None, applied=None):
+        """Queue values for a range, replacing anything not yet flushed for it.
+
+        book is the (exchange, symbol) the range shows, and applied the time.monotonic() its update was
+        applied at; without one, latency is measured from now.
+        """
+        with self.lock:
+            self.pending[range_name] = values
+            self.pending_since.setdefault(range_name, time.monotonic() if applied is None else applied)
+            if book is not None:
+                self.range_books[range_name] = book
+
+    def next_interval(self):
+        """The flush interval, stretched linearly towards max_interval once the bucket is below low_water."""
+        fill = self.bucket.fill()
+        if fill >= self.low_water:
+            return self.update_interval
+        return self.update_interval + (self.max_interval - self.update_interval) * (1 - fill / self.low_water)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            since, self.pending_since = self.pending_since, {}
+
+        updates = []
+        books = set()
+        for range_name, values in pending.items():
+            changed = changed_ranges(range_name, values, self.shadow.get(range_name))
+            if changed:
+                updates.extend(changed)
+                books.add(self.book_labels(range_name))
+        if not updates:
+            self.observe_flushed(since)  # Nothing changed since the last write, so the sheet is current
+            return
+
+        if not self.bucket.take():
+            self.requeue(pending, since)
+            return
+
+        try:
+            # Ranges carry their worksheet title, so one request covers every tab
+            self.spreadsheet.values_batch_update({'valueInputOption': 'RAW', 'data': updates})
+            self.writes += 1
+            for book in books:
+                metrics.SHEET_WRITES.labels(*book).inc()
+            self.shadow.update(pending)
+            self.observe_flushed(since)
+        except Exception as e:
+            if is_rate_limited(e):
+                self.rate_limited += 1
+                for book in books:
+                    metrics.SHEET_RATE_LIMITED.labels(*book).inc()
+                self.bucket.drain()
+            logger.error("Exception during batched Google Sheet update (%d ranges): %s", len(updates), e)
+            self.requeue(pending, since)
+
+    def book_labels(self, range_name):
+        return self.range_books.get(range_name, ('', range_name))
+
+    def observe_flushed(self, since):
+        now = time.monotonic()
+        for range_name, applied in since.items():
+            metrics.APPLIED_TO_FLUSHED.labels('google_sheets', *self.book_labels(range_name)).observe(now - applied)
+
+    def requeue(self, pending, since):
+        with self.lock:
+            # Retry on the next flush, unless newer values arrived in the meantime
+            for range_name, values in pending.items():
+                self.pending.setdefault(range_name, values)
+            # Either way, those ranges have been waiting since their original submit
+            self.pending_since.update(since)
+
+    def wait_for_spreadsheet(self):
+        """Call connect() until it returns a spreadsheet; None if the writer is stopped first."""
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                spreadsheet = self.connect()
+            except Exception as e:
+                logger.error("Could not open the spreadsheet: %s. Retrying in %ds.", e, CONNECT_RETRY_INTERVAL)
+                self.stop_event.wait(CONNECT_RETRY_INTERVAL)
+                continue
+            logger.info("Spreadsheet opened in %.2fs.", time.monotonic() - started)
+            return spreadsheet
+        return None
+
+    def run(self):
+        if self.spreadsheet is None:
+            self.spreadsheet = self.wait_for_spreadsheet()
+            if self.spreadsheet is None:
+                logger.warning("Stopped before the spreadsheet was opened; %d ranges not written.", len(self.pending))
+                return
+        self.flush()
+        while not self.stop_event.wait(self.next_interval()):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+
+def exchange_code(exchange):
+    """Short source tag shown in the sheet, e.g. "Bi" for Binance, "Ok" for OKX."""
+    return exchange[:2].capitalize()
+
+
+class GoogleSheetsSink(Sink):
+    """Publishes order books to a Google Spreadsheet.
+
+    Each book gets a precomputed SheetLayout block; grids are prepared on the caller's thread and
+    handed to a SheetWriter, which batches and rate-limits the actual API calls.
+
+    Pass either an open spreadsheet, or open_spreadsheet() to have the writer thread open it after
+    start(); the layout then starts on the worksheet titled `worksheet`. With analytics_rows, every
+    block also gets an analytics table of that many rows beside its levels.
+
+    A book restored from a checkpoint is marked "(restored)" in its title row until live data replaces
+    it. The writer's shadow is checkpointed too, so after a restart only cells that differ are rewritten.
+    """
+
+    def __init__(self, spreadsheet=None, depth=5, update_interval=10, max_rows=1000, open_spreadsheet=None,
+                 worksheet='Sheet1', analytics_rows=0):
+        if spreadsheet is None and open_spreadsheet is None:
+            raise ValueError("GoogleSheetsSink needs a spreadsheet or open_spreadsheet")
+        self.spreadsheet = spreadsheet
+        self.open_spreadsheet = open_spreadsheet
+        self.depth = depth
+        self.analytics_rows = analytics_rows
+        self.layout = SheetLayout(base_title=spreadsheet.sheet1.title if spreadsheet else worksheet,
+                                  max_rows=max_rows)
+        self.writer = SheetWriter(spreadsheet, update_interval=update_interval, connect=self.connect)
+        self.headers_written = set()  # Analytics tables whose header row has been submitted
+        self.titles = {}  # Book key -> title last submitted in its header row
+        self.names = {}
+        self.books = {}  # Book key -> (exchange, symbol) for the writer's metrics
+
+    def register(self, key, name, exchange=None, aggregated=False):
+        self.names[key] = name
+        self.books[key] = ('aggregated' if aggregated else exchange, name)
+        if self.layout.get(key) is None:
+            if aggregated:
+                self.layout.add(key, self.depth, 'H', spacing=3, analytics_rows=self.analytics_rows)
+            else:
+                self.layout.add(key, self.depth, 'F', spacing=2, analytics_rows=self.analytics_rows)
+
+    def connect(self):
+        """Open the spreadsheet and add any worksheets the layout needs; runs on the writer thread."""
+        spreadsheet = self.open_spreadsheet()
+        self.layout.ensure_worksheets(spreadsheet)
+        self.spreadsheet = spreadsheet
+        return spreadsheet
+
+    def start(self):
+        if self.spreadsheet is not None:
+            self.layout.ensure_worksheets(self.spreadsheet)
+        self.writer.start()
+
+    def stop(self):
+        self.writer.stop()
+
+    def checkpoint(self):
+        # A copy of the dict is taken in one step, so the writer thread can carry on updating it
+        return {'shadow': dict(self.writer.shadow)}
+
+    def restore(self, state):
+        ranges = self.layout.ranges()
+        self.writer.shadow.update((range_name, values) for range_name, values in state['shadow'].items()
+                                  if range_name in ranges)
+
+    def update_book(self, key, book, exchange):
+        """Hand order book data to the background sheet writer; never blocks on the Sheets API."""
+        try:
+            depth = self.depth
+
+            bids = book.top_bids(depth)
+            asks = book.top_asks(depth)
+
+            # Prepare data for Google Sheets, padding missing levels so stale rows get overwritten
+            data = []
+            for i in range(depth):
+                bid = bids[i] if i < len(bids) else [None, None]
+                ask = asks[i] if i < len(asks) else [None, None]
+                data.append([f'Level {i + 1}', bid[0] or 'N/A', bid[1] or 'N/A', ask[0] or 'N/A', ask[1] or 'N/A'])
+
+            # Look up this symbol's precomputed block in the sheet
+            block = self.layout.get(key)
+            if block is None:
+                logger.error("No sheet layout block for book %s.", key)
+                return
+
+            # Write the header when the symbol is new, or when it goes from restored to live
+            name = self.names[key]
+            labels = self.books[key]
+            applied = metrics.applied_time()
+            title = f'{name.upper()} {exchange.upper()} Market Data'
+            if book.provisional:
+                title += ' (restored)'
+            if self.titles.get(key) != title:
+                self.writer.submit(block.header_range, [[
+                    title, 'Level', 'Bid Price', 'Bid Quantity', 'Ask Price', 'Ask Quantity'
+                ]], labels, applied)
+                self.titles[key] = title
+
+            # The writer only keeps the latest grid per range and flushes every update_interval seconds
+            self.writer.submit(block.data_range, data, labels, applied)
+
+        except Exception as e:
+            logger.exception("General exception in GoogleSheetsSink.update_book: %s", e)
+
+    def update_aggregated_book(self, key, book):
+        """Queue aggregated order book data for the background sheet writer."""
+        try:
+            depth = self.depth
+            bids = book.top_levels(BIDS, depth)
+            asks = book.top_levels(ASKS, depth)
+
+            formatted_bids = [
+                [
+                    f'Level {i + 1}',
+                    bid_price,  # Bid price
+                    bid_level.quantity,  # Bid quantity
+                    ', '.join(sorted(map(exchange_code, bid_level.contributors)))  # Data source(s)
+                ]
+                for i, (bid_price, bid_level) in enumerate(bids)
+            ]
+
+            formatted_asks = [
+                [
+                    f'Level {i + 1}',
+                    ask_price,  # Ask price
+                    ask_level.quantity,  # Ask quantity
+                    ', '.join(sorted(map(exchange_code, ask_level.contributors)))  # Data source(s)
+                ]
+                for i, (ask_price, ask_level) in enumerate(asks)
+            ]
+
+            while len(formatted_bids) < depth:
+                formatted_bids.append([f'Level {len(formatted_bids) + 1}', 'N/A', 'N/A', 'N/A'])
+
+            while len(formatted_asks) < depth:
+                formatted_asks.append([f'Level {len(formatted_asks) + 1}', 'N/A', 'N/A', 'N/A'])
+
+            data = [
+                [f'Level {i + 1}', formatted_bids[i][1], formatted_bids[i][2], formatted_bids[i][3],
+                 formatted_asks[i][1], formatted_asks[i][2], formatted_asks[i][3]]
+                for i in range(depth)
+            ]
+
+            block = self.layout.get(key)
+            if block is None:
+                logger.error("No sheet layout block for aggregated book %s.", key)
+                return
+
+            name = self.names[key]
+            labels = self.books[key]
+            applied = metrics.applied_time()
+            title = f'{name.upper()} Aggregated Order Book'
+            restored = [venue for venue, layer in book.venues.items() if layer.provisional]
+            if restored:
+                title += f" (restored: {', '.join(sorted(map(exchange_code, restored)))})"
+            if self.titles.get(key) != title:
+                self.writer.submit(block.header_range, [[
+                    title, 'Level', 'Bid Price', 'Bid Quantity', 'Source', 'Ask Price', 'Ask Quantity', 'Source'
+                ]], labels, applied)
+                self.titles[key] = title
+            # Every level is always written (padded with N/A), so the range never needs clearing first
+            self.writer.submit(block.data_range, data, labels, applied)
+
+        except Exception as e:
+            logger.exception("Error in GoogleSheetsSink.update_aggregated_book: %s", e)
+
+    def update_analytics(self, key, analytics):
+        """Queue a book's analytics table for the background sheet writer."""
+        block = self.layout.get(key)
+        if block is None or block.analytics_range is None:
+            return
+
+        def cell(value, digits=None):
+            if math.isnan(value):
+                return 'N/A'
+            return round(value, digits) if digits is not None else value
+
+        data = []
+        for i in range(self.analytics_rows):
+            if i == 0:
+                row = [cell(analytics.mid), cell(analytics.spread), cell(analytics.spread_bps, 2),
+                       cell(analytics.microprice)]
+            else:
+                row = ['', '', '', '']
+            if i < len(analytics.sizes):
+                row += [analytics.sizes[i], cell(analytics.buy_vwap[i]), cell(analytics.buy_slippage_bps[i], 2),
+                        cell(analytics.sell_vwap[i]), cell(analytics.sell_slippage_bps[i], 2)]
+            else:
+                row += ['', '', '', '', '']
+            data.append(row)
+
+        labels = self.books[key]
+        if ('analytics', key) not in self.headers_written:
+            self.writer.submit(block.analytics_header_range, [ANALYTICS_HEADER], labels)
+            self.headers_written.add(('analytics', key))
+        self.writer.submit(block.analytics_range, data, labels)
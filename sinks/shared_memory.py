@@ -0,0 +1,227 @@
+import struct
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from bus import INLINE
+from order_book import BIDS, ASKS
+from sinks.base import Sink
+
+# Region layout, all little-endian:
+#   header:    magic (8s) | version (u32) | depth (u32) | slots (u32) | venues (u32) | reserved (8 bytes)
+#   venues:    one 16-byte NUL-padded name per venue; bit i of a contributor mask is venue i
+#   directory: one 32-byte NUL-padded book name per slot (readers look books up by name)
+#   slots:     SLOT_SIZE bytes each, 64-byte aligned:
+#              seq (u8) | ts_ns (i8) | bid_count (u4) | ask_count (u4) | depth bid levels | depth ask levels
+#              level: price (f8) | quantity (f8) | contributor mask (u8)
+# seq is a seqlock: odd while the writer is inside the slot, bumped to the next even value once it is done.
+MAGIC = b'MDFSHM\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIII8x')
+VENUE_NAME = struct.Struct('16s')
+KEY_NAME = struct.Struct('32s')
+SEQ = struct.Struct('<Q')
+LEVEL_FIELDS = 3
+MAX_VENUES = 64
+
+BookSnapshot = namedtuple('BookSnapshot', 'seq ts_ns bids asks')  # Levels are (price, quantity, mask)
+
+
+def slot_body(depth):
+    """Everything in a slot after seq."""
+    return struct.Struct('<qII' + 'ddQ' * (2 * depth))
+
+
+def slot_size(depth):
+    return (SEQ.size + slot_body(depth).size + 63) // 64 * 64
+
+
+def slots_offset(venues, slots):
+    return (HEADER.size + VENUE_NAME.size * venues + KEY_NAME.size * slots + 63) // 64 * 64
+
+
+class SharedMemorySink(Sink):
+    """Publishes the top levels of every book into a shared memory region for local readers.
+
+    Each registered book owns a fixed slot, overwritten in place on every update, so a reader
+    on the same machine gets the current book with one memory copy (see SharedBookReader).
+    Books still holding levels restored from a checkpoint are not written until they are live.
+    """
+    delivery = INLINE
+
+    def __init__(self, name, venues, depth=10):
+        if len(venues) > MAX_VENUES:
+            raise ValueError(f"At most {MAX_VENUES} venues fit in a contributor mask")
+        self.name = name
+        self.venues = list(venues)
+        self.venue_bits = {venue: 1 << index for index, venue in enumerate(self.venues)}
+        self.depth = depth
+        self.body = slot_body(depth)
+        self.slot_size = slot_size(depth)
+        self.keys = {}  # Book ID -> name, in slot order
+        self.offsets = {}
+        self.seqs = {}
+        self.memory = None
+        self.buffer = None
+        self.empty_level = (float('nan'), 0.0, 0)
+        self.lock = threading.Lock()  # The seqlock allows one writer per slot; feed threads can share a pair
+
+    def register(self, key, name, exchange=None, aggregated=False):
+        if self.memory is not None:
+            raise RuntimeError(f"Book '{name}' registered after the shared memory region was created")
+        self.keys[key] = name
+
+    def start(self):
+        if self.memory is not None:
+            return
+        base = slots_offset(len(self.venues), len(self.keys))
+        size = base + self.slot_size * max(1, len(self.keys))
+        try:
+            self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a process that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        buffer = self.buffer = self.memory.buf
+
+        offset = HEADER.size
+        for venue in self.venues:
+            VENUE_NAME.pack_into(buffer, offset, venue.encode())
+            offset += VENUE_NAME.size
+        for index, (key, name) in enumerate(self.keys.items()):
+            KEY_NAME.pack_into(buffer, offset, name.encode())
+            offset += KEY_NAME.size
+            self.offsets[key] = base + index * self.slot_size
+            self.seqs[key] = 0
+        # Written last, so a reader that sees the magic sees a complete directory
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, self.depth, len(self.keys), len(self.venues))
+
+    def update_book(self, key, book, exchange):
+        if book.provisional:
+            return
+        mask = self.venue_bits.get(exchange, 0)
+        self.write(key, [(price, quantity, mask) for price, quantity in book.top_bids(self.depth)],
+                   [(price, quantity, mask) for price, quantity in book.top_asks(self.depth)])
+
+    def update_aggregated_book(self, key, book):
+        if book.provisional:
+            return
+        bits = self.venue_bits
+        self.write(key,
+                   [(price, level.quantity, sum(bits.get(venue, 0) for venue in level.quantities))
+                    for price, level in book.top_levels(BIDS, self.depth)],
+                   [(price, level.quantity, sum(bits.get(venue, 0) for venue in level.quantities))
+                    for price, level in book.top_levels(ASKS, self.depth)])
+
+    def write(self, key, bids, asks):
+        if self.memory is None:
+            self.start()  # Replays publish without start()
+        offset = self.offsets.get(key)
+        if offset is None:
+            return
+        values = [time.time_ns(), len(bids), len(asks)]
+        padding = [self.empty_level] * (self.depth - len(bids))
+        for level in bids + padding:
+            values.extend(level)
+        padding = [self.empty_level] * (self.depth - len(asks))
+        for level in asks + padding:
+            values.extend(level)
+
+        buffer = self.buffer
+        with self.lock:
+            seq = self.seqs[key]
+            SEQ.pack_into(buffer, offset, seq + 1)
+            self.body.pack_into(buffer, offset + SEQ.size, *values)
+            SEQ.pack_into(buffer, offset, seq + 2)
+            self.seqs[key] = seq + 2
+
+    def stop(self):
+        if self.memory is None:
+            return
+        # Readers still attached see the magic go away and know to reopen
+        HEADER.pack_into(self.buffer, 0, b'', 0, 0, 0, 0)
+        self.buffer = None
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+class SharedBookReader:
+    """Reads consistent book snapshots out of a region written by SharedMemorySink.
+
+        reader = SharedBookReader('mdf_books')
+        book = reader.read('btcusdt')
+        best_bid_price, best_bid_quantity, mask = book.bids[0]
+        reader.contributors(mask)  # ['binance', 'okx']
+    """
+
+    def __init__(self, name):
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 every attach is tracked, and the tracker would unlink the writer's region
+            # when this process exits
+            from multiprocessing import resource_tracker
+            self.memory = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.memory._name, 'shared_memory')
+        buffer = self.buffer = self.memory.buf
+
+        magic, version, self.depth, slots, venues = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Shared memory region '{name}' is not a version {VERSION} book region")
+        offset = HEADER.size
+        self.venues = []
+        for _ in range(venues):
+            self.venues.append(VENUE_NAME.unpack_from(buffer, offset)[0].rstrip(b'\x00').decode())
+            offset += VENUE_NAME.size
+        keys = []
+        for _ in range(slots):
+            keys.append(KEY_NAME.unpack_from(buffer, offset)[0].rstrip(b'\x00').decode())
+            offset += KEY_NAME.size
+
+        base = slots_offset(venues, slots)
+        size = slot_size(self.depth)
+        self.offsets = {key: base + index * size for index, key in enumerate(keys)}
+        self.body = slot_body(self.depth)
+
+    def keys(self):
+        return list(self.offsets)
+
+    def is_live(self):
+        """False once the writer has shut down; open a new reader to follow its next run."""
+        return bytes(self.buffer[:len(MAGIC)]) == MAGIC
+
+    def read(self, key):
+        """The latest snapshot of a book, or None if nothing has been written to it yet."""
+        offset = self.offsets[key]
+        buffer = self.buffer
+        start, end = offset + SEQ.size, offset + SEQ.size + self.body.size
+        while True:
+            seq = SEQ.unpack_from(buffer, offset)[0]
+            if seq & 1:
+                continue  # Writer is mid-update
+            data = bytes(buffer[start:end])
+            if SEQ.unpack_from(buffer, offset)[0] == seq:
+                break
+        if seq == 0:
+            return None
+
+        values = self.body.unpack(data)
+        ts_ns, bid_count, ask_count = values[:3]
+        depth = self.depth
+        bids = [values[3 + i * LEVEL_FIELDS:3 + (i + 1) * LEVEL_FIELDS] for i in range(bid_count)]
+        ask_start = 3 + depth * LEVEL_FIELDS
+        asks = [values[ask_start + i * LEVEL_FIELDS:ask_start + (i + 1) * LEVEL_FIELDS] for i in range(ask_count)]
+        return BookSnapshot(seq, ts_ns, bids, asks)
+
+    def contributors(self, mask):
+        """Venue names for a level's contributor mask."""
+        return [venue for index, venue in enumerate(self.venues) if mask >> index & 1]
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
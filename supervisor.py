@@ -0,0 +1,142 @@
+import random
+import time
+
+import log
+import metrics
+
+# Seconds without a frame before a feed counts as stalled, for exchanges config.connections doesn't list
+DEFAULT_STALE_AFTER = 30
+
+# Feed.check() results
+LIVE = 'live'
+PING = 'ping'
+STALE = 'stale'
+
+logger = log.get_logger('supervisor')
+
+
+class Backoff:
+    """Exponential backoff with jitter: each delay is drawn from the upper half of a cap that
+    doubles with every failure, so connections dropped together don't all come back at once."""
+
+    def __init__(self, initial=0.5, maximum=30.0, factor=2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.failures = 0
+
+    def next(self):
+        cap = min(self.maximum, self.initial * self.factor ** self.failures)
+        self.failures += 1
+        return cap * random.uniform(0.5, 1.0)
+
+    def reset(self):
+        self.failures = 0
+
+
+class Feed:
+    """Liveness and reconnect schedule of one exchange connection, for either runtime.
+
+    Liveness comes from the time of the exchange's latest frame (metrics.last_frame), heartbeats
+    included. Once a feed has been quiet for half of stale_after, check() asks for one ping, which
+    adapters with an application-level ping answer with a frame of their own.
+    """
+
+    def __init__(self, exchange, settings, on_down=None):
+        self.exchange = exchange
+        self.stale_after = settings['stale_after'].get(exchange, DEFAULT_STALE_AFTER)
+        self.backoff = Backoff(settings['backoff_initial'], settings['backoff_max'])
+        self.on_down = on_down
+        self.connected_at = 0.0
+        self.pinged = False
+
+    def connected(self):
+        """Called as a connection is opened; a new connection gets stale_after to send its first frame."""
+        self.connected_at = time.perf_counter()
+        self.pinged = False
+
+    def check(self):
+        """STALE, PING, LIVE once the connection has delivered frames, or None while it hasn't yet."""
+        last_frame = metrics.last_frame.get(self.exchange, 0.0)
+        quiet = time.perf_counter() - max(last_frame, self.connected_at)
+        if quiet > self.stale_after:
+            return STALE
+        if quiet > self.stale_after / 2:
+            if not self.pinged:
+                self.pinged = True
+                return PING
+        else:
+            self.pinged = False
+        if last_frame > self.connected_at:
+            self.backoff.reset()
+            return LIVE
+        return None
+
+    def down(self, reason):
+        """Record a lost connection and tell on_down(exchange); returns the seconds to wait before reconnecting."""
+        metrics.RECONNECTS.labels(self.exchange, reason).inc()
+        if self.on_down:
+            self.on_down(self.exchange)
+        delay = self.backoff.next()
+        logger.warning("%s connection %s. Reconnecting in %.1fs.", self.exchange, reason, delay)
+        return delay
+
+
+class Supervisor:
+    """Keeps every connection of the threads runtime up, checking them from the calling thread.
+
+    A connection whose thread has ended, or whose feed went stale, is closed, reported to
+    on_down(exchange) and started again after its backoff delay.
+    """
+
+    def __init__(self, websockets, settings, on_down=None):
+        self.websockets = websockets
+        self.check_interval = settings['check_interval']
+        self.feeds = {exchange: Feed(exchange, settings, on_down) for exchange in websockets}
+        self.reconnect_at = {}  # Exchange -> perf_counter time of its next connection attempt
+
+    def run(self, stop):
+        """Start every connection and supervise them until the stop Event is set."""
+        try:
+            for exchange in self.websockets:
+                self.connect(exchange)
+            while not stop.wait(self.check_interval):
+                self.check()
+        finally:
+            logger.info("Terminating WebSocket connections...")
+            for ws in self.websockets.values():
+                ws.close()
+
+    def connect(self, exchange):
+        self.feeds[exchange].connected()
+        self.websockets[exchange].start()
+        logger.info("Connecting to %s.", exchange)
+
+    def check(self):
+        now = time.perf_counter()
+        for exchange, ws in self.websockets.items():
+            reconnect_at = self.reconnect_at.get(exchange)
+            if reconnect_at is not None:
+                if now >= reconnect_at:
+                    del self.reconnect_at[exchange]
+                    self.connect(exchange)
+                continue
+
+            feed = self.feeds[exchange]
+            if not ws.thread.is_alive():
+                self.restart(exchange, 'closed')
+                continue
+            state = feed.check()
+            if state == STALE:
+                logger.warning("No frames from %s for %ss.", exchange, feed.stale_after)
+                self.restart(exchange, 'stale')
+            elif state == PING and hasattr(ws, 'ping'):
+                try:
+                    ws.ping(ws.ws)
+                except Exception as e:
+                    logger.debug("Could not ping %s: %s", exchange, e)
+
+    def restart(self, exchange, reason):
+        # Closing joins the connection's thread, so on_down never races its last messages
+        self.websockets[exchange].close()
+        self.reconnect_at[exchange] = time.perf_counter() + self.feeds[exchange].down(reason)
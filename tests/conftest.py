@@ -0,0 +1,18 @@
+import json
+
+import pytest
+
+
+class FakeSocket:
+    """Stands in for a websocket connection, keeping what an adapter sends as decoded JSON."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+@pytest.fixture
+def socket():
+    return FakeSocket()
@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pytest
+
+from analytics import AnalyticsSink, fill_prices
+from order_book import ConsolidatedBook, OrderBook
+from sinks.google_sheets import GoogleSheetsSink, NullSpreadsheet
+
+BIDS = [[100.0, 1.0], [99.0, 2.0], [98.0, 3.0]]
+ASKS = [[101.0, 3.0], [102.0, 2.0], [103.0, 1.0]]
+MID = 100.5
+
+
+def analytics_for(book, sizes=(1, 4, 6, 7), depth=10, aggregated=True):
+    published = []
+    sink = AnalyticsSink(lambda key, analytics: published.append(analytics), {0: sizes}, depth=depth)
+    sink.register(0, 'btcusdt', aggregated=aggregated)
+    if aggregated:
+        sink.update_aggregated_book(0, book)
+    else:
+        sink.update_book(0, book, 'binance')
+    sink.tick()
+    return published
+
+
+def consolidated():
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', BIDS[:2], ASKS[:1])
+    book.apply_venue('okx', BIDS[2:], ASKS[1:])
+    return book
+
+
+def test_vwap_and_slippage_walk_the_book():
+    [analytics] = analytics_for(consolidated())
+    # Buying 4 takes 3 at 101 and 1 at 102; selling 4 takes 1 at 100, 2 at 99 and 1 at 98
+    assert analytics.buy_vwap[:3] == pytest.approx((101.0, 405 / 4, 610 / 6))
+    assert analytics.sell_vwap[:3] == pytest.approx((100.0, 396 / 4, 592 / 6))
+    assert analytics.buy_slippage_bps[1] == pytest.approx((405 / 4 - MID) / MID * 1e4)
+    assert analytics.sell_slippage_bps[1] == pytest.approx((MID - 396 / 4) / MID * 1e4)
+    assert analytics.mid == MID and analytics.spread == 1.0
+    assert analytics.spread_bps == pytest.approx(1.0 / MID * 1e4)
+
+
+def test_sizes_past_the_tracked_depth_are_nan():
+    [analytics] = analytics_for(consolidated())
+    assert math.isnan(analytics.buy_vwap[3]) and math.isnan(analytics.sell_slippage_bps[3])
+    # Only two levels tracked: 5 on the ask side, 3 on the bid side
+    [analytics] = analytics_for(consolidated(), depth=2)
+    assert analytics.buy_vwap[1] == pytest.approx(405 / 4) and math.isnan(analytics.buy_vwap[2])
+    assert math.isnan(analytics.sell_vwap[1])
+
+
+def test_microprice_leans_towards_the_thinner_side():
+    [analytics] = analytics_for(consolidated())
+    # 1 bid against 3 offered at the touch: the price is more likely to tick down towards the bid
+    assert analytics.microprice == pytest.approx((100.0 * 3 + 101.0 * 1) / 4)
+
+
+def test_venue_book_and_empty_side():
+    book = OrderBook(0.01)
+    book.replace(BIDS, [])
+    [analytics] = analytics_for(book, sizes=(1,), aggregated=False)
+    assert analytics.best_bid == 100.0 and math.isnan(analytics.best_ask) and math.isnan(analytics.mid)
+    assert analytics.sell_vwap == (100.0,) and math.isnan(analytics.buy_vwap[0])
+
+
+def test_restored_books_are_skipped():
+    book = consolidated()
+    book.restore_venue('kraken', [[100.0, 1.0]], [])
+    assert analytics_for(book) == []
+
+
+def test_fill_prices_for_several_books_at_once():
+    prices = np.array([[101.0, 102.0, 0.0], [10.0, 11.0, 12.0]])
+    quantities = np.array([[1.0, 1.0, 0.0], [5.0, 5.0, 5.0]])
+    vwap = fill_prices(prices, quantities, np.array([2, 3]), np.array([[2.0, 3.0], [10.0, 15.0]]))
+    assert vwap[0, 0] == pytest.approx(101.5) and math.isnan(vwap[0, 1])
+    assert vwap[1].tolist() == pytest.approx([10.5, 11.0])
+
+
+def test_sheet_shows_unfillable_sizes_as_na():
+    [analytics] = analytics_for(consolidated())
+    sheet = GoogleSheetsSink(NullSpreadsheet('Sheet1'), analytics_rows=4)
+    sheet.register(0, 'btcusdt', aggregated=True)
+    sheet.update_analytics(0, analytics)
+    rows = sheet.writer.pending[sheet.layout.get(0).analytics_range]
+    assert rows[3][4:] == [7, 'N/A', 'N/A', 'N/A', 'N/A']
+    assert rows[1][4:6] == [4, 101.25]
@@ -0,0 +1,64 @@
+import json
+
+from decoders import decode_binance
+from exchanges.binance import BinanceBookManager
+
+
+def diff(first, final, bids=(), asks=()):
+    return decode_binance(json.dumps({"e": "depthUpdate", "E": 1000, "s": "BTCUSDT", "U": first, "u": final,
+                                      "b": [list(level) for level in bids], "a": [list(level) for level in asks]}))
+
+
+class Snapshots:
+    """Hands out the queued snapshots in order, recording each fetch."""
+
+    def __init__(self, *last_update_ids):
+        self.queue = list(last_update_ids)
+        self.fetched = []
+
+    def __call__(self, symbol):
+        last_update_id = self.queue.pop(0)
+        self.fetched.append(last_update_id)
+        return {'lastUpdateId': last_update_id, 'bids': [["100", "1"]], 'asks': [["101", "1"]]}
+
+
+def manager(snapshots, updates=None, resyncs=None):
+    updates = [] if updates is None else updates
+    return BinanceBookManager('btcusdt', lambda *update: updates.append(update), fetch_snapshot=snapshots,
+                              threaded_snapshot=False,
+                              on_resync=None if resyncs is None else resyncs.append)
+
+
+def test_snapshot_older_than_buffered_diffs_is_refetched():
+    snapshots, updates = Snapshots(5, 12), []
+    book = manager(snapshots, updates)
+    book.process(diff(10, 11))
+    assert not book.synced and snapshots.fetched == [5, 12]  # The newer snapshot is used on the next diff
+    book.process(diff(12, 13, bids=[("100", "3")]))
+    assert book.synced and snapshots.fetched == [5, 12]
+    assert book.last_update_id == 13
+    assert [update[3] for update in updates] == [True, False]
+
+
+def test_diffs_contained_in_snapshot_are_dropped_and_first_diff_may_straddle():
+    snapshots, updates = Snapshots(11), []
+    book = manager(snapshots, updates)
+    book.process(diff(8, 10, bids=[("99", "5")]))
+    book.process(diff(11, 13, bids=[("100", "2")]))
+    book.process(diff(14, 14, asks=[("101", "0")]))
+    assert book.synced and book.last_update_id == 14
+    assert [update[3] for update in updates] == [True, False, False]
+    assert book.book.asks.top(5) == []
+    book.process(diff(12, 13))
+    assert book.last_update_id == 14 and len(updates) == 3
+
+
+def test_gap_resyncs_from_a_new_snapshot():
+    snapshots, updates, resyncs = Snapshots(10, 20), [], []
+    book = manager(snapshots, updates, resyncs)
+    book.process(diff(10, 11))
+    assert book.synced and book.last_update_id == 11
+    book.process(diff(15, 21, bids=[("98", "1")]))
+    assert resyncs == ['BTCUSDT'] and book.resyncs == 1
+    assert snapshots.fetched == [10, 20]
+    assert book.synced and book.last_update_id == 21
@@ -0,0 +1,76 @@
+import threading
+
+import metrics
+from bus import EVERY, INLINE, LATEST, Bus, Subscription
+
+
+def test_latest_keeps_one_pending_event_per_key():
+    subscription = Subscription('test-latest', None, LATEST, maxsize=10)
+    for version in range(5):
+        subscription.offer('btcusdt', ('btcusdt', version))
+        subscription.offer('ethusdt', ('ethusdt', version))
+    assert list(subscription.pending.values()) == [('btcusdt', 4), ('ethusdt', 4)]
+    assert metrics.BUS_CONFLATED.labels('test-latest').value == 8
+    assert metrics.BUS_QUEUE_DEPTH.labels('test-latest').value == 2
+
+
+def test_latest_drops_the_oldest_key_when_full():
+    subscription = Subscription('test-latest-full', None, LATEST, maxsize=2)
+    for key in ('a', 'b', 'c'):
+        subscription.offer(key, key)
+    subscription.offer('b', 'b2')
+    assert list(subscription.pending.items()) == [('b', 'b2'), ('c', 'c')]
+    assert metrics.BUS_DROPPED.labels('test-latest-full').value == 1
+    assert metrics.BUS_CONFLATED.labels('test-latest-full').value == 1
+
+
+def test_every_delivers_in_order_and_drops_the_oldest_when_full():
+    delivered = []
+    subscription = Subscription('test-every', delivered.append, EVERY, maxsize=3)
+    for event in range(5):
+        subscription.offer('btcusdt', event)
+    assert metrics.BUS_DROPPED.labels('test-every').value == 2
+    subscription.start()
+    subscription.stop()
+    assert delivered == [2, 3, 4]
+
+
+def test_queued_subscriber_is_delivered_on_its_own_thread():
+    threads = []
+    bus = Bus()
+    bus.subscribe('books', 'test-thread', lambda event: threads.append(threading.current_thread().name), LATEST)
+    bus.start()
+    bus.publish('books', 'btcusdt', 1)
+    bus.stop()
+    assert threads == ['bus-test-thread']
+
+
+def test_inline_subscriber_errors_do_not_reach_the_publisher_or_other_subscribers():
+    delivered = []
+
+    def fail(event):
+        raise RuntimeError("broken sink")
+
+    bus = Bus()
+    bus.subscribe('books', 'test-inline-failing', fail, INLINE)
+    bus.subscribe('books', 'test-inline', delivered.append, INLINE)
+    bus.publish('books', 'btcusdt', 1)
+    bus.publish('books', 'btcusdt', 2)
+    assert delivered == [1, 2]
+
+
+def test_queued_subscriber_errors_do_not_stop_delivery():
+    delivered = []
+
+    def handle(event):
+        if event == 1:
+            raise RuntimeError("bad event")
+        delivered.append(event)
+
+    bus = Bus()
+    bus.subscribe('alerts', 'test-every-failing', handle, EVERY)
+    for event in range(3):
+        bus.publish('alerts', event, event)
+    bus.start()
+    bus.stop()
+    assert delivered == [0, 2]
@@ -0,0 +1,76 @@
+import gzip
+import json
+import os
+import time
+
+import checkpoint
+import config
+import main
+from order_book import ASKS, BIDS
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'checkpoints' / 'books.json.gz')
+    state = {'books': {'btcusdt': {'binance': {'bids': [[100.0, 1.0]], 'asks': [[101.0, 2.0]]}}}, 'sinks': {}}
+    checkpoint.save(path, {'books': {}, 'sinks': {}})
+    checkpoint.save(path, state)  # Replaces the first one whole
+    loaded = checkpoint.load(path)
+    assert loaded['books'] == state['books'] and loaded['sinks'] == {}
+    assert loaded['version'] == checkpoint.VERSION
+    assert os.listdir(tmp_path / 'checkpoints') == ['books.json.gz']  # No temporary file left behind
+
+
+def write(path, state):
+    with gzip.open(path, 'wb') as f:
+        f.write(json.dumps(state).encode())
+
+
+def test_load_rejects_checkpoints_past_max_age(tmp_path):
+    path = str(tmp_path / 'books.json.gz')
+    write(path, {'books': {}, 'sinks': {}, 'version': checkpoint.VERSION, 'time': time.time() - 700})
+    assert checkpoint.load(path, max_age=600) is None
+    assert checkpoint.load(path, max_age=800) is not None
+
+
+def test_load_ignores_missing_corrupt_and_other_version_checkpoints(tmp_path):
+    path = str(tmp_path / 'books.json.gz')
+    assert checkpoint.load(path) is None
+    with open(path, 'wb') as f:
+        f.write(b'not gzip at all')
+    assert checkpoint.load(path) is None
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(b'{"books": {}, "sinks": {}}')[:-6])  # Cut short, as by a crash mid-write
+    assert checkpoint.load(path) is None
+    write(path, {'books': {}, 'sinks': {}, 'version': checkpoint.VERSION + 1, 'time': time.time()})
+    assert checkpoint.load(path) is None
+
+
+def test_restored_layers_are_provisional_until_the_first_snapshot(monkeypatch):
+    monkeypatch.setattr(main, 'sinks', [])
+    main.create_books()
+    listing = main.registry.listing('binance', 'btcusdt')
+    main.aggregate_books(listing, {BIDS: [[100.0, 1.0]], ASKS: [[101.0, 2.0]]}, snapshot=True)
+    state = dict(main.checkpoint_state(), time=time.time())
+    assert state['books'] == {'btcusdt': {'binance': {BIDS: [[100.0, 1.0]], ASKS: [[101.0, 2.0]]}}}
+
+    main.create_books()
+    assert main.restore_checkpoint(state) == [listing]
+    book = main.aggregated_books[listing.instrument.id]
+    assert book.provisional and book.venue('binance').provisional
+    assert book.venue('binance').top_bids(5) == [[100.0, 1.0]]
+    assert main.checkpoint_state()['books'] == {}  # Restored levels are never saved again
+
+    main.aggregate_books(listing, {BIDS: [[100.5, 1.0]], ASKS: [[101.0, 1.0]]}, snapshot=False)
+    assert book.provisional  # A diff does not make a restored layer live
+    main.aggregate_books(listing, {BIDS: [[100.5, 3.0]], ASKS: [[101.5, 1.0]]}, snapshot=True)
+    assert not book.provisional
+    assert book.venue('binance').top_bids(5) == [[100.5, 3.0]]
+
+
+def test_restore_skips_pairs_no_longer_enabled(monkeypatch):
+    monkeypatch.setattr(main, 'sinks', [])
+    monkeypatch.setitem(config.exchanges, 'binance', dict(config.exchanges['binance'], enabled=False))
+    main.create_books()
+    state = {'books': {'btcusdt': {'binance': {BIDS: [[100.0, 1.0]], ASKS: []}}}, 'sinks': {}, 'time': time.time()}
+    assert main.restore_checkpoint(state) == []
+    assert not main.aggregated_books[main.registry.listing('binance', 'btcusdt').instrument.id].venues
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from exchanges.coinbase import PUBLIC_CHANNEL, CoinbaseBook, CoinbaseWebSocket
+
+
+def snapshot(product_id='BTC-USDT'):
+    return json.dumps({"type": "snapshot", "product_id": product_id,
+                       "bids": [["100.00", "1.5"], ["99.50", "2"]], "asks": [["100.50", "1"], ["101.00", "3"]]})
+
+
+def l2update(*changes, product_id='BTC-USDT'):
+    return json.dumps({"type": "l2update", "product_id": product_id, "time": "2024-01-02T03:04:05.250000Z",
+                       "changes": [list(change) for change in changes]})
+
+
+def test_snapshot_then_changes():
+    book = CoinbaseBook('BTC-USDT')
+    assert not book.ready
+    book.apply_snapshot([["100.00", "1.5"], ["99.50", "2"]], [["100.50", "1"]])
+    assert book.ready
+    assert book.apply_changes([("100.00", "0"), ("99.75", "4")], [("100.25", "2")])
+    assert book.book.top_bids(5) == [[99.75, 4.0], [99.5, 2.0]]
+    assert book.book.top_asks(5) == [[100.25, 2.0], [100.5, 1.0]]
+
+
+def test_changes_that_cross_the_book_are_reported():
+    book = CoinbaseBook('BTC-USDT')
+    book.apply_snapshot([["100.00", "1"]], [["100.50", "1"]])
+    assert not book.apply_changes([("100.50", "1")], [])
+    book.apply_snapshot([["100.00", "1"]], [["100.50", "1"]])
+    assert book.apply_changes([], [("100.50", "0")])  # One empty side can't be crossed
+
+
+@pytest.fixture
+def adapter(tmp_path):
+    received, resyncs = [], []
+    coinbase = CoinbaseWebSocket(['BTC-USDT'], lambda ws, data: received.append(data), None, None, lambda ws: None,
+                                 credentials_path=str(tmp_path / 'missing.json'),
+                                 on_resync_callback=lambda ws, symbol: resyncs.append(symbol))
+    return coinbase, received, resyncs
+
+
+def test_adapter_forwards_snapshot_and_changes(adapter, socket):
+    coinbase, received, resyncs = adapter
+    assert coinbase.channel == PUBLIC_CHANNEL
+    coinbase.on_message(socket, l2update(("buy", "100.25", "1")))  # Before the snapshot: dropped
+    coinbase.on_message(socket, snapshot())
+    coinbase.on_message(socket, l2update(("buy", "100.25", "1"), ("sell", "100.50", "0")))
+    assert [message['snapshot'] for message in received] == [True, False]
+    assert received[1]['bids'] == [("100.25", "1")] and received[1]['asks'] == [("100.50", "0")]
+    assert received[1]['time'] == 1704164645.25
+    assert resyncs == [] and socket.sent == []
+
+
+def test_crossed_book_resubscribes_and_reports_resync(adapter, socket):
+    coinbase, received, resyncs = adapter
+    coinbase.on_message(socket, snapshot())
+    coinbase.on_message(socket, l2update(("buy", "100.75", "1")))
+    assert resyncs == ['BTC-USDT']
+    assert [(message['type'], message['product_ids']) for message in socket.sent] == [
+        ('unsubscribe', ['BTC-USDT']), ('subscribe', ['BTC-USDT'])]
+    assert len(received) == 1 and not coinbase.books['BTC-USDT'].ready
+    coinbase.on_message(socket, l2update(("buy", "100.25", "1")))  # Still waiting for the new snapshot
+    assert len(received) == 1
@@ -0,0 +1,28 @@
+from sinks.google_sheets import changed_ranges
+
+GRID = [[100.0, 1.0, 101.0, 2.0],
+        [99.5, 3.0, 101.5, 4.0]]
+
+
+def test_unchanged_grid_sends_nothing():
+    assert changed_ranges('Sheet2!B7:E8', GRID, [row[:] for row in GRID]) == []
+
+
+def test_single_cell_change_sends_one_cell():
+    values = [row[:] for row in GRID]
+    values[1][2] = 102.0
+    assert changed_ranges('Sheet2!B7:E8', values, GRID) == [{'range': 'Sheet2!D8', 'values': [[102.0]]}]
+
+
+def test_changes_are_grouped_into_runs_per_row():
+    values = [row[:] for row in GRID]
+    values[0][0], values[0][1], values[0][3] = 100.5, 1.5, 2.5
+    assert changed_ranges('Z7:AC8', values, GRID) == [
+        {'range': 'Z7:AA7', 'values': [[100.5, 1.5]]},
+        {'range': 'AC7', 'values': [[2.5]]},
+    ]
+
+
+def test_first_write_or_resized_grid_sends_whole_range():
+    assert changed_ranges('Sheet2!B7:E8', GRID, None) == [{'range': 'Sheet2!B7:E8', 'values': GRID}]
+    assert changed_ranges('Sheet2!B7:E8', GRID, GRID[:1]) == [{'range': 'Sheet2!B7:E8', 'values': GRID}]
@@ -0,0 +1,55 @@
+import pytest
+
+from instruments import InstrumentRegistry, Listing, split_symbol
+from order_book import DEFAULT_TICK_SIZE
+
+EXCHANGES = {
+    'binance': {'enabled': True, 'pairs': ['btcusdt', 'ethusdt']},
+    'okx': {'enabled': True, 'pairs': ['BTC-USDT']},
+    'kraken': {'enabled': False, 'pairs': ['XBT/USDT']},
+}
+
+
+@pytest.mark.parametrize('native', ['btcusdt', 'BTCUSDT', 'BTC-USDT', 'XBT/USDT', 'btc_usdt'])
+def test_venue_spellings_split_to_one_pair(native):
+    assert split_symbol(native) == ('BTC', 'USDT')
+
+
+def test_longest_quote_asset_wins_and_unknown_quotes_are_rejected():
+    assert split_symbol('ETHFDUSD') == ('ETH', 'FDUSD')
+    assert split_symbol('ETHBTC') == ('ETH', 'BTC')
+    with pytest.raises(ValueError):
+        split_symbol('BTCXYZ')
+
+
+def test_every_venue_symbol_maps_to_one_instrument():
+    registry = InstrumentRegistry.from_config(EXCHANGES)
+    listings = [registry.listing('binance', 'btcusdt'), registry.listing('okx', 'BTC-USDT'),
+                registry.listing('kraken', 'XBT/USDT')]
+    assert len({listing.id for listing in listings}) == 3
+    instrument = listings[0].instrument
+    assert all(listing.instrument is instrument for listing in listings)
+    assert instrument.name == 'btcusdt' and registry.books[instrument.id] is instrument
+    assert [listing.name for listing in listings] == ['binance_btcusdt', 'okx_btcusdt', 'kraken_btcusdt']
+    # Wire spellings differ in case from config's
+    assert registry.symbols('binance')['BTCUSDT'] is listings[0]
+    assert registry.listing('binance', 'ethusdt').instrument is not instrument
+
+
+def test_book_ids_follow_config_order_and_are_unique():
+    registry = InstrumentRegistry.from_config(EXCHANGES)
+    assert list(registry.books) == list(range(len(registry.books)))
+    assert [listing.name for listing in registry.listings()] == [
+        'binance_btcusdt', 'binance_ethusdt', 'okx_btcusdt', 'kraken_btcusdt']
+    assert InstrumentRegistry.from_config(EXCHANGES).listing('okx', 'BTC-USDT').id == \
+        registry.listing('okx', 'BTC-USDT').id
+    assert registry.add('okx', 'BTC-USDT') is registry.listing('okx', 'BTC-USDT')
+    assert all(isinstance(listing, Listing) for listing in registry.listings('okx'))
+
+
+def test_tick_size_defaults_to_1e8_unless_configured():
+    registry = InstrumentRegistry.from_config(EXCHANGES, {'btcusdt': {'tick_size': 0.01, 'lot_size': 1e-5}})
+    btc = registry.listing('okx', 'BTC-USDT').instrument
+    eth = registry.listing('binance', 'ethusdt').instrument
+    assert (btc.tick_size, btc.lot_size) == (0.01, 1e-5)
+    assert eth.tick_size == DEFAULT_TICK_SIZE == 1e-8 and eth.lot_size is None
@@ -0,0 +1,51 @@
+import json
+import zlib
+
+from exchanges.kraken import KrakenBook, KrakenWebSocket
+
+ASKS = [["0.05005", "0.00000500", "1582905487.684110"],
+        ["0.05010", "0.00001000", "1582905486.187983"],
+        ["0.05015", "1.50000000", "1582905484.480241"]]
+BIDS = [["0.05000", "0.00000500", "1582905487.439814"],
+        ["0.04995", "0.00002500", "1582905485.119396"],
+        ["0.04990", "12.00000000", "1582905486.432052"]]
+
+
+def expected_checksum(text):
+    return zlib.crc32(text.encode())
+
+
+def test_checksum_follows_documented_format():
+    # Asks from best, then bids from best; each price and volume without its decimal point or leading zeros
+    book = KrakenBook(depth=10)
+    book.apply_snapshot(BIDS, ASKS)
+    assert book.checksum() == expected_checksum(
+        "5005" "500" "5010" "1000" "5015" "150000000"
+        "5000" "500" "4995" "2500" "4990" "1200000000")
+
+
+def test_checksum_covers_only_top_ten_levels():
+    asks = [[f"0.{5005 + 5 * i:05d}", "0.00000500", "0"] for i in range(12)]
+    book = KrakenBook(depth=25)
+    book.apply_snapshot([], asks)
+    assert book.checksum() == expected_checksum(''.join(f"{5005 + 5 * i}500" for i in range(10)))
+
+
+def test_update_removes_level_and_truncates_to_depth():
+    book = KrakenBook(depth=3)
+    book.apply_snapshot(BIDS, ASKS)
+    assert book.apply_update([["0.05001", "0.00000100", "0"]], [["0.05010", "0.00000000", "0"]])
+    assert [price for price, _ in book.top('bids', 10)] == [0.05001, 0.05, 0.04995]
+    assert [price for price, _ in book.top('asks', 10)] == [0.05005, 0.05015]
+
+
+def test_checksum_mismatch_resubscribes_and_reports_resync(socket):
+    received, resyncs = [], []
+    adapter = KrakenWebSocket(['XBT/USDT'], lambda ws, data: received.append(data), None, None, None,
+                              on_resync_callback=lambda ws, symbol: resyncs.append(symbol))
+    adapter.on_message(socket, json.dumps([1, {"as": ASKS, "bs": BIDS}, "book-10", "XBT/USDT"]))
+    adapter.on_message(socket, json.dumps([1, {"a": [["0.05005", "0.00000600", "1"]], "c": "1"}, "book-10", "XBT/USDT"]))
+    assert len(received) == 1
+    assert resyncs == ['XBT/USDT']
+    assert [message['event'] for message in socket.sent] == ['unsubscribe', 'subscribe']
+    assert not adapter.order_book['XBT/USDT'].ready
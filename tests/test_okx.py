@@ -0,0 +1,78 @@
+import json
+import zlib
+
+from decoders import decode_okx
+from exchanges.okx import OKXBook, OKXWebSocket, signed_crc32
+
+BIDS = [["3366.1", "7", "0", "3"], ["3366", "6", "3", "4"]]
+ASKS = [["3366.8", "9", "10", "3"], ["3368", "8", "3", "4"]]
+
+
+def push(action, bids, asks, seq_id, prev_seq_id=-1, checksum=None, inst_id='BTC-USDT'):
+    entry = {"bids": bids, "asks": asks, "ts": "1", "seqId": seq_id, "prevSeqId": prev_seq_id}
+    if checksum is not None:
+        entry["checksum"] = checksum
+    return json.dumps({"arg": {"channel": "books", "instId": inst_id}, "action": action, "data": [entry]})
+
+
+def data(message):
+    return decode_okx(message).data[0]
+
+
+def test_checksum_follows_documented_example():
+    # The example from OKX's docs: bid and ask levels interleaved, with their original strings
+    book = OKXBook('BTC-USDT')
+    assert book.apply('snapshot', data(push('snapshot', BIDS, ASKS, 10)))
+    assert book.checksum() == signed_crc32("3366.1:7:3366.8:9:3366:6:3368:8")
+
+
+def test_checksum_continues_with_the_longer_side():
+    book = OKXBook('BTC-USDT')
+    book.apply('snapshot', data(push('snapshot', BIDS, ASKS[:1], 10)))
+    assert book.checksum() == signed_crc32("3366.1:7:3366.8:9:3366:6")
+
+
+def test_signed_crc32_wraps_past_the_31st_bit():
+    for text in map(str, range(10)):
+        value = zlib.crc32(text.encode())
+        assert signed_crc32(text) == (value - 2 ** 32 if value >= 2 ** 31 else value)
+
+
+def test_updates_chain_prev_seq_id():
+    book = OKXBook('BTC-USDT')
+    book.apply('snapshot', data(push('snapshot', BIDS, ASKS, 10)))
+    assert book.apply('update', data(push('update', [["3366.1", "0", "0", "0"]], [], 11, 10)))
+    assert book.top('bids', 5) == [[3366.0, 6.0]]
+    assert not book.apply('update', data(push('update', [], [["3368", "1", "0", "1"]], 13, 12)))
+
+
+def test_checksum_mismatch_fails_update():
+    book = OKXBook('BTC-USDT')
+    book.apply('snapshot', data(push('snapshot', BIDS, ASKS, 10)))
+    assert not book.apply('update', data(push('update', [["3366.1", "8", "0", "3"]], [], 11, 10, checksum=123)))
+
+
+def adapter(received, resyncs):
+    return OKXWebSocket(['BTC-USDT'], lambda ws, data: received.append(data), None, None, None,
+                        on_resync_callback=lambda ws, symbol: resyncs.append(symbol))
+
+
+def test_updates_before_snapshot_are_dropped_without_resubscribing(socket):
+    received, resyncs = [], []
+    okx = adapter(received, resyncs)
+    okx.on_message(socket, push('update', BIDS, ASKS, 11, 10))
+    assert received == [] and resyncs == [] and socket.sent == []
+    okx.on_message(socket, push('snapshot', BIDS, ASKS, 12))
+    okx.on_message(socket, push('update', [], [["3368", "1", "0", "1"]], 13, 12))
+    assert len(received) == 2 and okx.books['BTC-USDT'].seq_id == 13
+
+
+def test_gap_on_ready_book_resubscribes_once(socket):
+    received, resyncs = [], []
+    okx = adapter(received, resyncs)
+    okx.on_message(socket, push('snapshot', BIDS, ASKS, 10))
+    okx.on_message(socket, push('update', [], [["3368", "1", "0", "1"]], 13, 12))
+    okx.on_message(socket, push('update', [], [["3368", "2", "0", "1"]], 14, 13))
+    assert resyncs == ['BTC-USDT'] and okx.resyncs == 1
+    assert [message['op'] for message in socket.sent] == ['unsubscribe', 'subscribe']
+    assert len(received) == 1
@@ -0,0 +1,68 @@
+from order_book import ASKS, BIDS, ConsolidatedBook, OrderBook
+
+
+def levels(book, side, n=10):
+    return [(price, level.quantity, dict(level.quantities)) for price, level in book.top_levels(side, n)]
+
+
+def test_same_price_from_several_venues_is_merged():
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', [[100.0, 1.0]], [[101.0, 2.0]])
+    book.apply_venue('okx', [["100.00", "0.5"]], [["101.5", "1"]])
+    assert levels(book, BIDS) == [(100.0, 1.5, {'binance': 1.0, 'okx': 0.5})]
+    assert levels(book, ASKS) == [(101.0, 2.0, {'binance': 2.0}), (101.5, 1.0, {'okx': 1.0})]
+
+
+def test_removing_a_venues_last_quantity_keeps_the_others():
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', [[100.0, 1.0]], [])
+    book.apply_venue('okx', [[100.0, 0.5]], [])
+    book.apply_venue('binance', [[100.0, 0]], [])
+    assert levels(book, BIDS) == [(100.0, 0.5, {'okx': 0.5})]
+    book.apply_venue('okx', [[100.0, 0]], [])
+    assert levels(book, BIDS) == []
+    assert len(book.bids) == 0
+
+
+def test_replace_venue_drops_stale_levels_of_that_venue_only():
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', [[100.0, 1.0], [99.0, 2.0]], [[101.0, 1.0]])
+    book.apply_venue('okx', [[99.0, 3.0]], [])
+    book.replace_venue('binance', [[100.0, 4.0]], [[102.0, 1.0]])
+    assert levels(book, BIDS) == [(100.0, 4.0, {'binance': 4.0}), (99.0, 3.0, {'okx': 3.0})]
+    assert levels(book, ASKS) == [(102.0, 1.0, {'binance': 1.0})]
+    assert book.venue('binance').top_bids(10) == [[100.0, 4.0]]
+
+
+def test_clear_venue_withdraws_its_layer():
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', [[100.0, 1.0]], [[101.0, 1.0]])
+    book.apply_venue('okx', [[100.0, 2.0]], [])
+    book.clear_venue('binance')
+    assert levels(book, BIDS) == [(100.0, 2.0, {'okx': 2.0})]
+    assert levels(book, ASKS) == []
+
+
+def test_bids_best_first_despite_negated_keys():
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', [[99.0, 1.0], [100.0, 1.0], [98.5, 1.0]], [[102.0, 1.0], [101.0, 1.0]])
+    assert [price for price, _ in book.top_levels(BIDS, 10)] == [100.0, 99.0, 98.5]
+    assert [price for price, _ in book.top_levels(ASKS, 10)] == [101.0, 102.0]
+    assert [price for price, _ in book.top_levels(BIDS, 2)] == [100.0, 99.0]
+    venue = book.venue('binance')
+    assert venue.best_bid() == [100.0, 1.0] and venue.best_ask() == [101.0, 1.0]
+
+
+def test_prices_round_to_the_tick():
+    book = ConsolidatedBook(0.01)
+    # Float noise and differently formatted strings for the same price land on one level
+    book.apply_venue('binance', [[0.1 + 0.2, 1.0]], [])
+    book.apply_venue('okx', [["0.30", "1"]], [])
+    book.apply_venue('kraken', [["0.304", "1"]], [])
+    assert levels(book, BIDS) == [(0.3, 3.0, {'binance': 1.0, 'okx': 1.0, 'kraken': 1.0})]
+
+
+def test_default_tick_keeps_eight_decimals():
+    book = OrderBook()
+    book.replace([["0.00012345", "1"], ["0.00012346", "2"]], [])
+    assert book.top_bids(10) == [[0.00012346, 2.0], [0.00012345, 1.0]]
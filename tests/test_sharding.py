@@ -0,0 +1,47 @@
+import pytest
+
+from sharding import assign, describe
+
+EXCHANGES = {
+    'binance': {'enabled': True, 'pairs': ['btcusdt', 'ethusdt', 'solusdt']},
+    'okx': {'enabled': True, 'pairs': ['BTC-USDT', 'ETH-USDT'], 'channels': {}},
+    'kraken': {'enabled': False, 'pairs': ['XBT/USDT']},
+}
+
+
+def pairs(shards):
+    return [{name: settings['pairs'] for name, settings in shard.items() if settings['enabled']} for shard in shards]
+
+
+def test_pairs_are_dealt_round_robin_across_exchanges_in_config_order():
+    assert pairs(assign(EXCHANGES, 2)) == [
+        {'binance': ['btcusdt', 'solusdt'], 'okx': ['ETH-USDT']},
+        {'binance': ['ethusdt'], 'okx': ['BTC-USDT']},
+    ]
+
+
+def test_pinned_pairs_go_to_their_worker_and_the_rest_are_dealt_around_them():
+    shards = assign(EXCHANGES, 2, {'binance': {'btcusdt': 1}, 'okx': {'BTC-USDT': 1}})
+    assert pairs(shards) == [
+        {'binance': ['ethusdt'], 'okx': ['ETH-USDT']},
+        {'binance': ['btcusdt', 'solusdt'], 'okx': ['BTC-USDT']},
+    ]
+
+
+def test_pin_to_a_missing_worker_is_rejected():
+    with pytest.raises(ValueError, match='worker 2'):
+        assign(EXCHANGES, 2, {'okx': {'ETH-USDT': 2}})
+
+
+def test_exchanges_without_pairs_in_a_shard_are_disabled():
+    shards = assign(EXCHANGES, 6)
+    assert [shard['binance']['enabled'] for shard in shards] == [True, True, True, False, False, False]
+    assert [shard['okx']['enabled'] for shard in shards] == [False, False, False, True, True, False]
+    assert not any(shard['kraken']['enabled'] for shard in shards)
+    assert pairs(shards)[5] == {} and describe(shards[5]) == ''  # run() starts no worker for it
+    assert shards[3]['okx']['channels'] == {}  # Other settings are carried over
+
+
+def test_config_is_left_untouched():
+    assign(EXCHANGES, 2)
+    assert EXCHANGES['binance']['pairs'] == ['btcusdt', 'ethusdt', 'solusdt']
@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+
+import pytest
+
+from order_book import ConsolidatedBook, OrderBook
+from sinks.shared_memory import SEQ, SharedBookReader, SharedMemorySink
+
+
+def open_reader(sink):
+    reader = SharedBookReader(sink.name)
+    if sys.version_info < (3, 13):
+        # The reader took the region off this process's resource tracker, but here the writer is this process
+        resource_tracker.register(sink.memory._name, 'shared_memory')
+    return reader
+
+
+@pytest.fixture
+def sink():
+    sink = SharedMemorySink(f'mdf_test_{os.getpid()}', ['binance', 'okx'], depth=3)
+    sink.register(0, 'btcusdt', aggregated=True)
+    sink.register(1, 'binance_ethusdt', exchange='binance')
+    sink.start()
+    yield sink
+    sink.stop()
+
+
+def test_slot_reads_back_what_was_written(sink):
+    book = ConsolidatedBook(0.01)
+    book.apply_venue('binance', [[100.0, 1.0], [99.0, 2.0]], [[101.0, 1.0]])
+    book.apply_venue('okx', [[100.0, 0.5]], [])
+    sink.update_aggregated_book(0, book)
+    venue_book = OrderBook(0.01)
+    venue_book.replace([[2000.0, 3.0]], [[2001.0, 4.0]])
+    sink.update_book(1, venue_book, 'binance')
+
+    reader = open_reader(sink)
+    try:
+        assert reader.keys() == ['btcusdt', 'binance_ethusdt'] and reader.venues == ['binance', 'okx']
+        snapshot = reader.read('btcusdt')
+        assert snapshot.seq == 2 and snapshot.ts_ns > 0
+        assert snapshot.bids == [(100.0, 1.5, 0b11), (99.0, 2.0, 0b01)]
+        assert snapshot.asks == [(101.0, 1.0, 0b01)]
+        assert reader.contributors(snapshot.bids[0][2]) == ['binance', 'okx']
+        assert reader.read('binance_ethusdt')[2:] == ([(2000.0, 3.0, 1)], [(2001.0, 4.0, 1)])
+        assert reader.is_live()
+    finally:
+        reader.close()
+
+
+def test_unwritten_and_restored_books_read_as_none(sink):
+    book = OrderBook(0.01)
+    book.replace([[100.0, 1.0]], [])
+    book.provisional = True
+    sink.update_book(1, book, 'binance')
+    reader = open_reader(sink)
+    try:
+        assert reader.read('btcusdt') is None
+        assert reader.read('binance_ethusdt') is None
+    finally:
+        reader.close()
+
+
+def test_read_retries_while_the_writer_is_inside_the_slot(sink):
+    book = OrderBook(0.01)
+    book.replace([[100.0, 1.0]], [])
+    sink.update_book(1, book, 'binance')
+    reader = open_reader(sink)
+    # As if the writer had stopped halfway through its next update
+    SEQ.pack_into(sink.buffer, sink.offsets[1], 3)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(reader.read('binance_ethusdt')))
+    thread.start()
+    try:
+        time.sleep(0.05)
+        assert thread.is_alive() and not result
+        book.replace([[100.0, 5.0]], [])
+        sink.update_book(1, book, 'binance')  # Completes with the next even sequence number
+        thread.join(1)
+        assert result[0].seq == 4 and result[0].bids == [(100.0, 5.0, 1)]
+    finally:
+        SEQ.pack_into(sink.buffer, sink.offsets[1], 4)
+        thread.join()
+        reader.close()
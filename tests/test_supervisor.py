@@ -0,0 +1,93 @@
+import time
+
+import metrics
+import supervisor
+from supervisor import LIVE, PING, STALE, Backoff, Feed, Supervisor
+
+
+def test_backoff_doubles_up_to_the_maximum_with_jitter():
+    backoff = Backoff(initial=0.5, maximum=4.0)
+    caps = [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+    for cap in caps:
+        delay = backoff.next()
+        assert cap / 2 <= delay <= cap
+
+
+def test_backoff_jitter_bounds(monkeypatch):
+    monkeypatch.setattr(supervisor.random, 'uniform', lambda low, high: low)
+    backoff = Backoff(1.0, 8.0)
+    assert [backoff.next() for _ in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+    monkeypatch.setattr(supervisor.random, 'uniform', lambda low, high: high)
+    assert backoff.next() == 8.0
+
+
+def test_backoff_reset_starts_over():
+    backoff = Backoff(initial=1.0, maximum=60.0)
+    for _ in range(5):
+        backoff.next()
+    backoff.reset()
+    assert backoff.failures == 0 and backoff.next() <= 1.0
+
+
+SETTINGS = {'stale_after': {'test-feed': 0.2}, 'backoff_initial': 0.0, 'backoff_max': 1.0, 'check_interval': 0.01}
+
+
+def test_feed_asks_for_a_ping_then_goes_stale():
+    feed = Feed('test-feed', SETTINGS)
+    feed.connected()
+    assert feed.check() is None  # Connected, no frame yet
+    feed.connected_at -= 1.0
+    metrics.last_frame['test-feed'] = time.perf_counter()
+    assert feed.check() == LIVE
+    metrics.last_frame['test-feed'] = time.perf_counter() - 0.15
+    assert feed.check() == PING
+    assert feed.check() == LIVE  # Only one ping per quiet spell
+    metrics.last_frame['test-feed'] = time.perf_counter() - 0.3
+    assert feed.check() == STALE
+
+
+def test_frames_on_a_live_feed_reset_its_backoff():
+    feed = Feed('test-feed', dict(SETTINGS, backoff_initial=1.0))
+    feed.backoff.next()
+    feed.connected()
+    metrics.last_frame['test-feed'] = time.perf_counter()
+    assert feed.check() == LIVE and feed.backoff.failures == 0
+
+
+class FakeConnection:
+    """An adapter whose connection thread never ends by itself."""
+
+    def __init__(self):
+        self.starts = 0
+        self.closes = 0
+        self.thread = self
+        self.ws = None
+
+    def is_alive(self):
+        return True
+
+    def start(self):
+        self.starts += 1
+
+    def close(self):
+        self.closes += 1
+
+
+def test_stale_feed_is_reconnected():
+    connection = FakeConnection()
+    down = []
+    watchdog = Supervisor({'test-feed': connection}, SETTINGS, on_down=down.append)
+    watchdog.connect('test-feed')
+    watchdog.feeds['test-feed'].connected_at -= 1.0
+    metrics.last_frame['test-feed'] = time.perf_counter()
+    watchdog.check()
+    assert (connection.starts, connection.closes) == (1, 0)
+
+    metrics.last_frame['test-feed'] = time.perf_counter() - 1.0
+    watchdog.check()
+    assert connection.closes == 1 and down == ['test-feed']
+    assert metrics.RECONNECTS.labels('test-feed', 'stale').value == 1
+    watchdog.check()  # backoff_initial is 0, so the next check reconnects
+    assert connection.starts == 2
+    watchdog.check()  # The new connection gets stale_after to send its first frame
+    assert connection.closes == 1
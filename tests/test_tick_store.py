@@ -0,0 +1,57 @@
+import math
+import os
+
+from sinks.tick_store import HEADER, BookFileWriter, book_file_path, read_book_file, record_struct
+
+TS = 1_700_000_000_000_000_000  # 2023-11-14 UTC
+
+
+def test_records_round_trip_through_the_reader(tmp_path):
+    writer = BookFileWriter(str(tmp_path), 'btcusdt', 2)
+    writer.append(TS, [[100.0, 1.0], [99.5, 2.0]], [[100.5, 3.0]])
+    writer.append(TS + 1, [["100.25", "0.5"]], [])
+    writer.close()
+
+    records = read_book_file(book_file_path(str(tmp_path), 'btcusdt', TS))
+    assert list(records['ts']) == [TS, TS + 1]
+    assert records['bid_price'][0].tolist() == [100.0, 99.5]
+    assert records['bid_qty'][0].tolist() == [1.0, 2.0]
+    assert records['ask_price'][0][0] == 100.5 and math.isnan(records['ask_price'][0][1])
+    assert records['bid_price'][1][0] == 100.25 and math.isnan(records['ask_qty'][1][0])
+
+
+def test_resume_drops_a_partial_trailing_record(tmp_path):
+    path = book_file_path(str(tmp_path), 'btcusdt', TS)
+    writer = BookFileWriter(str(tmp_path), 'btcusdt', 2)
+    writer.append(TS, [[100.0, 1.0]], [[101.0, 1.0]])
+    writer.close()
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * 10)  # A record cut short by a crash
+
+    writer = BookFileWriter(str(tmp_path), 'btcusdt', 2)
+    writer.append(TS + 1, [[100.0, 2.0]], [[101.0, 1.0]])
+    writer.close()
+    assert os.path.getsize(path) == HEADER.size + 2 * record_struct(2).size
+    assert list(read_book_file(path)['ts']) == [TS, TS + 1]
+
+
+def test_depth_change_continues_in_a_numbered_file(tmp_path):
+    path = book_file_path(str(tmp_path), 'btcusdt', TS)
+    for depth in (2, 3, 2):
+        writer = BookFileWriter(str(tmp_path), 'btcusdt', depth)
+        writer.append(TS + depth, [[100.0, 1.0]], [[101.0, 1.0]])
+        writer.close()
+
+    stem, extension = os.path.splitext(path)
+    assert list(read_book_file(path)['ts']) == [TS + 2, TS + 2]
+    numbered = read_book_file(f'{stem}-1{extension}')
+    assert list(numbered['ts']) == [TS + 3] and numbered['bid_price'].shape == (1, 3)
+    assert not os.path.exists(f'{stem}-2{extension}')
+
+
+def test_a_new_utc_day_starts_a_new_file(tmp_path):
+    writer = BookFileWriter(str(tmp_path), 'btcusdt', 1)
+    writer.append(TS, [[100.0, 1.0]], [])
+    writer.append(TS + 86_400 * 10 ** 9, [[100.0, 1.0]], [])
+    writer.close()
+    assert sorted(os.listdir(tmp_path / 'btcusdt')) == ['2023-11-14.book', '2023-11-15.book']